@@ -0,0 +1,106 @@
+"""Offline analysis of many positions at once.
+
+python analysis.py positions.fen --depth 4 --workers 8
+
+Positions are FEN strings (or Games, sent as their FEN) searched by
+search.Search in a process pool that stays up between calls, so workers
+only import the engine once. Results stream back in the order they
+finish, each tagged with the index of its position.
+"""
+import argparse
+import atexit
+import json
+import multiprocessing
+import time
+
+import chess_server
+import search
+
+
+def analyse_position(task):
+    index, fen, depth, time_limit, nodes = task
+    game = chess_server.Game.from_fen(fen)
+    result = search.Search(game).run(depth, time_limit, nodes)
+    return {"index": index, "fen": fen, **result.as_dict()}
+
+
+def _tasks(positions, depth, time_limit, nodes):
+    for index, position in enumerate(positions):
+        fen = position if isinstance(position, str) else position.fen()
+        yield index, fen, depth, time_limit, nodes
+
+
+class Analyser:
+    def __init__(self, workers=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(self.workers)
+
+    def analyse_many(self, positions, depth=None, time_limit=None,
+                     nodes=None, chunksize=None):
+        """Yield one result dict per position as soon as it is done."""
+        if chunksize is None:
+            # long searches balance better one at a time, short ones
+            # need batching to amortise the round trip to the worker
+            chunksize = 1 if time_limit or (depth or 0) >= 4 else 8
+        tasks = _tasks(positions, depth, time_limit, nodes)
+        yield from self.pool.imap_unordered(analyse_position, tasks,
+                                            chunksize)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_analyser = None
+
+
+def get_analyser(workers=None):
+    global _analyser
+    if _analyser is None or (workers and workers != _analyser.workers):
+        if _analyser is not None:
+            _analyser.close()
+        _analyser = Analyser(workers)
+        atexit.register(_analyser.close)
+    return _analyser
+
+
+def analyse_many(positions, depth=None, time_limit=None, nodes=None,
+                 workers=None, chunksize=None):
+    return get_analyser(workers).analyse_many(positions, depth, time_limit,
+                                              nodes, chunksize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="analyse FEN positions")
+    parser.add_argument("positions", help="file with one FEN per line")
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--time", type=float, default=None,
+                        help="seconds per position")
+    parser.add_argument("--nodes", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=None)
+    args = parser.parse_args()
+
+    with open(args.positions) as f:
+        positions = [line.strip() for line in f if line.strip()]
+    start = time.perf_counter()
+    nodes = 0
+    with Analyser(args.workers) as analyser:
+        for result in analyser.analyse_many(positions, args.depth, args.time,
+                                            args.nodes, args.chunksize):
+            nodes += result["nodes"]
+            print(json.dumps(result))
+    elapsed = time.perf_counter() - start
+    print(f"{len(positions)} positions in {elapsed:.2f}s, "
+          f"{len(positions) / elapsed:.1f} positions/s, "
+          f"{nodes / elapsed:.0f} nodes/s")
+
+
+if __name__ == "__main__":
+    main()
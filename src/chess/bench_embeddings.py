@@ -0,0 +1,81 @@
+"""Compare the embedding backends in inference.py on the rules corpus.
+
+python bench_embeddings.py --backends torch int8 onnx --threads 1 2 4
+
+For every backend and thread count this reports single query latency,
+batched throughput and how closely the embeddings agree with fp32 torch.
+"""
+import argparse
+import math
+import statistics
+import time
+
+import inference
+
+
+def load_corpus(path, limit):
+    with open(path, encoding="utf-8") as f:
+        lines = [" ".join(line.split()) for line in f]
+    return [line for line in lines if line][:limit]
+
+
+def cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    return dot / (math.sqrt(sum(x * x for x in a)) *
+                  math.sqrt(sum(y * y for y in b)))
+
+
+def bench(backend, texts, batch_size, queries):
+    backend.embed(texts[:batch_size])  # warm up
+    latencies = []
+    for text in texts[:queries]:
+        start = time.perf_counter()
+        backend.embed([text])
+        latencies.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    embeddings = []
+    for i in range(0, len(texts), batch_size):
+        embeddings.extend(backend.embed(texts[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return embeddings, {
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "texts_per_s": len(texts) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default="data/chroma.db/info.txt")
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8"],
+                        choices=sorted(inference.BACKENDS))
+    parser.add_argument("--threads", nargs="+", type=int, default=[1])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.limit)
+    baseline = None
+    print(f"{len(texts)} texts, batch size {args.batch_size}")
+    print(f"{'backend':8} {'threads':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'texts/s':>9} {'min cos':>8} {'mean cos':>8}")
+    for threads in args.threads:
+        for name in args.backends:
+            backend = inference.load_backend(name, threads=threads)
+            embeddings, stats = bench(backend, texts, args.batch_size,
+                                      args.queries)
+            if baseline is None:
+                # fp32 torch is the reference every other backend is held to
+                baseline = embeddings if name == "torch" else \
+                    inference.load_backend("torch", threads=threads).embed(texts)
+            agreement = [cosine(a, b) for a, b in zip(embeddings, baseline)]
+            print(f"{name:8} {threads:>7} {stats['p50_ms']:>8.2f} "
+                  f"{stats['p95_ms']:>8.2f} {stats['texts_per_s']:>9.1f} "
+                  f"{min(agreement):>8.4f} "
+                  f"{statistics.fmean(agreement):>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
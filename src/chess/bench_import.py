@@ -0,0 +1,74 @@
+"""Import time of the engine modules, as a regression guard.
+
+python bench_import.py chess_server search --runs 5 --budget-ms 30
+
+Each module is imported in a fresh interpreter under ``python -X
+importtime``. The best cumulative time over the runs is reported along
+with the slowest dependencies. The exit status is 1 if a module goes
+over the budget or pulls in one of HEAVY, which only the tools that
+need them should load.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY = ["loguru", "pysnooper", "multiprocessing", "pygame", "numpy",
+         "chromadb", "torch", "transformers"]
+
+
+def import_times(module=None):
+    """{imported module: cumulative microseconds} for one cold import,
+    or for interpreter startup alone without a module."""
+    env = dict(os.environ, PYTHONPATH=HERE)
+    code = f"import {module}" if module else "pass"
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def heavy_imports(times):
+    return sorted(name for name in times if name.split(".")[0] in HEAVY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="measure import time")
+    parser.add_argument("modules", nargs="*",
+                        default=["chess_server", "search"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=30.0)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    # modules every interpreter loads at startup aren't the module's fault
+    startup = set(import_times())
+    failed = False
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(args.runs)]
+        best = min(runs, key=lambda times: times[module])
+        total = best[module] / 1000
+        heavy = heavy_imports(best)
+        ok = total <= args.budget_ms and not heavy
+        failed |= not ok
+        print(f"{module}: {total:.1f}ms (budget {args.budget_ms:.0f}ms)"
+              f"{'' if ok else '  FAIL'}")
+        if heavy:
+            print(f"  heavy imports: {', '.join(heavy)}")
+        slowest = sorted((ms, name) for name, ms in best.items()
+                         if name != module and name not in startup)
+        slowest = slowest[-args.top:]
+        for ms, name in reversed(slowest):
+            print(f"  {ms / 1000:7.1f}ms  {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Nodes and time to a fixed depth with each search feature on or off.
+
+python bench_search.py --depth 4
+
+Every configuration searches the same positions from scratch: none of
+the selective features, each feature alone, all but one of them, and all
+of them. Move agreement is counted against the full-width search.
+"""
+import argparse
+import time
+
+import chess_server
+import search
+
+POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+]
+
+
+def configurations():
+    yield "none", frozenset()
+    for feature in sorted(search.FEATURES):
+        yield f"only {feature}", frozenset([feature])
+    for feature in sorted(search.FEATURES):
+        yield f"all but {feature}", search.FEATURES - {feature}
+    yield "all", search.FEATURES
+
+
+def run(features, depth, positions=POSITIONS):
+    nodes = 0
+    moves = []
+    start = time.perf_counter()
+    for fen in positions:
+        result = search.search(chess_server.Game.from_fen(fen), depth=depth,
+                               features=features)
+        nodes += result.nodes
+        moves.append(result.move)
+    return nodes, time.perf_counter() - start, moves
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark search pruning")
+    parser.add_argument("--depth", type=int, default=4)
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'features':<28}{'nodes':>10}{'time':>9}{'nodes/s':>10}"
+          f"{'same move':>11}")
+    for name, features in configurations():
+        nodes, elapsed, moves = run(features, args.depth)
+        baseline = baseline or moves
+        same = sum(a == b for a, b in zip(moves, baseline))
+        print(f"{name:<28}{nodes:>10}{elapsed:>8.2f}s"
+              f"{nodes / elapsed:>10.0f}{same:>8}/{len(moves)}")
+
+
+if __name__ == "__main__":
+    main()
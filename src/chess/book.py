@@ -0,0 +1,168 @@
+"""Opening book built from PGN games.
+
+python book.py build games.pgn [more.pgn ...] -o book.bin --plies 20
+python book.py probe book.bin "<fen>"
+
+The book file is a header followed by 16 byte entries sorted by
+position hash:
+
+  uint64  Zobrist hash of the position (zobrist.position_hash)
+  uint16  move, packed as in records.encode_move
+  uint16  weight
+  uint32  reserved
+
+It is memory-mapped and searched with a binary search, so a lookup
+touches a handful of pages and never loads the whole book.
+"""
+import argparse
+import collections
+import mmap
+import random
+import struct
+
+import pgn
+import records
+import zobrist
+
+ENTRY = struct.Struct("<QHHI")
+HEADER = struct.Struct("<8sII")
+MAGIC = b"CHESSBK\x00"
+VERSION = 1
+# result points for the side that played the move
+RESULT_WEIGHTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1),
+                  "*": (1, 1)}
+
+
+def build(pgn_paths, out_path, max_plies=20, min_weight=1):
+    """Collect (position, move) weights from games and write a book.
+
+    A move gains 2 when its side went on to win, 1 for a draw or an
+    unfinished game and nothing for a loss.
+    """
+    weights = collections.Counter()
+    games = 0
+    for path in pgn_paths:
+        for record in pgn.read_games(path):
+            white, black = RESULT_WEIGHTS.get(record.result, (1, 1))
+            game = record.start()
+            try:
+                for san in record.moves[:max_plies]:
+                    move, promotion = pgn.parse_san(game, san)
+                    weight = white if game.turn == "white" else black
+                    if weight:
+                        key = zobrist.position_hash(game)
+                        weights[key, records.encode_move(move, promotion)] \
+                            += weight
+                    game.make_move(*move, promotion)
+            except pgn.PGNError:
+                pass  # keep the moves up to the bad one
+            games += 1
+    entries = sorted((key, move, min(weight, 0xFFFF))
+                     for (key, move), weight in weights.items()
+                     if weight >= min_weight)
+    with open(out_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for key, move, weight in entries:
+            f.write(ENTRY.pack(key, move, weight, 0))
+    return games, len(entries)
+
+
+class OpeningBook:
+    def __init__(self, path, rng=None):
+        self.path = path
+        self.rng = rng or random.Random()
+        self._open()
+
+    def _open(self):
+        self.file = open(self.path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a version {VERSION} book")
+
+    # mmaps can't be pickled; bots travel to worker processes, so the book
+    # goes as its path and is mapped again on the other side
+    def __getstate__(self):
+        return {"path": self.path, "rng": self.rng}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def _key_at(self, index):
+        return struct.unpack_from("<Q", self.map,
+                                  HEADER.size + index * ENTRY.size)[0]
+
+    def entries(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.count and self._key_at(low) == key:
+            _, move, weight, _ = ENTRY.unpack_from(
+                self.map, HEADER.size + low * ENTRY.size)
+            found.append((move, weight))
+            low += 1
+        return found
+
+    def lookup(self, game):
+        """Book moves for the position as ((from, to), promotion, weight)."""
+        moves = []
+        for value, weight in self.entries(zobrist.position_hash(game)):
+            (start, end), promotion = records.decode_move(value)
+            piece = game.board.get(start)
+            # a hash collision must never produce an illegal move
+            if piece is not None and piece.color == game.turn and \
+                    end in game.piece_moves(start) and \
+                    game.is_legal(start, end):
+                moves.append(((start, end), promotion, weight))
+        return moves
+
+    def choose(self, game):
+        moves = self.lookup(game)
+        if not moves:
+            return None
+        total = sum(weight for _, _, weight in moves)
+        pick = self.rng.uniform(0, total)
+        for move, _, weight in moves:
+            pick -= weight
+            if pick <= 0:
+                return move
+        return moves[-1][0]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build or probe a book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build")
+    build_parser.add_argument("pgn", nargs="+")
+    build_parser.add_argument("-o", "--output", default="book.bin")
+    build_parser.add_argument("--plies", type=int, default=20)
+    build_parser.add_argument("--min-weight", type=int, default=1)
+    probe_parser = commands.add_parser("probe")
+    probe_parser.add_argument("book")
+    probe_parser.add_argument("fen", nargs="?", default=pgn.STANDARD_FEN)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        games, entries = build(args.pgn, args.output, args.plies,
+                               args.min_weight)
+        print(f"{games} games, {entries} book entries -> {args.output}")
+    else:
+        import chess_server
+        game = chess_server.Game.from_fen(args.fen)
+        book = OpeningBook(args.book)
+        for move, promotion, weight in book.lookup(game):
+            print(pgn.move_to_san(game, move, promotion), weight)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""asyncio front end that hosts many games against the bot.
+
+python bot_server.py --port 8765 --workers 4
+
+The protocol is one JSON object per line in each direction:
+
+  {"op": "new", "color": "white"}              -> {"game_id": ..., "board": ...}
+  {"op": "move", "game_id": ..., "from": "e2", "to": "e4"}
+                                               -> {"bot_move": ["e7", "e5"], ...}
+  {"op": "board", "game_id": ...}              -> {"board": ..., "turn": ...,
+                                                   "status": "ongoing"}
+  {"op": "close", "game_id": ...}              -> {"closed": true}
+
+Errors come back as {"error": "..."}. Bot moves are searched in an
+executor so the event loop keeps serving other games meanwhile, and games
+nobody has touched for ``idle_timeout`` seconds are dropped. Pondering
+bots search in a thread of this process instead, since their background
+search has to outlive the call; that search is stopped once the player
+has been quiet for ``ponder_timeout`` seconds.
+
+With --store every game is snapshotted after each move (see snapshot.py).
+Each request checks the stored version and reloads the game only if
+another server saved a newer one, so any server sharing the store can
+serve any game and evicted games come back when next used. A move made
+on a copy that another server has since moved past is rejected.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import time
+import uuid
+
+import chess_server
+
+
+def choose_bot_move(game):
+    # runs in the executor; the game is a copy when that is a process pool
+    return game.bot.choose_move(game)
+
+
+class Session:
+    def __init__(self, game, player_color, game_id=None, version=None):
+        self.game = game
+        self.game_id = game_id
+        # version of the stored snapshot this game continues, see save()
+        self.version = version
+        self.player_color = player_color
+        self.lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+
+class BotServer:
+    def __init__(self, executor=None, idle_timeout=600.0, sweep_interval=30.0,
+                 store=None, ponder_timeout=30.0, **bot_options):
+        self.executor = executor
+        # snapshot.FileStore or SqliteStore, or None to keep games in memory
+        self.store = store
+        # passed on to chess_server.Bot, e.g. depth, time_limit, ponder
+        self.bot_options = bot_options
+        self.idle_timeout = idle_timeout
+        # ponder threads share the GIL with the event loop, so a player
+        # who walked away shouldn't keep one busy until eviction
+        self.ponder_timeout = ponder_timeout
+        self.sweep_interval = sweep_interval
+        self.sessions = {}
+        self._ids = itertools.count(1)
+
+    def board_state(self, game):
+        return {chess_server.square_name(square):
+                chess_server.display_name(piece)
+                for square, piece in game.board.items()}
+
+    def state(self, session):
+        return {"board": self.board_state(session.game),
+                "turn": session.game.turn,
+                "status": session.game.game_status()}
+
+    async def new_game(self, color="white"):
+        if color not in ("white", "black"):
+            raise ValueError(f"unknown color {color!r}")
+        # ids have to be unique across every server sharing the store
+        game_id = uuid.uuid4().hex if self.store else str(next(self._ids))
+        game = chess_server.Game.build_headless(
+            bot_color=chess_server.opponent(color), **self.bot_options)
+        session = Session(game, color, game_id)
+        self.sessions[game_id] = session
+        reply = {"game_id": game_id}
+        if color == "black":
+            reply["bot_move"] = await self.bot_turn(session)
+        self.save(session)
+        reply.update(self.state(session))
+        return reply
+
+    def save(self, session):
+        """Store the game unless another server saved a newer version
+        first. Then the local copy is dropped and the move rejected."""
+        if self.store is None:
+            return
+        import snapshot
+        try:
+            self.store.save(session.game_id, session.game, session.version)
+        except snapshot.ConflictError:
+            session.game.bot.stop_pondering()
+            self.sessions.pop(session.game_id, None)
+            raise
+        session.version = snapshot.version(session.game)
+
+    async def bot_turn(self, session):
+        if session.game.game_status() != "ongoing":
+            return None
+        loop = asyncio.get_running_loop()
+        bot = session.game.bot
+        executor = None if bot.ponder else self.executor
+        move = await loop.run_in_executor(executor, choose_bot_move,
+                                          session.game)
+        if move is None:
+            return None
+        if not session.game.move_piece(*move):
+            raise ValueError(
+                f"bot chose illegal move {chess_server.move_name(move)}")
+        bot.start_pondering(session.game)
+        return [chess_server.square_name(square) for square in move]
+
+    async def move(self, session, from_name, to_name):
+        async with session.lock:
+            game = session.game
+            if game.turn != session.player_color:
+                raise ValueError("it is not your turn")
+            from_square = chess_server.parse_square(from_name)
+            to_square = chess_server.parse_square(to_name)
+            piece = game.board.get(from_square)
+            if piece is None or piece.color != session.player_color or \
+                    not game.move_piece(from_square, to_square):
+                raise ValueError(f"illegal move {from_name}{to_name}")
+            reply = {"bot_move": await self.bot_turn(session)}
+            self.save(session)
+            reply.update(self.state(session))
+            return reply
+
+    def get_session(self, game_id):
+        session = self.sessions.get(game_id)
+        if self.store is not None and game_id and \
+                not (session and session.lock.locked()):
+            # reload only if another server saved since, so a game that
+            # stays here keeps its bot and its pondering
+            version = self.store.version(game_id)
+            if session is not None and version != session.version:
+                session.game.bot.stop_pondering()
+                del self.sessions[game_id]
+                session = None
+            if session is None and version is not None:
+                session = self.load(game_id)
+        if session is None:
+            raise KeyError(f"no game {game_id!r}")
+        session.touch()
+        return session
+
+    def load(self, game_id):
+        import snapshot
+        game = self.store.load(game_id)
+        if game is None:
+            return None
+        session = Session(game, chess_server.opponent(game.bot.color),
+                          game_id, snapshot.version(game))
+        self.sessions[game_id] = session
+        return session
+
+    async def dispatch(self, request):
+        op = request.get("op")
+        if op == "new":
+            return await self.new_game(request.get("color", "white"))
+        session = self.get_session(request.get("game_id"))
+        if op == "move":
+            return await self.move(session, request["from"], request["to"])
+        if op == "board":
+            return self.state(session)
+        if op == "close":
+            self.sessions.pop(request["game_id"]).game.bot.stop_pondering()
+            if self.store is not None:
+                self.store.delete(request["game_id"])
+            return {"closed": True}
+        raise ValueError(f"unknown op {op!r}")
+
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    reply = await self.dispatch(json.loads(line))
+                except (KeyError, ValueError) as e:
+                    reply = {"error": str(e).strip("'\"")}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def evict_idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        idle = [game_id for game_id, session in self.sessions.items()
+                if now - session.last_seen > self.idle_timeout
+                and not session.lock.locked()]
+        for game_id in idle:
+            self.sessions.pop(game_id).game.bot.stop_pondering()
+        for session in self.sessions.values():
+            if now - session.last_seen > self.ponder_timeout:
+                session.game.bot.stop_pondering()
+        return idle
+
+    async def sweep(self):
+        while True:
+            await asyncio.sleep(min(self.sweep_interval, self.ponder_timeout))
+            self.evict_idle()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        sweeper = asyncio.create_task(self.sweep())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve bot games over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--executor", choices=["process", "thread"],
+                        default="process",
+                        help="process pools sidestep the GIL for searches")
+    parser.add_argument("--idle-timeout", type=float, default=600.0)
+    parser.add_argument("--depth", type=int, default=None,
+                        help="search depth, greedy captures if unset")
+    parser.add_argument("--time", type=float, default=None,
+                        help="search seconds per move")
+    parser.add_argument("--ponder", action="store_true",
+                        help="search on the player's time")
+    parser.add_argument("--store", default=None,
+                        help="snapshot directory, or a .db file for SQLite")
+    args = parser.parse_args()
+
+    store = None
+    if args.store:
+        import snapshot
+        store = snapshot.open_store(args.store)
+
+    pool = concurrent.futures.ProcessPoolExecutor \
+        if args.executor == "process" \
+        else concurrent.futures.ThreadPoolExecutor
+    with pool(max_workers=args.workers) as executor:
+        server = BotServer(executor, idle_timeout=args.idle_timeout,
+                           store=store, depth=args.depth, time_limit=args.time,
+                           ponder=args.ponder)
+        asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
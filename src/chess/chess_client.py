@@ -1 +1,44 @@
-import chess_server
+"""Minimal client for bot_server.py.
+
+python chess_client.py e2 e4
+"""
+import asyncio
+import json
+import sys
+
+
+class BotClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8765):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def request(self, **request):
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def new_game(self, color="white"):
+        return await self.request(op="new", color=color)
+
+    async def move(self, game_id, from_name, to_name):
+        return await self.request(op="move", game_id=game_id,
+                                  **{"from": from_name, "to": to_name})
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def main(from_name, to_name):
+    client = await BotClient.connect()
+    game = await client.new_game()
+    print(await client.move(game["game_id"], from_name, to_name))
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*sys.argv[1:3]))
@@ -3,15 +3,38 @@ and make sure to rename your program chess to chess_p before running this"""
 # import pygame
 # import chess
 # import chess.svg
-import pprint
-from loguru import logger
-import pysnooper
-
-print = pprint.pprint
 import functools
+import os
 import time
-import multiprocessing
 import random
+import collections
+import copy
+
+import zobrist
+
+# loguru, pysnooper and multiprocessing are imported where they are used,
+# so importing the engine (every worker process does) stays cheap
+TRACE = os.environ.get("CHESS_TRACE")
+
+
+class _Logger:
+    """loguru's logger, imported on first use."""
+
+    def __getattr__(self, name):
+        from loguru import logger
+        return getattr(logger, name)
+
+
+logger = _Logger()
+
+
+def traced(func):
+    """pysnooper.snoop() func when CHESS_TRACE is set, "1" traces to
+    stderr and anything else names a file for the trace."""
+    if not TRACE:
+        return func
+    import pysnooper
+    return pysnooper.snoop(None if TRACE == "1" else TRACE)(func)
 
 
 
@@ -129,91 +152,45 @@ class King(Piece):
                         (nx, ny)).color != self.color:
                     moves.append((nx, ny))
 
-        if not self.has_moved:
+        if not self.has_moved and y == 4:
             if self._can_castle_kingside(position, board):
                 moves.append((x, y + 2))
-                print(f"Adding kingside castling move {(x, y + 2)}")
             if self._can_castle_queenside(position, board):
                 moves.append((x, y - 2))
-                print(f"Adding queenside castling move {(x, y - 2)}")
 
-        print(f"King at {position} legal moves: {moves}")
         return moves
 
     def _can_castle_kingside(self, position, board):
         x, y = position
         rook = board.get((x, 7))
-        print(
-            f"Checking kingside castling for King at {position}, Rook at {(x, 7)}: {rook}")
         if isinstance(rook, Rook) and not rook.has_moved:
             if all(board.get((x, col)) is None for col in range(y + 1, 7)):
                 if self._is_path_safe_for_castling((x, y), (x, 7), board):
-                    print(
-                        f"Kingside castling is possible for King at {position}")
                     return True
         return False
 
     def _can_castle_queenside(self, position, board):
         x, y = position
         rook = board.get((x, 0))
-        print(
-            f"Checking queenside castling for King at {position}, Rook at {(x, 0)}: {rook}")
         if isinstance(rook, Rook) and not rook.has_moved:
             if all(board.get((x, col)) is None for col in range(1, y)):
                 if self._is_path_safe_for_castling((x, y), (x, 0), board):
-                    print(
-                        
-                        f"Queenside castling is possible for King at {position}")
                     return True
         return False
 
     def _is_path_safe_for_castling(self, from_position, to_position, board):
+        # the king may not castle out of, through or into check; the b-file
+        # square on the queenside only has to be empty
         x, y = from_position
         step = 1 if y < to_position[1] else -1
 
-        for col in range(y + step, to_position[1], step):
+        for col in (y, y + step, y + 2 * step):
             if self._is_square_attacked((x, col), board):
-                print(
-                    f"Square {(x, col)} is under attack, castling not possible")
                 return False
         return True
 
     def _is_square_attacked(self, position, board):
-        for piece_position, piece in board.items():
-            if piece.color != self.color:
-                if position in piece.get_legal_moves(piece_position, board):
-                    print(
-                        f"Square {position} is attacked by {piece} at {piece_position}")
-                    return True
-        return False
-
-
-    def get_legal_moves(self, position, board):#FIXME:
-        moves = []
-        x, y = position
-        if not self.has_moved:
-            if self.color == "black":
-                # Kingside castling (assuming right side rook is at (x, 7)) + add private functions!!!!
-                #"_unknown1() == True" check if it can return true
-                if self.check_if_in_the_right_position_kingside() and self._check_if_under_attack():
-                    rook = board.get((x, 7))
-                    if rook and isinstance(rook, Rook) and not rook.has_moved:
-                        moves.append((x, y + 2))
-                        print(f"Adding kingside castling move {(x, y + 2)}")
-
-                # Queenside castling (assuming left side rook is at (x, 0))
-                if all(board.get((x, col)) is None for col in range(1, y)) and \
-                    not any(self._is_square_attacked((x, col), board) for col in range(y - 2, y + 1)):
-                    rook = board.get((x, 0))
-                    if rook and isinstance(rook, Rook) and not rook.has_moved:
-                        moves.append((x, y - 2))
-                        print(f"Adding queenside castling move {(x, y - 2)}")
-            elif self.color == "white":
-                    pass
-
-        return moves
-
-
+        return is_square_attacked(board, position, opponent(self.color))
 
 
 class Queen(Piece):
@@ -271,23 +248,6 @@ class Queen(Piece):
                 else:
                     break
 
-                    #horizontal and vertical moves
-
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-
-        for dx, dy in directions:
-            nx, ny = x + dx, y + dy
-            while 0 <= nx < 8 and 0 <= ny < 8:
-                if board.get((nx, ny)) is None:
-                    moves.append((nx, ny))
-                elif board((nx, ny)).color != self.color:
-                    moves.append((nx, ny))
-                    break
-                else:
-                    break
-                nx += dx
-                ny += dy
-
         return moves
 
 
@@ -330,7 +290,7 @@ class Knight(Piece):
             nx, ny = x + dx, y + dy
             if 0 <= nx < 8 and 0 <= ny < 8:
                 if board.get((nx, ny), None) is None or board[
-                    (nx, ny)].color != 'white':
+                    (nx, ny)].color != self.color:
                     moves.append((nx, ny))
         return moves
 
@@ -451,6 +411,70 @@ class Player:
         pass
 
 
+def opponent(color):
+    return "black" if color == "white" else "white"
+
+
+def square_name(square):
+    row, col = square
+    return "abcdefgh"[col] + str(row + 1)
+
+
+def parse_square(name):
+    if not isinstance(name, str) or len(name) != 2 or name[0] not in "abcdefgh" or name[1] not in "12345678":
+        raise ValueError(f"bad square {name!r}")
+    return int(name[1]) - 1, "abcdefgh".index(name[0])
+
+
+def move_name(move, promotion=None):
+    # long algebraic, e.g. e2e4 or e7e8q
+    name = square_name(move[0]) + square_name(move[1])
+    if promotion:
+        name += "n" if promotion == "knight" else promotion[0]
+    return name
+
+
+KNIGHT_STEPS = [(-2, -1), (-1, -2), (1, -2), (2, -1), (2, 1), (1, 2), (-1, 2),
+                (-2, 1)]
+KING_STEPS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0),
+              (1, 1)]
+STRAIGHT = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+DIAGONAL = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def is_square_attacked(board, square, color):
+    """True if a piece of ``color`` attacks ``square``.
+
+    Walks outwards from the square instead of generating every enemy
+    move, and never looks at castling, so kings can't recurse into
+    each other.
+    """
+    x, y = square
+    pawn_row = x - 1 if color == "white" else x + 1
+    for dy in (-1, 1):
+        piece = board.get((pawn_row, y + dy))
+        if isinstance(piece, Pawn) and piece.color == color:
+            return True
+    for steps, kind in ((KNIGHT_STEPS, Knight), (KING_STEPS, King)):
+        for dx, dy in steps:
+            piece = board.get((x + dx, y + dy))
+            if isinstance(piece, kind) and piece.color == color:
+                return True
+    for directions, kinds in ((STRAIGHT, (Rook, Queen)),
+                              (DIAGONAL, (Bishop, Queen))):
+        for dx, dy in directions:
+            nx, ny = x + dx, y + dy
+            while 0 <= nx < 8 and 0 <= ny < 8:
+                piece = board.get((nx, ny))
+                if piece is not None:
+                    if isinstance(piece, kinds) and piece.color == color:
+                        return True
+                    break
+                nx += dx
+                ny += dy
+    return False
+
+
 def get_piece_value(piece):
     values = {'Pawn': 1, 'Knight': 3, 'Bishop': 3, 'Rook': 5, 'Queen': 9,
               'King': 1000}
@@ -458,10 +482,38 @@ def get_piece_value(piece):
 
 
 class Bot(Player):
-    def __init__(self, color):
+    def __init__(self, color, parallel=True, book=None, tablebase=None,
+                 depth=None, time_limit=None, ponder=False, evaluator=None,
+                 nodes=None, features=None):
         self.color = color
+        # one process per piece only pays off for expensive move generation,
+        # servers and search call this from their own workers and turn it off
+        self.parallel = parallel
+        # book.OpeningBook, consulted before any move generation
+        self.book = book
+        # tablebase.Tablebase, plays perfectly once few enough pieces are left
+        self.tablebase = tablebase
+        # any of these turns on search.Search instead of greedy captures
+        self.depth = depth
+        self.time_limit = time_limit
+        self.nodes = nodes
+        # search.FEATURES names to search with, all of them if None
+        self.features = features
+        # keep searching the expected reply while the opponent thinks
+        self.ponder = ponder
+        self.ponderer = None
+        # search evaluator, e.g. nnue.Evaluator; material and centre if None
+        self.evaluator = evaluator
+        self.last_search = None
 
     def get_possible_bot_moves(self, board):
+        if not self.parallel:
+            return [(position, move)
+                    for position, piece in list(board.items())
+                    if piece is not None and piece.color == self.color
+                    for move in piece.get_legal_moves(position, board)]
+
+        import multiprocessing
         manager = multiprocessing.Manager()
         possible_moves = manager.list()
 
@@ -470,7 +522,6 @@ class Bot(Player):
             for col in range(8):
                 piece = board.get((row, col))
                 if piece is not None and piece.color == self.color:
-                    print(f"Processing piece {piece} at {(row, col)}")
                     process = multiprocessing.Process(
                         target=self.get_legal_moves_worker,
                         args=((row, col), board, possible_moves))
@@ -480,15 +531,12 @@ class Bot(Player):
         for process in processes:
             process.join()
 
-        print(f"Possible bot moves: {list(possible_moves)}")
         return list(possible_moves)
 
     def get_legal_moves_worker(self, position, board, possible_moves):
         piece = board[position]
         if piece is not None:
             legal_moves = piece.get_legal_moves(position, board)
-            print(
-                f"Legal moves for piece {piece} at {position}: {legal_moves}")
             for move in legal_moves:
                 possible_moves.append((position, move))
 
@@ -503,68 +551,134 @@ class Bot(Player):
                 target_value = get_piece_value(target_piece)
                 if target_value > highest_capture_value:
                     highest_capture_value = target_value
-                    best_move = move[1]
-                    print(f"currently the best move is {best_move}")
+                    best_move = move
 
         if not best_move:
             best_move = random.choice(moves)
-        print(f"selected move {best_move} from game")
 
         return best_move
 
-    @pysnooper.snoop()
+    def choose_move(self, game):
+        self.last_search = None
+        if self.book is not None:
+            book_move = self.book.choose(game)
+            if book_move is not None:
+                return book_move
+        if self.tablebase is not None and self.tablebase.covers(game.board):
+            table_move = self.tablebase.best_move(game)
+            if table_move is not None:
+                return table_move
+        if self.depth or self.time_limit or self.nodes:
+            return self.search_move(game)
+        if game.turn != self.color:
+            return None
+        possible_moves = game.legal_moves()
+        if not possible_moves:
+            return None
+        return self.select_move(possible_moves, game)
+
+    def search_move(self, game):
+        import search
+        result = None
+        if self.ponderer is not None:
+            result = self.ponderer.resolve(game, self.time_limit)
+        if result is None:
+            features = search.FEATURES if self.features is None \
+                else self.features
+            result = search.search(game, self.depth, self.time_limit,
+                                   self.nodes, features,
+                                   self.evaluator or search.evaluate)
+        self.last_search = result
+        return result.move
+
+    def start_pondering(self, game):
+        """Ponder the reply the last search expects; call it once the
+        bot's move is on the board."""
+        pv = self.last_search.pv if self.last_search else []
+        if not self.ponder or len(pv) < 2 or not game.move_stack or \
+                game.move_stack[-1][:2] != pv[0]:
+            return False
+        import search
+        if self.ponderer is None:
+            self.ponderer = search.Ponderer()
+        features = search.FEATURES if self.features is None \
+            else self.features
+        return self.ponderer.start(game, self.last_search.pv[1],
+                                   self.depth, self.time_limit,
+                                   self.evaluator or search.evaluate,
+                                   self.nodes, features)
+
+    def stop_pondering(self):
+        if self.ponderer is not None:
+            self.ponderer.stop()
+
+    @traced
     def make_move(self, game, move):
         start_pos, end_pos = move
-        start_piece = game.board[start_pos]
-        game.board[start_pos] = None
-        game.board[end_pos] = start_piece
-        game.move_piece(start_pos, end_pos)
+        return game.move_piece(start_pos, end_pos)
 
     def play_turn(self, game):
-        possible_moves = self.get_possible_bot_moves(game.board)
-        selected_move = self.select_move(possible_moves, game)
-        self.make_move(game, selected_move)
+        """Choose and play a move; None once the game is over. Raises
+        ValueError rather than leave the turn with the bot if the move
+        turns out to be illegal."""
+        if game.game_status() != "ongoing":
+            return None
+        selected_move = self.choose_move(game)
+        if selected_move is not None:
+            if not self.make_move(game, selected_move):
+                raise ValueError(
+                    f"bot chose illegal move {move_name(selected_move)}")
+            self.start_pondering(game)
+        return selected_move
+
+
+PIECE_LETTERS = {'Pawn': 'p', 'Knight': 'N', 'Bishop': 'B', 'Rook': 'R',
+                 'Queen': 'Q', 'King': 'K'}
+BACK_RANK = [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
+
+
+FEN_PIECES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen,
+              'k': King}
+PROMOTION_PIECES = {'knight': Knight, 'bishop': Bishop, 'rook': Rook,
+                    'queen': Queen}
+
+
+def display_name(piece):
+    return piece.color[0] + PIECE_LETTERS[type(piece).__name__]
+
+
+def starting_board():
+    """Standard start position, 0-indexed: row 0 is rank 1, col 0 file a."""
+    board = {}
+    for col, kind in enumerate(BACK_RANK):
+        board[(0, col)] = kind("white")
+        board[(1, col)] = Pawn("white")
+        board[(6, col)] = Pawn("black")
+        board[(7, col)] = kind("black")
+    return board
 
 
 class Game:
     @classmethod
-    def build_game(cls):
-        square_size = 60
-        width, height = square_size * 8, square_size * 8
-        screen = pygame.display.set_mode((width, height))
-        colors = [(233, 236, 239), (125, 135, 150)]
-        for r in range(8):
-            for c in range(8):
-                color = colors[((r + c) % 2)]
-                pygame.draw.rect(screen, color,
-                                 pygame.Rect(c * square_size, r * square_size,
-                                             square_size, square_size))
-        bot = Bot("black")
-        player = Player()
-        board = {}
-        for row, color in enumerate(("white", "black")):
-            if row == 0:
-                row = 1
-            else:
-                row = 8
-            board = {**board, **{
-                (row, 1): Rook(color),
-                (row, 2): Knight(color),
-                (row, 3): Bishop(color),
-                (row, 4): Queen(color),
-                (row, 5): King(color),
-                (row, 6): Bishop(color),
-                (row, 7): Knight(color),
-                (row, 8): Rook(color),
-
-            }}
-        for column in range(1, 9):
-            board[(2, column)] = Pawn("white")
-            board[(7, column)] = Pawn("black")
-        return cls(board, square_size, screen, bot)
+    def build_game(cls, square_size=60, player_color="white", **bot_options):
+        """A game on the standard board drawn in a pygame window."""
+        import renderer
+        game = cls.build_headless(opponent(player_color), **bot_options)
+        game.square_size = square_size
+        game.renderer = renderer.BoardRenderer(
+            game, square_size, flipped=player_color == "black")
+        game.screen = game.renderer.screen
+        return game
+
+    @classmethod
+    def build_headless(cls, bot_color="black", **bot_options):
+        """A game on the standard board with no pygame screen."""
+        return cls(starting_board(), 60, None,
+                   Bot(bot_color, parallel=False, **bot_options))
 
     def convert_object_to_display(self, piece):
-        return self.display_pieces[piece]
+        # promoted pieces are created mid-game and aren't in the table
+        return self.display_pieces.get(piece) or display_name(piece)
 
     def __init__(self, board, square_size, screen, bot):
         self.square_size = square_size
@@ -572,48 +686,270 @@ class Game:
         self.bot = bot
         self.board = board
         self.turn = "white"
-        self.display_pieces = {
-            self.board[(8, 1)]: 'bR',
-            self.board[(8, 2)]: 'bN',
-            self.board[(8, 3)]: 'bB',
-            self.board[(8, 4)]: 'bQ',
-            self.board[(8, 5)]: 'bK',
-            self.board[(8, 6)]: 'bB',
-            self.board[(8, 7)]: 'bN',
-            self.board[(8, 8)]: 'bR',
-            self.board[(7, 1)]: 'bp',
-            self.board[(7, 2)]: 'bp',
-            self.board[(7, 3)]: 'bp',
-            self.board[(7, 4)]: 'bp',
-            self.board[(7, 5)]: 'bp',
-            self.board[(7, 6)]: 'bp',
-            self.board[(7, 7)]: 'bp',
-            self.board[(7, 8)]: 'bp',
-            self.board[(1, 1)]: 'bR',
-            self.board[(1, 2)]: 'bN',
-            self.board[(1, 3)]: 'bB',
-            self.board[(1, 4)]: 'bQ',
-            self.board[(1, 5)]: 'bK',
-            self.board[(1, 6)]: 'bB',
-            self.board[(1, 7)]: 'bN',
-            self.board[(1, 8)]: 'bR',
-            self.board[(2, 1)]: 'bp',
-            self.board[(2, 2)]: 'bp',
-            self.board[(2, 3)]: 'bp',
-            self.board[(2, 4)]: 'bp',
-            self.board[(2, 5)]: 'bp',
-            self.board[(2, 6)]: 'bp',
-            self.board[(2, 7)]: 'bp',
-            self.board[(2, 8)]: 'bp',
-        }
-
-    def move_piece(self, from_square, to_square):
+        # square a pawn just skipped with its double step, None otherwise
+        self.en_passant = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        # undo records for make_move / unmake_move
+        self.move_stack = []
+        # (move, promotion) pairs played before move_stack starts, which
+        # snapshot.restore fills in
+        self.earlier_moves = []
+        # Zobrist hash of every position so far and how often each occurred,
+        # filled in lazily so callers can finish setting the position up
+        self.hash_history = []
+        self.repetitions = collections.Counter()
+        self.display_pieces = {piece: display_name(piece)
+                               for piece in self.board.values()}
+
+    def copy(self):
+        """An independent copy of the position and its hash history, for
+        searching on another thread; move_stack starts empty."""
+        game = Game({square: copy.copy(piece)
+                     for square, piece in self.board.items()},
+                    self.square_size, None, self.bot)
+        game.turn = self.turn
+        game.en_passant = self.en_passant
+        game.halfmove_clock = self.halfmove_clock
+        game.fullmove_number = self.fullmove_number
+        game.zobrist_hash()
+        self.zobrist_hash()
+        game.hash_history = list(self.hash_history)
+        game.repetitions = collections.Counter(self.repetitions)
+        return game
+
+    def castling_rights(self):
+        """FEN style castling rights, e.g. "KQkq", "" when none are left."""
+        rights = ""
+        for row, color in ((0, "white"), (7, "black")):
+            king = self.board.get((row, 4))
+            if not isinstance(king, King) or king.color != color \
+                    or king.has_moved:
+                continue
+            for col, letter in ((7, "K"), (0, "Q")):
+                rook = self.board.get((row, col))
+                if isinstance(rook, Rook) and rook.color == color \
+                        and not rook.has_moved:
+                    rights += letter if color == "white" else letter.lower()
+        return rights
+
+    @classmethod
+    def from_fen(cls, fen, bot_color="black"):
+        fields = fen.split()
+        placement, turn = fields[0], fields[1]
+        castling = fields[2] if len(fields) > 2 else "-"
+        ep = fields[3] if len(fields) > 3 else "-"
+        board = {}
+        for rank, row_text in enumerate(placement.split("/")):
+            col = 0
+            for char in row_text:
+                if char.isdigit():
+                    col += int(char)
+                    continue
+                color = "white" if char.isupper() else "black"
+                kind = FEN_PIECES[char.lower()]
+                piece = kind(color)
+                if hasattr(piece, "has_moved"):
+                    piece.has_moved = True
+                board[(7 - rank, col)] = piece
+                col += 1
+        for letter in castling.replace("-", ""):
+            row = 0 if letter.isupper() else 7
+            board[(row, 4)].has_moved = False
+            board[(row, 7 if letter in "Kk" else 0)].has_moved = False
+        game = cls(board, 60, None, Bot(bot_color, parallel=False))
+        game.turn = "white" if turn == "w" else "black"
+        game.en_passant = None if ep == "-" else parse_square(ep)
+        if len(fields) > 5:
+            game.halfmove_clock = int(fields[4])
+            game.fullmove_number = int(fields[5])
+        game.reset_history()
+        return game
+
+    def fen(self):
+        rows = []
+        for row in range(7, -1, -1):
+            text, empty = "", 0
+            for col in range(8):
+                piece = self.board.get((row, col))
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                letter = display_name(piece)[1].upper()
+                text += letter if piece.color == "white" else letter.lower()
+            rows.append(text + (str(empty) if empty else ""))
+        ep = square_name(self.en_passant) if self.en_passant else "-"
+        return " ".join(["/".join(rows), self.turn[0],
+                         self.castling_rights() or "-", ep,
+                         str(self.halfmove_clock), str(self.fullmove_number)])
+
+    def reset_history(self):
+        """Restart the hash history at the current position, after the
+        board, turn or en passant square were changed by hand."""
+        key = zobrist.position_hash(self)
+        self.hash_history = [key]
+        self.repetitions = collections.Counter([key])
+        return key
+
+    def zobrist_hash(self):
+        if not self.hash_history:
+            return self.reset_history()
+        return self.hash_history[-1]
+
+    def king_square(self, color):
+        for square, piece in self.board.items():
+            if isinstance(piece, King) and piece.color == color:
+                return square
+        return None
+
+    def in_check(self, color=None):
+        color = color or self.turn
+        king = self.king_square(color)
+        return king is not None and \
+            is_square_attacked(self.board, king, opponent(color))
+
+    def piece_moves(self, square):
+        """Pseudo-legal moves for the piece on square, en passant included."""
+        piece = self.board.get(square)
+        if piece is None:
+            return []
+        moves = piece.get_legal_moves(square, self.board)
+        if isinstance(piece, Pawn) and self.en_passant is not None:
+            direction = 1 if piece.color == "white" else -1
+            ep_row, ep_col = self.en_passant
+            if ep_row == square[0] + direction and abs(ep_col - square[1]) == 1:
+                moves.append(self.en_passant)
+        return moves
+
+    def pseudo_legal_moves(self, color=None):
+        color = color or self.turn
+        return [(square, move)
+                for square, piece in list(self.board.items())
+                if piece.color == color
+                for move in self.piece_moves(square)]
+
+    def legal_moves(self):
+        """(from, to) moves for the side to move that don't leave its king
+        in check. Pawn moves to the last rank promote to a queen unless
+        make_move is told otherwise."""
+        return [move for move in self.pseudo_legal_moves()
+                if self.is_legal(*move)]
+
+    def is_legal(self, from_square, to_square):
+        """True if the pseudo-legal move doesn't leave the mover in check."""
+        color = self.board[from_square].color
+        self.make_move(from_square, to_square)
+        legal = not self.in_check(color)
+        self.unmake_move()
+        return legal
+
+    def make_move(self, from_square, to_square, promotion=None):
+        """Play a move without checking it; unmake_move takes it back."""
+        key = self.zobrist_hash() ^ zobrist.state_key(self)
+        board = self.board
+        piece = board.pop(from_square)
+        captured_square = to_square
+        if isinstance(piece, Pawn) and to_square == self.en_passant:
+            captured_square = (from_square[0], to_square[1])
+        captured = board.pop(captured_square, None)
+        rook_move = None
+        if isinstance(piece, King) and abs(to_square[1] - from_square[1]) == 2:
+            # castling, bring the rook over to the other side
+            row = from_square[0]
+            rook_move = ((row, 7), (row, 5)) if to_square[1] == 6 \
+                else ((row, 0), (row, 3))
+        placed = piece
+        if isinstance(piece, Pawn) and to_square[0] in (0, 7):
+            placed = PROMOTION_PIECES[promotion or "queen"](piece.color)
+        self.move_stack.append((from_square, to_square, piece, placed,
+                                captured, captured_square, rook_move,
+                                getattr(piece, "has_moved", None),
+                                rook_move and board[rook_move[0]].has_moved,
+                                self.en_passant, self.halfmove_clock))
+        board[to_square] = placed
+        key ^= zobrist.piece_key(piece, from_square) ^ \
+            zobrist.piece_key(placed, to_square) ^ zobrist.BLACK_TO_MOVE
+        if captured is not None:
+            key ^= zobrist.piece_key(captured, captured_square)
+        if rook_move:
+            rook = board.pop(rook_move[0])
+            board[rook_move[1]] = rook
+            rook.has_moved = True
+            key ^= zobrist.piece_key(rook, rook_move[0]) ^ \
+                zobrist.piece_key(rook, rook_move[1])
+        if hasattr(piece, "has_moved"):
+            piece.has_moved = True
+        self.en_passant = None
+        if isinstance(piece, Pawn) and \
+                abs(to_square[0] - from_square[0]) == 2:
+            self.en_passant = ((from_square[0] + to_square[0]) // 2,
+                               from_square[1])
+        self.halfmove_clock = 0 if captured is not None or \
+            isinstance(piece, Pawn) else self.halfmove_clock + 1
+        if self.turn == "black":
+            self.fullmove_number += 1
+        self.turn = opponent(self.turn)
+        key ^= zobrist.state_key(self)
+        self.hash_history.append(key)
+        self.repetitions[key] += 1
+        return captured
+
+    def make_null_move(self):
+        """Pass the turn, as null-move pruning needs; unmake_move takes it
+        back like any other move."""
+        key = self.zobrist_hash() ^ zobrist.state_key(self)
+        self.move_stack.append((None,) * 9 + (self.en_passant,
+                                               self.halfmove_clock))
+        self.en_passant = None
+        if self.turn == "black":
+            self.fullmove_number += 1
+        self.turn = opponent(self.turn)
+        key ^= zobrist.BLACK_TO_MOVE ^ zobrist.state_key(self)
+        self.hash_history.append(key)
+        self.repetitions[key] += 1
+
+    def unmake_move(self):
+        (from_square, to_square, piece, placed, captured, captured_square,
+         rook_move, had_moved, rook_had_moved, en_passant,
+         halfmove_clock) = self.move_stack.pop()
+        key = self.hash_history.pop()
+        if self.repetitions[key] > 1:
+            self.repetitions[key] -= 1
+        else:
+            del self.repetitions[key]
+        if from_square is None:
+            # a null move
+            self.en_passant = en_passant
+            self.turn = opponent(self.turn)
+            if self.turn == "black":
+                self.fullmove_number -= 1
+            return
+        board = self.board
+        del board[to_square]
+        board[from_square] = piece
+        if captured is not None:
+            board[captured_square] = captured
+        if rook_move:
+            rook = board.pop(rook_move[1])
+            board[rook_move[0]] = rook
+            rook.has_moved = rook_had_moved
+        if had_moved is not None:
+            piece.has_moved = had_moved
+        self.en_passant = en_passant
+        self.halfmove_clock = halfmove_clock
+        self.turn = opponent(self.turn)
+        if self.turn == "black":
+            self.fullmove_number -= 1
+
+    def move_piece(self, from_square, to_square, promotion=None):
         piece = self.board.get(from_square)
-        if piece is not None:
-            legal_moves = piece.get_legal_moves(from_square, self.board)
-            if to_square in legal_moves:
-                self.board[to_square] = piece
-                del self.board[from_square]
+        if piece is not None and piece.color == self.turn:
+            if to_square in self.piece_moves(from_square) and \
+                    self.is_legal(from_square, to_square):
+                self.make_move(from_square, to_square, promotion)
                 return True
         return False
 
@@ -624,8 +960,44 @@ class Game:
             from_square, to_square = bot_move
             self.move_piece(from_square, to_square)
 
+    def repetition_count(self):
+        """How many times the current position has occurred."""
+        return self.repetitions[self.zobrist_hash()]
+
     def is_checkmate(self):
-        pass
+        return self.in_check() and not self.legal_moves()
+
+    def is_stalemate(self):
+        return not self.in_check() and not self.legal_moves()
+
+    def is_threefold_repetition(self):
+        return self.repetition_count() >= 3
+
+    def is_fifty_moves(self):
+        return self.halfmove_clock >= 100
+
+    def is_insufficient_material(self):
+        # bare kings, or one knight or bishop against a bare king
+        others = [piece for piece in self.board.values()
+                  if not isinstance(piece, King)]
+        return not others or len(others) == 1 and \
+            isinstance(others[0], (Knight, Bishop))
+
+    def game_status(self):
+        """"checkmate", "stalemate", "fifty_moves", "threefold_repetition",
+        "insufficient_material" or "ongoing"."""
+        if not self.legal_moves():
+            return "checkmate" if self.in_check() else "stalemate"
+        if self.is_fifty_moves():
+            return "fifty_moves"
+        if self.is_threefold_repetition():
+            return "threefold_repetition"
+        if self.is_insufficient_material():
+            return "insufficient_material"
+        return "ongoing"
+
+    def is_over(self):
+        return self.game_status() != "ongoing"
 
     def is_occupied(self, square):
         logger.info(square)
@@ -642,24 +1014,14 @@ class Game:
         # is move valid?
 
 
-def play_game():
-    board = Game.build_game()
-
-    bot_turn = False
-    while not board.is_checkmate():
-        # the code in here deals with the screen.
-        # it contains no chess logic
-        # chess logic comes from the Game class
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                exit(0)
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                pass
-                # board.update(from_square, to_square, piece)
-            # etc
-        pygame.display.flip()
-
-    pygame.quit()
+def play_game(player_color="white", fps=30, **bot_options):
+    # all drawing and event handling lives in renderer.py
+    game = Game.build_game(player_color=player_color, **bot_options)
+    game.renderer.fps = fps
+    try:
+        game.renderer.run(player_color)
+    finally:
+        game.renderer.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,27 @@
+"""Streaming access to the rule and commentary corpus.
+
+Lines are read and normalized one at a time so a corpus of any size can
+be labelled, embedded and upserted in bounded chunks.
+"""
+import itertools
+from pathlib import Path
+
+DATA_PATH = Path("data") / "chroma.db" / "info.txt"
+
+
+def normalize_line(line):
+    return " ".join(line.split())
+
+
+def iter_lines(path=DATA_PATH, encoding="utf-8"):
+    with open(path, encoding=encoding) as f:
+        for line in f:
+            line = normalize_line(line)
+            if line:
+                yield line
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
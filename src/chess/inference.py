@@ -0,0 +1,141 @@
+"""CPU inference backends for the sentence embedding model.
+
+torch runs the full precision model, int8 runs it with dynamically
+quantized Linear layers and onnx runs an exported copy of the model
+through onnxruntime (pip install onnxruntime).
+"""
+import os
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_PATH = os.path.join("data", "onnx", "all-MiniLM-L6-v2.onnx")
+
+
+def set_torch_threads(threads):
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # can only be set before torch runs any parallel work
+            pass
+
+
+def mean_pool(last_hidden_state, attention_mask):
+    # works on torch tensors and numpy arrays alike; padding tokens are left
+    # out so a text embeds the same on its own or inside a padded batch
+    mask = attention_mask[..., None]
+    return (last_hidden_state * mask).sum(1) / mask.sum(1).clip(min=1)
+
+
+def load_tokenizer(model_name=MODEL_NAME):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def tokenize(tokenizer, texts):
+    # numpy arrays pickle cheaply, so texts can be tokenized in worker processes
+    return dict(tokenizer(texts, return_tensors="np",
+                          truncation=True, padding=True))
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_name=MODEL_NAME, threads=None):
+        set_torch_threads(threads)
+        self.threads = threads
+        self.tokenizer = load_tokenizer(model_name)
+        self.model = self.load_model(model_name)
+        self.model.eval()
+
+    def load_model(self, model_name):
+        from transformers import AutoModel
+        return AutoModel.from_pretrained(model_name)
+
+    def embed(self, texts):
+        return self.embed_encoded(tokenize(self.tokenizer, texts))
+
+    def embed_encoded(self, encoded):
+        import torch
+        inputs = {name: torch.from_numpy(value.astype("int64"))
+                  for name, value in encoded.items()}
+        with torch.inference_mode():
+            outputs = self.model(**inputs)
+        pooled = mean_pool(outputs.last_hidden_state,
+                           inputs["attention_mask"])
+        return pooled.tolist()
+
+
+class Int8Backend(TorchBackend):
+    name = "int8"
+
+    def load_model(self, model_name):
+        import torch
+        model = super().load_model(model_name)
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model_name=MODEL_NAME, threads=None,
+                 path=ONNX_PATH):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                "the onnx backend needs onnxruntime, "
+                "pip install onnxruntime") from e
+        self.threads = threads
+        self.tokenizer = load_tokenizer(model_name)
+        if not os.path.exists(path):
+            export_onnx(model_name, path, self.tokenizer)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = \
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def embed(self, texts):
+        return self.embed_encoded(tokenize(self.tokenizer, texts))
+
+    def embed_encoded(self, encoded):
+        feed = {name: value.astype("int64") for name, value in encoded.items()
+                if name in self.input_names}
+        last_hidden_state = self.session.run(None, feed)[0]
+        return mean_pool(last_hidden_state, encoded["attention_mask"]).tolist()
+
+
+def export_onnx(model_name, path, tokenizer):
+    import torch
+    from transformers import AutoModel
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    names = list(sample.keys())
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    torch.onnx.export(model, tuple(sample[name] for name in names), path,
+                      input_names=names, output_names=["last_hidden_state"],
+                      dynamic_axes=dynamic, opset_version=17)
+
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "int8": Int8Backend,
+    "onnx": OnnxBackend,
+}
+
+
+def load_backend(name="torch", threads=None, model_name=MODEL_NAME):
+    if name not in BACKENDS:
+        raise ValueError(f"unknown embedding backend {name!r}, "
+                         f"choose from {sorted(BACKENDS)}")
+    return BACKENDS[name](model_name=model_name, threads=threads)
@@ -1,5 +1,7 @@
 import pprint
 
+import corpus
+
 
 
 def get_labels():
@@ -44,24 +46,88 @@ def get_labels():
 
     return labels
 
-def apply_labels(labels):
-    new_documents = []
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+class LabelMatcher:
+    """Aho-Corasick automaton over the label list.
+
+    Finds every label that occurs as a whole word, optionally pluralised
+    with a trailing "s" ("moves" labels move, "checkmate" doesn't label
+    check), in a single pass over the document.
+    """
+
+    def __init__(self, labels):
+        self.labels = [label.lower() for label in labels]
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for index, label in enumerate(self.labels):
+            node = 0
+            for char in label:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].append(index)
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + \
+                    self.output[self.fail[child]]
+
+    def _whole_word(self, document, start, end):
+        if start > 0 and _is_word_char(document[start - 1]):
+            return False
+        if end < len(document) and document[end] == "s":
+            end += 1
+        return end >= len(document) or not _is_word_char(document[end])
 
-    with open("data\chroma.db\info.txt", 'r', encoding='utf-8') as file:
-        document = file.readlines()
-    documents = [move.strip().lower() for move in document if move.strip()]
-    
+    def match(self, document):
+        found = set()
+        node = 0
+        for position, char in enumerate(document):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for index in self.output[node]:
+                if index in found:
+                    continue
+                label = self.labels[index]
+                end = position + 1
+                if self._whole_word(document, end - len(label), end):
+                    found.add(index)
+        return [self.labels[index] for index in sorted(found)]
+
+    def match_many(self, documents):
+        for document in documents:
+            yield self.match(document)
+
+
+def iter_labelled(labels, documents):
+    matcher = labels if isinstance(labels, LabelMatcher) \
+        else LabelMatcher(labels)
     for document in documents:
-        applied_labels = []
-        for label in labels:
-            if label in document:
-                applied_labels.append(label)
-        
-        row = [applied_labels, document]
-        new_documents.append(row)
-
-    return new_documents
-
-new_documents = apply_labels(get_labels())
-#new_documents = [document for document in new_documents if len(document[0]) == 0]
-pprint.pprint(new_documents)
\ No newline at end of file
+        document = document.lower()
+        yield [matcher.match(document), document]
+
+
+def apply_labels(labels, path=corpus.DATA_PATH):
+    return list(iter_labelled(labels, corpus.iter_lines(path)))
+
+
+if __name__ == "__main__":
+    new_documents = apply_labels(get_labels())
+    #new_documents = [document for document in new_documents if len(document[0]) == 0]
+    pprint.pprint(new_documents)
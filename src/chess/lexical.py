@@ -0,0 +1,117 @@
+"""BM25 inverted index over the corpus, the cheap first retrieval stage.
+
+Terms are the words of a document plus one "label:<name>" term per
+keyword label, so a query naming a rule like "en passant" also matches
+documents the labeler tagged with it. search() returns the best
+scoring ids, which vectordb then re-ranks with embeddings.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+
+import keywords
+
+WORD = re.compile(r"[a-z0-9]+")
+LABEL_PREFIX = "label:"
+
+
+def stem(word):
+    # the labeler treats a trailing "s" as a plural, do the same here
+    return word[:-1] if len(word) > 3 and word.endswith("s") and \
+        not word.endswith("ss") else word
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD.findall(text.lower())]
+
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75, labels=None):
+        self.k1 = k1
+        self.b = b
+        self.matcher = keywords.LabelMatcher(
+            labels if labels is not None else keywords.get_labels())
+        self.ids = []
+        self.positions = {}
+        self.terms = []
+        self.lengths = []
+        self.postings = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def document_terms(self, text, labels=None):
+        if labels is None:
+            labels = self.matcher.match(text.lower())
+        terms = Counter(tokenize(text))
+        terms.update(LABEL_PREFIX + label for label in labels)
+        return terms
+
+    def query_terms(self, query):
+        return set(self.document_terms(query))
+
+    def add(self, ids, documents, labels=None):
+        """Index documents, replacing any already stored under the same
+        id; labels defaults to what the label matcher finds."""
+        labels = labels or [None] * len(ids)
+        for id_, document, document_labels in zip(ids, documents, labels):
+            terms = self.document_terms(document, document_labels)
+            position = self.positions.get(id_)
+            if position is None:
+                position = len(self.ids)
+                self.positions[id_] = position
+                self.ids.append(id_)
+                self.terms.append(Counter())
+                self.lengths.append(0)
+            self._unindex(position)
+            self.terms[position] = terms
+            self.lengths[position] = sum(terms.values())
+            self.total_length += self.lengths[position]
+            for term, count in terms.items():
+                self.postings.setdefault(term, {})[position] = count
+
+    def _unindex(self, position):
+        for term in self.terms[position]:
+            posting = self.postings[term]
+            del posting[position]
+            if not posting:
+                del self.postings[term]
+        self.total_length -= self.lengths[position]
+
+    def idf(self, term):
+        frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self) - frequency + 0.5) / (frequency + 0.5))
+
+    def scores(self, query, positions=None):
+        """{position: BM25 score} for every document sharing a term, only
+        among positions if given."""
+        if not self.positions:
+            return {}
+        average = self.total_length / len(self)
+        scores = {}
+        for term in self.query_terms(query):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf(term)
+            if positions is not None:
+                posting = {position: posting[position]
+                           for position in positions if position in posting}
+            for position, count in posting.items():
+                norm = self.k1 * (1 - self.b + self.b *
+                                  self.lengths[position] / average)
+                scores[position] = scores.get(position, 0.0) + \
+                    idf * count * (self.k1 + 1) / (count + norm)
+        return scores
+
+    def search(self, query, k=50, ids=None):
+        """Up to k (id, score) pairs, best first, only among ids if given."""
+        positions = None
+        if ids is not None:
+            positions = {self.positions[id_] for id_ in ids
+                         if id_ in self.positions}
+        best = heapq.nlargest(k, self.scores(query, positions).items(),
+                              key=lambda item: item[1])
+        return [(self.ids[position], score) for position, score in best]
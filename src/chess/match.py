@@ -0,0 +1,290 @@
+"""Play two Bot configurations against each other.
+
+python match.py --a depth=3 --b depth=3 --b features=null_move+lmr \\
+    --games 400 --workers 4 --sprt 0 10
+
+An engine is a list of key=value settings: depth, time (seconds per
+move), nodes, features (names joined by "+", or "all" / "none") and
+nnue (a weights file). Each opening is a few random plies from the
+start position, or a book move sequence with --book. Every opening is
+played twice with colours swapped, and the games run in a process pool.
+After each game the harness prints the Elo difference of A over B with a
+95% interval and the SPRT log-likelihood ratio. It stops once the ratio
+crosses a bound. At the end it reports nodes per second and move latency
+percentiles for both engines.
+"""
+import argparse
+import math
+import multiprocessing
+import random
+import time
+
+import chess_server
+import search
+
+STANDARD_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def parse_engine(settings):
+    """{"depth": 3, ...} from ["depth=3", "features=lmr+futility"]."""
+    spec = {}
+    for setting in settings or []:
+        name, _, value = setting.partition("=")
+        if name == "depth" or name == "nodes":
+            spec[name] = int(value)
+        elif name == "time":
+            spec["time_limit"] = float(value)
+        elif name == "features":
+            spec["features"] = sorted(
+                search.FEATURES if value == "all" else
+                [] if value == "none" else value.split("+"))
+            unknown = set(spec["features"]) - search.FEATURES
+            if unknown:
+                raise ValueError(f"unknown search features {sorted(unknown)}")
+        elif name == "nnue":
+            spec["nnue"] = value
+        else:
+            raise ValueError(f"unknown engine setting {setting!r}")
+    if not any(spec.get(limit) for limit in ("depth", "time_limit", "nodes")):
+        raise ValueError("an engine needs a depth, time or nodes limit")
+    return spec
+
+
+_networks = {}
+
+
+def make_bot(spec, color):
+    options = dict(spec)
+    path = options.pop("nnue", None)
+    if path:
+        import nnue
+        if path not in _networks:
+            _networks[path] = nnue.Network.load(path)
+        options["evaluator"] = nnue.Evaluator(_networks[path])
+    return chess_server.Bot(color, parallel=False, **options)
+
+
+def random_opening(rng, plies):
+    game = chess_server.Game.from_fen(STANDARD_FEN)
+    moves = []
+    for _ in range(plies):
+        legal = game.legal_moves()
+        if not legal:
+            break
+        move = rng.choice(legal)
+        game.make_move(*move)
+        moves.append(move)
+    return moves
+
+
+def play_game(task):
+    """Play one game; returns the result from A's point of view plus
+    per-move (engine, seconds, nodes) records."""
+    index, specs, a_color, opening, max_plies = task
+    game = chess_server.Game.from_fen(STANDARD_FEN)
+    for move in opening:
+        game.make_move(*move)
+    b_color = chess_server.opponent(a_color)
+    bots = {a_color: ("a", make_bot(specs["a"], a_color)),
+            b_color: ("b", make_bot(specs["b"], b_color))}
+    moves = []
+    status = game.game_status()
+    while status == "ongoing" and len(game.move_stack) < max_plies:
+        name, bot = bots[game.turn]
+        start = time.perf_counter()
+        move = bot.choose_move(game)
+        elapsed = time.perf_counter() - start
+        if move is None or not game.move_piece(*move):
+            status = "illegal_move"
+            break
+        moves.append((name, elapsed, bot.last_search.nodes
+                      if bot.last_search else 0))
+        status = game.game_status()
+    if status == "checkmate" or status == "illegal_move":
+        # the side to move has lost
+        a_score = 0.0 if game.turn == a_color else 1.0
+    else:
+        a_score = 0.5
+    return {"index": index, "a_color": a_color, "a_score": a_score,
+            "status": status if status != "ongoing" else "max_plies",
+            "plies": len(game.move_stack), "moves": moves}
+
+
+def elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def expected_score(elo_difference):
+    return 1 / (1 + 10 ** (-elo_difference / 400))
+
+
+class Sprt:
+    """Sequential probability ratio test of elo0 against elo1, with the
+    usual normal approximation to the trinomial game results."""
+
+    def __init__(self, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05):
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    def llr(self, wins, draws, losses):
+        games = wins + draws + losses
+        if not games or not wins + losses:
+            return 0.0
+        score = (wins + draws / 2) / games
+        variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 +
+                    losses * score ** 2) / games
+        if variance == 0:
+            return 0.0
+        s0 = expected_score(self.elo0)
+        s1 = expected_score(self.elo1)
+        return games * (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+
+    def status(self, wins, draws, losses):
+        llr = self.llr(wins, draws, losses)
+        if llr >= self.upper:
+            return "H1"
+        if llr <= self.lower:
+            return "H0"
+        return None
+
+
+class MatchStats:
+    def __init__(self):
+        self.wins = self.draws = self.losses = 0
+        self.latencies = {"a": [], "b": []}
+        self.nodes = {"a": 0, "b": 0}
+        self.statuses = {}
+
+    def add(self, game):
+        if game["a_score"] == 1.0:
+            self.wins += 1
+        elif game["a_score"] == 0.0:
+            self.losses += 1
+        else:
+            self.draws += 1
+        self.statuses[game["status"]] = \
+            self.statuses.get(game["status"], 0) + 1
+        for name, seconds, nodes in game["moves"]:
+            self.latencies[name].append(seconds)
+            self.nodes[name] += nodes
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def elo(self):
+        """Elo of A over B and the half width of its 95% interval."""
+        games = self.games
+        score = (self.wins + self.draws / 2) / games
+        variance = (self.wins * (1 - score) ** 2 +
+                    self.draws * (0.5 - score) ** 2 +
+                    self.losses * score ** 2) / games
+        margin = 1.96 * math.sqrt(variance / games)
+        return elo(score), (elo(min(score + margin, 1)) -
+                            elo(max(score - margin, 0))) / 2
+
+    def nps(self, name):
+        seconds = sum(self.latencies[name])
+        return self.nodes[name] / seconds if seconds else 0.0
+
+    def latency(self, name, percent):
+        values = sorted(self.latencies[name])
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def openings(count, plies, seed, book=None):
+    """count opening move lists, from the book if given."""
+    rng = random.Random(seed)
+    if book is None:
+        return [random_opening(rng, plies) for _ in range(count)]
+    result = []
+    for _ in range(count):
+        game = chess_server.Game.from_fen(STANDARD_FEN)
+        moves = []
+        for _ in range(plies):
+            move = book.choose(game) or (rng.choice(game.legal_moves())
+                                         if game.legal_moves() else None)
+            if move is None:
+                break
+            game.make_move(*move)
+            moves.append(move)
+        result.append(moves)
+    return result
+
+
+def run_match(a, b, games=100, workers=None, opening_plies=4, seed=0,
+              max_plies=200, sprt=None, book=None, log=print):
+    specs = {"a": a, "b": b}
+    pairs = (games + 1) // 2
+    tasks = []
+    for opening in openings(pairs, opening_plies, seed, book):
+        for a_color in ("white", "black"):
+            tasks.append((len(tasks), specs, a_color, opening, max_plies))
+    tasks = tasks[:games]
+    stats = MatchStats()
+    decision = None
+    with multiprocessing.Pool(workers) as pool:
+        for game in pool.imap_unordered(play_game, tasks):
+            stats.add(game)
+            line = f"{stats.games}/{len(tasks)} W{stats.wins} " \
+                f"D{stats.draws} L{stats.losses}"
+            if stats.games > 1:
+                difference, margin = stats.elo()
+                line += f"  elo {difference:+.1f} +/- {margin:.1f}"
+            if sprt is not None:
+                llr = sprt.llr(stats.wins, stats.draws, stats.losses)
+                line += f"  llr {llr:.2f} [{sprt.lower:.2f}, " \
+                    f"{sprt.upper:.2f}]"
+                decision = sprt.status(stats.wins, stats.draws, stats.losses)
+            log(line)
+            if decision:
+                pool.terminate()
+                break
+    stats.decision = decision
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="engine vs engine match")
+    parser.add_argument("--a", action="append", required=True,
+                        help="setting of engine A, e.g. depth=3")
+    parser.add_argument("--b", action="append", required=True)
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--opening-plies", type=int, default=4)
+    parser.add_argument("--max-plies", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--book", default=None,
+                        help="opening book built with book.py")
+    parser.add_argument("--sprt", nargs=2, type=float, default=None,
+                        metavar=("ELO0", "ELO1"))
+    args = parser.parse_args()
+
+    book = None
+    if args.book:
+        import book as book_module
+        book = book_module.OpeningBook(args.book,
+                                       rng=random.Random(args.seed))
+    sprt = Sprt(*args.sprt) if args.sprt else None
+    start = time.perf_counter()
+    stats = run_match(parse_engine(args.a), parse_engine(args.b), args.games,
+                      args.workers, args.opening_plies, args.seed,
+                      args.max_plies, sprt, book)
+    elapsed = time.perf_counter() - start
+    print(f"{stats.games} games in {elapsed:.1f}s, endings {stats.statuses}")
+    if stats.decision:
+        print(f"SPRT accepted {stats.decision}")
+    for name in ("a", "b"):
+        print(f"{name}: {stats.nps(name):.0f} nodes/s, latency "
+              f"p50 {stats.latency(name, 50) * 1000:.0f}ms "
+              f"p90 {stats.latency(name, 90) * 1000:.0f}ms "
+              f"p99 {stats.latency(name, 99) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""Legal move generation for a whole batch of positions with NumPy.
+
+python movegen.py --positions 2000
+
+Boards are an N x 64 int8 array indexed by ``row * 8 + col`` holding the
+records.py piece codes (1 pawn .. 6 king), positive for white and
+negative for black. Every step works on all boards at once: pieces are
+found with nonzero(), targets are gathered through precomputed step and
+ray tables, and each pseudo-legal move is tried on its own copy of the
+board for check. Results are the same moves Game.legal_moves() gives,
+packed like records.encode_move() and grouped per board by an offsets
+array.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+import chess_server
+import records
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+# every board gets a 65th square that rays and steps off the edge point at;
+# it blocks sliders and can't be moved to
+OFF_BOARD = 64
+WALL = 7
+
+
+def _step_table(steps):
+    table = np.full((64, len(steps)), OFF_BOARD, dtype=np.intp)
+    for square in range(64):
+        row, col = divmod(square, 8)
+        for i, (dr, dc) in enumerate(steps):
+            if 0 <= row + dr < 8 and 0 <= col + dc < 8:
+                table[square, i] = (row + dr) * 8 + col + dc
+    return table
+
+
+def _ray_table(directions):
+    table = np.full((64, len(directions), 7), OFF_BOARD, dtype=np.intp)
+    for square in range(64):
+        row, col = divmod(square, 8)
+        for i, (dr, dc) in enumerate(directions):
+            for n in range(1, 8):
+                r, c = row + n * dr, col + n * dc
+                if not (0 <= r < 8 and 0 <= c < 8):
+                    break
+                table[square, i, n - 1] = r * 8 + c
+    return table
+
+
+KNIGHT_TABLE = _step_table(chess_server.KNIGHT_STEPS)
+KING_TABLE = _step_table(chess_server.KING_STEPS)
+RAYS = _ray_table(chess_server.STRAIGHT + chess_server.DIAGONAL)
+STRAIGHT_RAY = np.array([True] * 4 + [False] * 4)
+# squares a pawn captures on, white first; also where enemy pawns have to
+# stand to attack a king on that square
+PAWN_CAPTURES = np.stack([_step_table([(1, -1), (1, 1)]),
+                          _step_table([(-1, -1), (-1, 1)])])
+
+
+class Batch:
+    def __init__(self, boards, side, castling, en_passant):
+        self.boards = np.asarray(boards, dtype=np.int8)
+        # +1 white to move, -1 black to move
+        self.side = np.asarray(side, dtype=np.int8)
+        # N x 4 booleans in KQkq order
+        self.castling = np.asarray(castling, dtype=bool).reshape(-1, 4)
+        # square index, -1 for none
+        self.en_passant = np.asarray(en_passant, dtype=np.int16)
+
+    @classmethod
+    def from_games(cls, games):
+        games = list(games)
+        boards = np.zeros((len(games), 64), dtype=np.int8)
+        side = np.ones(len(games), dtype=np.int8)
+        castling = np.zeros((len(games), 4), dtype=bool)
+        en_passant = np.full(len(games), -1, dtype=np.int16)
+        for i, game in enumerate(games):
+            for square, piece in game.board.items():
+                code = records.KIND_CODES[type(piece)]
+                boards[i, records.square_index(square)] = \
+                    code if piece.color == "white" else -code
+            if game.turn == "black":
+                side[i] = -1
+            rights = game.castling_rights()
+            castling[i] = [letter in rights for letter in "KQkq"]
+            if game.en_passant is not None:
+                en_passant[i] = records.square_index(game.en_passant)
+        return cls(boards, side, castling, en_passant)
+
+    def __len__(self):
+        return len(self.boards)
+
+    def relative(self):
+        """Boards from the mover's side, own pieces positive, with the
+        off-board square appended."""
+        rel = self.boards * self.side[:, None]
+        wall = np.full((len(rel), 1), WALL, dtype=np.int8)
+        return np.concatenate([rel, wall], axis=1)
+
+
+def attacked(padded, rows, squares, black):
+    """True where squares[i] on padded[rows[i]] is attacked by negative
+    pieces; black[i] says which way the positive side's pawns move."""
+    rows = np.asarray(rows)
+    squares = np.asarray(squares)
+    near = rows[:, None]
+    hit = (padded[near, KNIGHT_TABLE[squares]] == -KNIGHT).any(1)
+    hit |= (padded[near, KING_TABLE[squares]] == -KING).any(1)
+    hit |= (padded[near, PAWN_CAPTURES[black.astype(np.intp), squares]]
+            == -PAWN).any(1)
+    rays = padded[rows[:, None, None], RAYS[squares]]
+    first = np.take_along_axis(rays, (rays != 0).argmax(2)[..., None],
+                               2)[..., 0]
+    slider = np.where(STRAIGHT_RAY, -ROOK, -BISHOP)
+    hit |= ((first == slider) | (first == -QUEEN)).any(1)
+    return hit
+
+
+def pseudo_legal_moves(batch):
+    """(board, from, to) index arrays of every pseudo-legal move."""
+    padded = batch.relative()
+    black = batch.side < 0
+    board, square = np.nonzero(padded[:, :64] > 0)
+    kind = padded[board, square]
+    found = []
+
+    for piece, table in ((KNIGHT, KNIGHT_TABLE), (KING, KING_TABLE)):
+        mine = kind == piece
+        b, s = board[mine], square[mine]
+        targets = table[s]
+        i, j = np.nonzero(padded[b[:, None], targets] <= 0)
+        found.append((b[i], s[i], targets[i, j]))
+
+    mine = (kind >= BISHOP) & (kind <= QUEEN)
+    b, s, k = board[mine], square[mine], kind[mine]
+    targets = RAYS[s]
+    values = padded[b[:, None, None], targets]
+    blocked = np.logical_or.accumulate(values != 0, axis=2)
+    # a square is reachable when nothing stands between it and the piece
+    reachable = np.ones_like(blocked)
+    reachable[:, :, 1:] = ~blocked[:, :, :-1]
+    directions = np.where((k == ROOK)[:, None], STRAIGHT_RAY,
+                          np.where((k == BISHOP)[:, None], ~STRAIGHT_RAY,
+                                   True))
+    i, d, n = np.nonzero(reachable & (values <= 0) & directions[..., None])
+    found.append((b[i], s[i], targets[i, d, n]))
+
+    mine = kind == PAWN
+    b, s = board[mine], square[mine]
+    forward = 8 * batch.side[b].astype(np.intp)
+    one = s + forward
+    one = np.where((one >= 0) & (one < 64), one, OFF_BOARD)
+    single = padded[b, one] == 0
+    home = np.where(black[b], 6, 1)
+    two = np.where(single & (s // 8 == home), s + 2 * forward, OFF_BOARD)
+    double = padded[b, two] == 0
+    found.append((b[single], s[single], one[single]))
+    found.append((b[double], s[double], two[double]))
+    targets = PAWN_CAPTURES[black[b].astype(np.intp), s]
+    captures = (padded[b[:, None], targets] < 0) | \
+        (targets == batch.en_passant[b][:, None])
+    i, j = np.nonzero(captures)
+    found.append((b[i], s[i], targets[i, j]))
+
+    found.append(_castling_moves(batch, padded, black))
+    return tuple(np.concatenate(parts).astype(np.intp)
+                 for parts in zip(*found))
+
+
+def _castling_moves(batch, padded, black):
+    rights = np.where(black[:, None], batch.castling[:, 2:],
+                      batch.castling[:, :2])
+    home = np.where(black, 56, 0)
+    boards = np.arange(len(batch))
+    found = ([], [], [])
+    # kingside then queenside: rook offset, squares to be empty, squares
+    # the king crosses that must not be attacked, king destination
+    for side, rook, empty, safe, to in ((0, 7, (5, 6), (4, 5, 6), 6),
+                                        (1, 0, (1, 2, 3), (4, 3, 2), 2)):
+        ok = rights[:, side] & (padded[boards, home + 4] == KING) & \
+            (padded[boards, home + rook] == ROOK)
+        for offset in empty:
+            ok &= padded[boards, home + offset] == 0
+        b = boards[ok]
+        for offset in safe:
+            keep = ~attacked(padded, b, home[b] + offset, black[b])
+            b = b[keep]
+        found[0].append(b)
+        found[1].append(home[b] + 4)
+        found[2].append(home[b] + to)
+    return tuple(np.concatenate(parts) for parts in found)
+
+
+def legal_moves(batch):
+    """Legal moves of every board as (moves, offsets).
+
+    moves is a uint16 array packed like records.encode_move, sorted by
+    board, from and to square; the moves of board i are
+    moves[offsets[i]:offsets[i + 1]]. Pawns reaching the last rank are
+    listed once, as Game.legal_moves() does.
+    """
+    board, start, end = pseudo_legal_moves(batch)
+    padded = batch.relative()
+    black = batch.side < 0
+    rows = np.arange(len(board))
+    after = padded[board]
+    piece = after[rows, start]
+    after[rows, end] = piece
+    after[rows, start] = 0
+    en_passant = (piece == PAWN) & (end == batch.en_passant[board]) & \
+        (start % 8 != end % 8)
+    behind = end - 8 * batch.side[board].astype(np.intp)
+    after[rows[en_passant], behind[en_passant]] = 0
+    castles = (piece == KING) & (np.abs(end - start) == 2)
+    rook_from = np.where(end > start, start + 3, start - 4)[castles]
+    rook_to = np.where(end > start, start + 1, start - 1)[castles]
+    after[rows[castles], rook_from] = 0
+    after[rows[castles], rook_to] = ROOK
+    kings = after[:, :64] == KING
+    # a side without a king is never in check, like Game.in_check
+    legal = ~kings.any(1) | ~attacked(after, rows, kings.argmax(1),
+                                      black[board])
+    board, start, end = board[legal], start[legal], end[legal]
+    order = np.lexsort((end, start, board))
+    board, start, end = board[order], start[order], end[order]
+    moves = (start | end << 6).astype(np.uint16)
+    offsets = np.zeros(len(batch) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(board, minlength=len(batch)), out=offsets[1:])
+    return moves, offsets
+
+
+def unpack(moves, offsets, index):
+    """The moves of one board as Game style ((row, col), (row, col))."""
+    return [records.decode_move(int(value))[0]
+            for value in moves[offsets[index]:offsets[index + 1]]]
+
+
+def random_positions(count, max_plies=60, seed=0):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = chess_server.Game.build_headless()
+        for _ in range(rng.randrange(max_plies)):
+            moves = game.legal_moves()
+            if not moves:
+                break
+            game.make_move(*rng.choice(moves))
+        positions.append(game)
+    return positions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="batched move generation against Game.legal_moves")
+    parser.add_argument("--positions", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    games = random_positions(args.positions, seed=args.seed)
+    start = time.perf_counter()
+    expected = [sorted(game.legal_moves()) for game in games]
+    per_board = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = Batch.from_games(games)
+    encoded = time.perf_counter() - start
+    start = time.perf_counter()
+    moves, offsets = legal_moves(batch)
+    batched = time.perf_counter() - start
+    mismatches = sum(sorted(unpack(moves, offsets, i)) != expected[i]
+                     for i in range(len(games)))
+    print(f"{len(games)} positions, {len(moves)} moves, "
+          f"{mismatches} mismatches")
+    print(f"Game.legal_moves {per_board:.3f}s, batch {batched:.3f}s "
+          f"(+{encoded:.3f}s to encode), "
+          f"{per_board / batched:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""Small NNUE style evaluation network in NumPy.
+
+python nnue.py train scores.jsonl weights.npz --hidden 128 --epochs 20
+python nnue.py eval weights.npz "<fen>"
+
+Inputs are 768 piece-square features (6 kinds x own/their x 64 squares)
+seen from both sides. The first layer sums the weight rows of the
+features present into one accumulator per side. Evaluator keeps those
+accumulators up to date from Game.move_stack, so a search only adds and
+subtracts a few rows per move. The rest of the network is two small
+dense layers with clipped ReLU that run as NumPy matrix products.
+evaluate_many() scores whole batches of positions at once.
+
+Weights live in an .npz file. The train command fits them to the JSON
+lines analysis.py writes, which have "fen" and "score" fields.
+"""
+import argparse
+import json
+
+import numpy as np
+
+import chess_server
+
+KINDS = {"Pawn": 0, "Knight": 1, "Bishop": 2, "Rook": 3, "Queen": 4,
+         "King": 5}
+FEATURES = 768
+# feature index of empty slots in batches; its weight row is all zeros
+PADDING = FEATURES
+MAX_PIECES = 32
+# the output layer is in units of SCALE centipawns
+SCALE = 400
+
+
+def feature(kind, color, square, perspective):
+    """Index of a piece on square as seen by the perspective side."""
+    index = square[0] * 8 + square[1]
+    if perspective == "black":
+        index ^= 56  # mirror the ranks
+    own = 0 if color == perspective else 1
+    return (KINDS[kind] * 2 + own) * 64 + index
+
+
+def board_features(board):
+    white = [feature(type(piece).__name__, piece.color, square, "white")
+             for square, piece in board.items()]
+    black = [feature(type(piece).__name__, piece.color, square, "black")
+             for square, piece in board.items()]
+    return white, black
+
+
+def _clipped(x):
+    return np.clip(x, 0.0, 1.0)
+
+
+class Network:
+    def __init__(self, w1, b1, w2, b2, w3, b3, path=None):
+        # w1 has an extra zero row for PADDING
+        self.w1 = np.asarray(w1, dtype=np.float32)
+        self.b1 = np.asarray(b1, dtype=np.float32)
+        self.w2 = np.asarray(w2, dtype=np.float32)
+        self.b2 = np.asarray(b2, dtype=np.float32)
+        self.w3 = np.asarray(w3, dtype=np.float32)
+        self.b3 = np.float32(b3)
+        self.path = path
+
+    @property
+    def hidden(self):
+        return self.w1.shape[1]
+
+    @classmethod
+    def random(cls, hidden=128, second=32, seed=0):
+        rng = np.random.default_rng(seed)
+        w1 = rng.normal(0, 0.1, (FEATURES + 1, hidden))
+        w1[PADDING] = 0
+        return cls(w1, np.full(hidden, 0.5),
+                   rng.normal(0, 1 / np.sqrt(2 * hidden), (2 * hidden, second)),
+                   np.zeros(second), rng.normal(0, 1 / np.sqrt(second), second),
+                   0.0)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["w1"], data["b1"], data["w2"], data["b2"],
+                       data["w3"], data["b3"], path=str(path))
+
+    def save(self, path):
+        np.savez(path, w1=self.w1, b1=self.b1, w2=self.w2, b2=self.b2,
+                 w3=self.w3, b3=self.b3)
+        self.path = str(path)
+
+    def __reduce__(self):
+        # worker processes load the file themselves
+        if self.path is not None:
+            return Network.load, (self.path,)
+        return Network, (self.w1, self.b1, self.w2, self.b2, self.w3,
+                         self.b3)
+
+    def accumulate(self, board):
+        white, black = board_features(board)
+        return np.stack([self.b1 + self.w1[white].sum(0),
+                         self.b1 + self.w1[black].sum(0)])
+
+    def output(self, us, them):
+        """Raw output for accumulators ordered side to move first; works
+        on single positions and on batches."""
+        hidden = _clipped(np.concatenate([us, them], axis=-1))
+        hidden = _clipped(hidden @ self.w2 + self.b2)
+        return hidden @ self.w3 + self.b3
+
+    def evaluate(self, game):
+        accumulator = self.accumulate(game.board)
+        side = 0 if game.turn == "white" else 1
+        return int(round(float(self.output(accumulator[side],
+                                           accumulator[1 - side])) * SCALE))
+
+
+def _changes(record):
+    """(added, removed) (kind, color, square) triples for a move_stack
+    record."""
+    (from_square, to_square, piece, placed, captured, captured_square,
+     rook_move) = record[:7]
+    if from_square is None:
+        return (), ()  # null move
+    added = [(type(placed).__name__, placed.color, to_square)]
+    removed = [(type(piece).__name__, piece.color, from_square)]
+    if captured is not None:
+        removed.append((type(captured).__name__, captured.color,
+                        captured_square))
+    if rook_move:
+        added.append(("Rook", piece.color, rook_move[1]))
+        removed.append(("Rook", piece.color, rook_move[0]))
+    return added, removed
+
+
+class Evaluator:
+    """Search evaluator with incrementally updated accumulators.
+
+    Each call lines its accumulator stack up with game.move_stack: moves
+    that were taken back are popped, new ones applied as row additions
+    and subtractions. Only a different game or unwinding past the
+    starting point rebuilds from the board.
+    """
+
+    def __init__(self, network):
+        self.network = network
+        self.game = None
+        self.records = []
+        self.stack = []
+        self.base = 0
+
+    def __reduce__(self):
+        return Evaluator, (self.network,)
+
+    def fork(self):
+        """A fresh evaluator on the same weights, e.g. for another thread."""
+        return Evaluator(self.network)
+
+    def refresh(self, game):
+        self.game = game
+        self.records = list(game.move_stack)
+        self.base = len(self.records)
+        self.stack = [self.network.accumulate(game.board)]
+
+    def push(self, record):
+        w1 = self.network.w1
+        added, removed = _changes(record)
+        accumulator = self.stack[-1].copy()
+        for perspective, row in (("white", 0), ("black", 1)):
+            for kind, color, square in added:
+                accumulator[row] += w1[feature(kind, color, square,
+                                               perspective)]
+            for kind, color, square in removed:
+                accumulator[row] -= w1[feature(kind, color, square,
+                                               perspective)]
+        self.stack.append(accumulator)
+        self.records.append(record)
+
+    def sync(self, game):
+        if game is not self.game:
+            self.refresh(game)
+            return
+        moves = game.move_stack
+        common = min(len(self.records), len(moves))
+        while common > self.base and self.records[common - 1] is not \
+                moves[common - 1]:
+            common -= 1
+        if common < self.base or (common == self.base and self.base and
+                                  self.records[common - 1] is not
+                                  moves[common - 1]):
+            self.refresh(game)
+            return
+        del self.stack[common - self.base + 1:]
+        del self.records[common:]
+        for record in moves[common:]:
+            self.push(record)
+
+    def __call__(self, game):
+        self.sync(game)
+        accumulator = self.stack[-1]
+        side = 0 if game.turn == "white" else 1
+        raw = self.network.output(accumulator[side], accumulator[1 - side])
+        return int(round(float(raw) * SCALE))
+
+
+def batch_features(positions):
+    """N x 32 feature indexes per perspective plus the side to move, for
+    Games or FEN strings."""
+    count = len(positions)
+    white = np.full((count, MAX_PIECES), PADDING, dtype=np.intp)
+    black = np.full((count, MAX_PIECES), PADDING, dtype=np.intp)
+    black_to_move = np.zeros(count, dtype=bool)
+    for i, position in enumerate(positions):
+        if isinstance(position, str):
+            position = chess_server.Game.from_fen(position)
+        w, b = board_features(position.board)
+        white[i, :len(w)] = w
+        black[i, :len(b)] = b
+        black_to_move[i] = position.turn == "black"
+    return white, black, black_to_move
+
+
+def _forward(network, white, black, black_to_move):
+    acc_white = network.b1 + network.w1[white].sum(1)
+    acc_black = network.b1 + network.w1[black].sum(1)
+    turn = black_to_move[:, None]
+    us = np.where(turn, acc_black, acc_white)
+    them = np.where(turn, acc_white, acc_black)
+    return us, them
+
+
+def evaluate_many(network, positions):
+    """Centipawn scores for the side to move of each position."""
+    positions = list(positions)
+    us, them = _forward(network, *batch_features(positions))
+    return np.rint(network.output(us, them) * SCALE).astype(np.int32)
+
+
+def train(network, positions, scores, epochs=10, batch_size=256,
+          learning_rate=1e-3, seed=0, log=print):
+    """Fit network in place to centipawn scores with Adam, on a sigmoid
+    scale so large scores don't dominate."""
+    white, black, black_to_move = batch_features(positions)
+    target = 1 / (1 + np.exp(-np.asarray(scores, dtype=np.float32) / SCALE))
+    params = ["w1", "b1", "w2", "b2", "w3", "b3"]
+    moments = {name: [np.zeros_like(getattr(network, name)),
+                      np.zeros_like(getattr(network, name))]
+               for name in params}
+    rng = np.random.default_rng(seed)
+    step = 0
+    for epoch in range(epochs):
+        order = rng.permutation(len(target))
+        total = 0.0
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            grads, loss = _gradients(network, white[batch], black[batch],
+                                     black_to_move[batch], target[batch])
+            total += loss * len(batch)
+            step += 1
+            for name in params:
+                m, v = moments[name]
+                m[...] = 0.9 * m + 0.1 * grads[name]
+                v[...] = 0.999 * v + 0.001 * grads[name] ** 2
+                update = learning_rate * (m / (1 - 0.9 ** step)) / \
+                    (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+                setattr(network, name,
+                        (getattr(network, name) - update).astype(np.float32))
+            network.w1[PADDING] = 0
+        log(f"epoch {epoch + 1}: loss {total / len(order):.5f}")
+    return network
+
+
+def _gradients(network, white, black, black_to_move, target):
+    us, them = _forward(network, white, black, black_to_move)
+    z1 = np.concatenate([us, them], axis=1)
+    a1 = _clipped(z1)
+    z2 = a1 @ network.w2 + network.b2
+    a2 = _clipped(z2)
+    out = a2 @ network.w3 + network.b3
+    predicted = 1 / (1 + np.exp(-out))
+    loss = float(np.mean((predicted - target) ** 2))
+    d_out = 2 * (predicted - target) * predicted * (1 - predicted) / len(out)
+    d_z2 = np.outer(d_out, network.w3) * ((z2 > 0) & (z2 < 1))
+    d_z1 = (d_z2 @ network.w2.T) * ((z1 > 0) & (z1 < 1))
+    hidden = network.hidden
+    turn = black_to_move[:, None]
+    d_white = np.where(turn, d_z1[:, hidden:], d_z1[:, :hidden])
+    d_black = np.where(turn, d_z1[:, :hidden], d_z1[:, hidden:])
+    d_w1 = np.zeros_like(network.w1)
+    for indexes, grad in ((white, d_white), (black, d_black)):
+        np.add.at(d_w1, indexes.ravel(),
+                  np.repeat(grad, indexes.shape[1], axis=0))
+    return {"w1": d_w1, "b1": (d_white + d_black).sum(0),
+            "w2": a1.T @ d_z2, "b2": d_z2.sum(0),
+            "w3": a2.T @ d_out, "b3": d_out.sum()}, loss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NNUE style evaluator")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train")
+    train_parser.add_argument("scores", help="analysis.py JSON lines")
+    train_parser.add_argument("weights")
+    train_parser.add_argument("--hidden", type=int, default=128)
+    train_parser.add_argument("--epochs", type=int, default=20)
+    train_parser.add_argument("--learning-rate", type=float, default=1e-3)
+    eval_parser = commands.add_parser("eval")
+    eval_parser.add_argument("weights")
+    eval_parser.add_argument("fen", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        positions, scores = [], []
+        with open(args.scores) as f:
+            for line in f:
+                if line.startswith("{"):
+                    record = json.loads(line)
+                    positions.append(record["fen"])
+                    scores.append(max(-3000, min(3000, record["score"])))
+        network = Network.random(args.hidden)
+        train(network, positions, scores, args.epochs,
+              learning_rate=args.learning_rate)
+        network.save(args.weights)
+    else:
+        network = Network.load(args.weights)
+        for fen, score in zip(args.fen, evaluate_many(network, args.fen)):
+            print(f"{score:6d}  {fen}")
+
+
+if __name__ == "__main__":
+    main()
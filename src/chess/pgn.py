@@ -0,0 +1,251 @@
+"""Streaming PGN import and export.
+
+python pgn.py games.pgn --limit 10000 --write out.pgn
+
+read_games() yields one PGNGame at a time while reading the file line by
+line, so memory use doesn't grow with the size of the file. SAN is
+resolved against Game.legal_moves() and applied with Game.make_move().
+"""
+import argparse
+import re
+import time
+
+import chess_server
+
+SAN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+SAN_KINDS = {"N": chess_server.Knight, "B": chess_server.Bishop,
+             "R": chess_server.Rook, "Q": chess_server.Queen,
+             "K": chess_server.King, None: chess_server.Pawn}
+PROMOTION_NAMES = {"N": "knight", "B": "bishop", "R": "rook", "Q": "queen"}
+PROMOTION_LETTERS = {name: letter for letter, name in PROMOTION_NAMES.items()}
+RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+TAG = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+MOVE_NUMBER = re.compile(r"^\d+\.+")
+STANDARD_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+class PGNError(ValueError):
+    pass
+
+
+class PGNGame:
+    def __init__(self, headers=None, moves=None, result="*"):
+        self.headers = headers or {}
+        self.moves = moves or []
+        self.result = result
+
+    def start(self):
+        return chess_server.Game.from_fen(self.headers.get("FEN", STANDARD_FEN))
+
+    def replay(self, game=None):
+        """Apply the moves to a Game and return ((from, to), promotion)
+        for each of them."""
+        game = game or self.start()
+        played = []
+        for san in self.moves:
+            move, promotion = parse_san(game, san)
+            game.make_move(*move, promotion)
+            played.append((move, promotion))
+        return game, played
+
+
+def parse_san(game, san):
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        row = 0 if game.turn == "white" else 7
+        to_col = 6 if text in ("O-O", "0-0") else 2
+        move = ((row, 4), (row, to_col))
+        if isinstance(game.board.get((row, 4)), chess_server.King) and \
+                move[1] in game.piece_moves(move[0]) and game.is_legal(*move):
+            return move, None
+        raise PGNError(f"illegal castling {san!r}")
+    match = SAN.match(text)
+    if not match:
+        raise PGNError(f"can't parse SAN {san!r}")
+    letter, from_file, from_rank, target, promotion = match.groups()
+    kind = SAN_KINDS[letter]
+    to_square = chess_server.parse_square(target)
+    # only pieces of the right kind that reach the target are tried for
+    # legality, instead of generating every legal move in the position
+    candidates = []
+    for start, piece in list(game.board.items()):
+        if type(piece) is not kind or piece.color != game.turn:
+            continue
+        if from_file and "abcdefgh"[start[1]] != from_file:
+            continue
+        if from_rank and str(start[0] + 1) != from_rank:
+            continue
+        if to_square in game.piece_moves(start) and \
+                game.is_legal(start, to_square):
+            candidates.append((start, to_square))
+    if len(candidates) != 1:
+        problem = "illegal" if not candidates else "ambiguous"
+        raise PGNError(f"{problem} move {san!r} in {game.fen()}")
+    return candidates[0], PROMOTION_NAMES.get(promotion)
+
+
+def move_to_san(game, move, promotion=None, legal_moves=None):
+    """SAN for a legal move in the current position of game."""
+    start, end = move
+    piece = game.board[start]
+    legal_moves = game.legal_moves() if legal_moves is None else legal_moves
+    if isinstance(piece, chess_server.King) and abs(end[1] - start[1]) == 2:
+        san = "O-O" if end[1] == 6 else "O-O-O"
+    else:
+        capture = end in game.board or (
+            isinstance(piece, chess_server.Pawn) and end == game.en_passant)
+        if isinstance(piece, chess_server.Pawn):
+            san = ("abcdefgh"[start[1]] + "x" if capture else "") + \
+                chess_server.square_name(end)
+            if end[0] in (0, 7):
+                san += "=" + PROMOTION_LETTERS[promotion or "queen"]
+        else:
+            rivals = [other for other, to in legal_moves
+                      if to == end and other != start
+                      and type(game.board[other]) is type(piece)]
+            hint = ""
+            if rivals:
+                if all(other[1] != start[1] for other in rivals):
+                    hint = "abcdefgh"[start[1]]
+                elif all(other[0] != start[0] for other in rivals):
+                    hint = str(start[0] + 1)
+                else:
+                    hint = chess_server.square_name(start)
+            san = chess_server.display_name(piece)[1] + hint + \
+                ("x" if capture else "") + chess_server.square_name(end)
+    game.make_move(start, end, promotion)
+    if game.in_check():
+        san += "#" if not game.legal_moves() else "+"
+    game.unmake_move()
+    return san
+
+
+def _tokens(text):
+    # comments and variations are dropped; NAGs and move numbers too
+    depth = 0
+    for token in re.findall(r"\{[^}]*\}|;[^\n]*|\(|\)|[^\s(){};]+", text):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth or token[0] in "{;$":
+            continue
+        else:
+            token = MOVE_NUMBER.sub("", token)
+            if token:
+                yield token
+
+
+def read_games(path_or_file):
+    """Yield PGNGame objects one at a time from a PGN file."""
+    if isinstance(path_or_file, (str, bytes)) or hasattr(path_or_file,
+                                                         "__fspath__"):
+        with open(path_or_file, encoding="utf-8", errors="replace") as f:
+            yield from read_games(f)
+        return
+    headers, movetext = {}, []
+    in_comment = False
+    for line in path_or_file:
+        stripped = line.strip()
+        if not in_comment and stripped.startswith("["):
+            match = TAG.match(stripped)
+            if match:
+                if movetext:
+                    yield _build(headers, movetext)
+                    headers, movetext = {}, []
+                headers[match.group(1)] = match.group(2)
+                continue
+        if stripped.startswith("%") and not in_comment:
+            continue
+        if stripped:
+            movetext.append(stripped)
+            if "{" in stripped or "}" in stripped:
+                in_comment = _inside_comment(stripped, in_comment)
+    if headers or movetext:
+        yield _build(headers, movetext)
+
+
+def _inside_comment(line, inside):
+    # a brace comment can span lines and hide tag-looking lines
+    for char in line:
+        if char == "{":
+            inside = True
+        elif char == "}":
+            inside = False
+    return inside
+
+
+def _build(headers, movetext):
+    moves, result = [], headers.get("Result", "*")
+    for token in _tokens("\n".join(movetext)):
+        if token in RESULTS:
+            result = token
+        else:
+            moves.append(token)
+    return PGNGame(headers, moves, result)
+
+
+def write_game(file, headers, moves, result=None, start=None):
+    """Write one game; moves are (from, to) or ((from, to), promotion)."""
+    game = start or chess_server.Game.from_fen(
+        headers.get("FEN", STANDARD_FEN))
+    result = result or headers.get("Result", "*")
+    headers = {"Event": "?", "Site": "?", "Date": "????.??.??", "Round": "?",
+               "White": "?", "Black": "?", **headers, "Result": result}
+    for key, value in headers.items():
+        file.write(f'[{key} "{value}"]\n')
+    file.write("\n")
+    tokens = []
+    for item in moves:
+        move, promotion = item if isinstance(item[0][0], tuple) \
+            else (item, None)
+        if game.turn == "white":
+            tokens.append(f"{game.fullmove_number}.")
+        elif not tokens:
+            tokens.append(f"{game.fullmove_number}...")
+        tokens.append(move_to_san(game, move, promotion))
+        game.make_move(*move, promotion)
+    tokens.append(result)
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 79:
+            file.write(line + "\n")
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    file.write(line + "\n\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import and replay PGN")
+    parser.add_argument("pgn")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--write", default=None,
+                        help="write the replayed games back out as PGN")
+    args = parser.parse_args()
+
+    out = open(args.write, "w", encoding="utf-8") if args.write else None
+    games = moves = errors = 0
+    start = time.perf_counter()
+    for record in read_games(args.pgn):
+        if args.limit and games >= args.limit:
+            break
+        try:
+            _, played = record.replay()
+        except PGNError as e:
+            errors += 1
+            print(f"game {games + 1}: {e}")
+            continue
+        games += 1
+        moves += len(played)
+        if out:
+            write_game(out, record.headers, played, record.result)
+    elapsed = time.perf_counter() - start
+    if out:
+        out.close()
+    print(f"{games} games, {moves} moves, {errors} errors in {elapsed:.2f}s")
+    print(f"{games / elapsed:.1f} games/s, {moves / elapsed:.1f} moves/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Parallel ingest of the corpus into chroma.
+
+python pipeline.py --workers 4 --shard-size 256 --batch-size 128
+
+Stages:
+  1. a process pool labels and tokenizes shards of the corpus
+  2. an embedding thread runs the model on tokenized shards
+  3. a writer thread upserts embedded batches into chroma
+
+Stages are joined by bounded queues and at most ``2 * workers`` shards
+are in flight in the pool, so a slow stage holds back the ones before
+it instead of letting work pile up in memory.
+"""
+import argparse
+import collections
+import multiprocessing
+import queue
+import threading
+import time
+
+import corpus
+import inference
+import keywords
+
+_DONE = object()
+
+_matcher = None
+_tokenizer = None
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+
+    def add(self, items, seconds):
+        self.items += items
+        self.busy += seconds
+
+    def report(self, wall):
+        # busy rate is what one worker of the stage sustains, wall rate is
+        # what the whole pipeline got out of it
+        busy_rate = self.items / self.busy if self.busy else 0.0
+        return (f"{self.name:10} {self.items:>8} docs  "
+                f"{busy_rate:>10.1f} docs/s busy  "
+                f"{self.items / wall if wall else 0.0:>10.1f} docs/s wall  "
+                f"{self.busy:>8.2f}s busy")
+
+
+def _init_worker(labels, tokenize_texts):
+    global _matcher, _tokenizer
+    _matcher = keywords.LabelMatcher(labels)
+    _tokenizer = inference.load_tokenizer() if tokenize_texts else None
+
+
+def label_shard(shard):
+    start = time.perf_counter()
+    labelled = list(keywords.iter_labelled(_matcher, shard))
+    encoded = None
+    if _tokenizer is not None:
+        encoded = inference.tokenize(_tokenizer, [text for _, text in labelled])
+    return labelled, encoded, time.perf_counter() - start
+
+
+def _put(outbox, item, stop):
+    """Put unless the pipeline is stopping; False if it gave up."""
+    while not stop.is_set():
+        try:
+            outbox.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(inbox, stop):
+    """Next item, or _DONE once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            return inbox.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def _stage(body, errors, stop):
+    # a failed stage records its error and stops the others, run() raises it
+    def target(*args):
+        try:
+            body(*args, stop)
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+    return target
+
+
+def _embed_stage(backend, inbox, outbox, stats, stop):
+    try:
+        while (item := _get(inbox, stop)) is not _DONE:
+            labelled, encoded = item
+            start = time.perf_counter()
+            embeddings = backend.embed_encoded(encoded) if backend else None
+            stats.add(len(labelled), time.perf_counter() - start)
+            if not _put(outbox, (labelled, embeddings), stop):
+                return
+    finally:
+        _put(outbox, _DONE, stop)
+
+
+def _write_stage(write, inbox, batch_size, stats, stop):
+    batch, embeddings, written = [], [], 0
+
+    def flush(size):
+        nonlocal batch, embeddings, written
+        start = time.perf_counter()
+        write(batch[:size], embeddings[:size], written + 1)
+        stats.add(size, time.perf_counter() - start)
+        written += size
+        batch, embeddings = batch[size:], embeddings[size:]
+
+    while (item := _get(inbox, stop)) is not _DONE:
+        labelled, vectors = item
+        batch.extend(labelled)
+        embeddings.extend(vectors or [None] * len(labelled))
+        while len(batch) >= batch_size:
+            flush(batch_size)
+    if batch and not stop.is_set():
+        flush(len(batch))
+
+
+def run(path=corpus.DATA_PATH, workers=None, shard_size=256, batch_size=256,
+        queue_size=4, backend=None, write=None):
+    """Run the pipeline and return the per-stage StageStats.
+
+    ``backend`` is an inference backend, None skips tokenizing and
+    embedding. ``write(results, embeddings, start)`` stores a batch,
+    None skips writing. An exception in any stage stops the others and
+    is raised here.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    stats = [StageStats("label"), StageStats("embed"), StageStats("write")]
+    to_embed = queue.Queue(maxsize=queue_size)
+    to_write = queue.Queue(maxsize=queue_size)
+    errors = []
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=_stage(_embed_stage, errors, stop),
+                         args=(backend, to_embed, to_write, stats[1])),
+        threading.Thread(target=_stage(_write_stage, errors, stop),
+                         args=(write or (lambda *args: None), to_write,
+                               batch_size, stats[2])),
+    ]
+    for thread in threads:
+        thread.start()
+
+    pending = collections.deque()
+
+    def drain_one():
+        labelled, encoded, seconds = pending.popleft().get()
+        stats[0].add(len(labelled), seconds)
+        # blocks while embedding lags
+        return _put(to_embed, (labelled, encoded), stop)
+
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(keywords.get_labels(),
+                                            backend is not None)) as pool:
+            for shard in corpus.chunked(corpus.iter_lines(path), shard_size):
+                if len(pending) >= 2 * workers and not drain_one():
+                    break
+                pending.append(pool.apply_async(label_shard, (shard,)))
+            while pending and drain_one():
+                pass
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        _put(to_embed, _DONE, stop)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="label, embed and upsert the corpus in parallel")
+    parser.add_argument("--corpus", default=str(corpus.DATA_PATH))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--backend", default="torch",
+                        choices=sorted(inference.BACKENDS))
+    parser.add_argument("--threads", type=int, default=None,
+                        help="intra-op threads for the embedding backend")
+    parser.add_argument("--label-only", action="store_true",
+                        help="only run the labeling stage")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="embed but don't write to chroma")
+    args = parser.parse_args()
+
+    backend = None
+    write = None
+    if not args.label_only:
+        backend = inference.load_backend(args.backend, threads=args.threads)
+        if not args.dry_run:
+            import vectordb
+            write = vectordb.upsert
+
+    start = time.perf_counter()
+    stats = run(args.corpus, args.workers, args.shard_size, args.batch_size,
+                args.queue_size, backend, write)
+    if write is not None:
+        vectordb.flush()
+    wall = time.perf_counter() - start
+    for stage in stats:
+        print(stage.report(wall))
+    print(f"{'total':10} {stats[0].items:>8} docs in {wall:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
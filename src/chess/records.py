@@ -0,0 +1,184 @@
+"""Compact binary records for positions and moves.
+
+A position is a fixed 32 byte record:
+
+  8 bytes   occupancy bitboard, bit ``row * 8 + col`` set per piece
+  16 bytes  one nibble per occupied square in square order (max 32 pieces)
+  1 byte    bit 0 side to move (1 = black), bits 1-4 castling KQkq
+  1 byte    en passant square index, 255 for none
+  6 bytes   reserved, zero
+
+A move is a little-endian uint16: from square (6 bits), to square
+(6 bits) and promotion piece (3 bits, 0 for none).
+
+Positions files start with a 16 byte header and are read through mmap,
+so record ``i`` is a slice at a fixed offset and nothing else is parsed.
+"""
+import array
+import mmap
+import struct
+
+import chess_server
+
+RECORD = struct.Struct("<Q16sBB6x")
+RECORD_SIZE = RECORD.size
+HEADER = struct.Struct("<8sII")
+MAGIC = b"CHESSPOS"
+VERSION = 1
+
+KINDS = [None, chess_server.Pawn, chess_server.Knight, chess_server.Bishop,
+         chess_server.Rook, chess_server.Queen, chess_server.King]
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS) if kind}
+BLACK = 8
+CASTLING_BITS = {"K": 1, "Q": 2, "k": 4, "q": 8}
+PROMOTIONS = [None, "knight", "bishop", "rook", "queen"]
+NO_SQUARE = 255
+
+
+def square_index(square):
+    return square[0] * 8 + square[1]
+
+
+def index_square(index):
+    return divmod(index, 8)
+
+
+def piece_code(piece):
+    return KIND_CODES[type(piece)] | (BLACK if piece.color == "black" else 0)
+
+
+def encode_position(game):
+    occupancy = 0
+    codes = []
+    for index, piece in sorted((square_index(square), piece)
+                               for square, piece in game.board.items()
+                               if piece is not None):
+        occupancy |= 1 << index
+        codes.append(piece_code(piece))
+    if len(codes) > 32:
+        raise ValueError(f"{len(codes)} pieces don't fit in a record")
+    codes.extend([0] * (32 - len(codes)))
+    packed = bytes(codes[i] << 4 | codes[i + 1] for i in range(0, 32, 2))
+    flags = 1 if game.turn == "black" else 0
+    for letter in game.castling_rights():
+        flags |= CASTLING_BITS[letter] << 1
+    ep = NO_SQUARE if game.en_passant is None \
+        else square_index(game.en_passant)
+    return RECORD.pack(occupancy, packed, flags, ep)
+
+
+def decode_position(data, bot_color="black"):
+    occupancy, packed, flags, ep = RECORD.unpack(data)
+    codes = []
+    for byte in packed:
+        codes.append(byte >> 4)
+        codes.append(byte & 15)
+    board = {}
+    code_iter = iter(codes)
+    for index in range(64):
+        if occupancy >> index & 1:
+            code = next(code_iter)
+            color = "black" if code & BLACK else "white"
+            board[index_square(index)] = KINDS[code & 7](color)
+    # kings and rooks only count as unmoved where a castling right says so
+    for piece in board.values():
+        if hasattr(piece, "has_moved"):
+            piece.has_moved = True
+    for letter, bit in CASTLING_BITS.items():
+        if flags >> 1 & bit:
+            row = 0 if letter.isupper() else 7
+            board[(row, 4)].has_moved = False
+            board[(row, 7 if letter in "Kk" else 0)].has_moved = False
+    game = chess_server.Game(board, 60, None,
+                             chess_server.Bot(bot_color, parallel=False))
+    game.turn = "black" if flags & 1 else "white"
+    game.en_passant = None if ep == NO_SQUARE else index_square(ep)
+    game.reset_history()
+    return game
+
+
+def encode_move(move, promotion=None):
+    start, end = move
+    return square_index(start) | square_index(end) << 6 | \
+        PROMOTIONS.index(promotion) << 12
+
+
+def decode_move(value):
+    move = (index_square(value & 63), index_square(value >> 6 & 63))
+    return move, PROMOTIONS[value >> 12 & 7]
+
+
+def encode_moves(moves):
+    """Pack bare moves or (move, promotion) pairs at 2 bytes per move."""
+    values = array.array("H", (
+        encode_move(*item) if isinstance(item[0][0], tuple)
+        else encode_move(item) for item in moves))
+    return values.tobytes()
+
+
+def decode_moves(data):
+    values = array.array("H")
+    values.frombytes(data)
+    return [decode_move(value) for value in values]
+
+
+class PositionWriter:
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE))
+        self.count = 0
+
+    def write(self, game):
+        self.file.write(encode_position(game))
+        self.count += 1
+
+    def write_raw(self, record):
+        self.file.write(record)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PositionReader:
+    """Random access to a positions file without reading it into memory."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            raise ValueError(f"{path} is not a version {VERSION} positions file")
+        self.count = (len(self.map) - HEADER.size) // RECORD_SIZE
+
+    def __len__(self):
+        return self.count
+
+    def raw(self, index):
+        if not -self.count <= index < self.count:
+            raise IndexError(index)
+        offset = HEADER.size + (index % self.count) * RECORD_SIZE
+        return self.map[offset:offset + RECORD_SIZE]
+
+    def __getitem__(self, index):
+        return decode_position(self.raw(index))
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,192 @@
+"""pygame board view that only redraws what changed.
+
+python renderer.py --color white --depth 3
+
+Square and piece surfaces are drawn once and blitted from a cache. After
+a move the renderer compares the board with what it last drew and
+updates just those squares' rectangles. The loop blocks in
+pygame.event.wait(), so an idle window costs no CPU, and frames are capped
+at ``fps``. Set SDL_VIDEODRIVER=dummy to run it without a display.
+"""
+import argparse
+
+import pygame
+
+import chess_server
+
+LIGHT = (233, 236, 239)
+DARK = (125, 135, 150)
+SELECTED = (246, 246, 105)
+PIECE_FILL = {"white": (250, 250, 250), "black": (40, 40, 40)}
+PIECE_TEXT = {"white": (40, 40, 40), "black": (250, 250, 250)}
+
+
+class BoardRenderer:
+    def __init__(self, game, square_size=60, screen=None, flipped=False,
+                 fps=30):
+        pygame.display.init()
+        pygame.font.init()
+        self.game = game
+        self.square_size = square_size
+        self.flipped = flipped
+        self.fps = fps
+        self.screen = screen or pygame.display.set_mode(
+            (8 * square_size, 8 * square_size))
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.Font(None, square_size * 2 // 3)
+        self.squares = {}
+        self.pieces = {}
+        self.selected = None
+        # what each square showed when it was last drawn
+        self.drawn = {}
+        self.dirty = set()
+        self.full_redraw = True
+
+    def square_surface(self, square, selected=False):
+        color = SELECTED if selected else \
+            (DARK if (square[0] + square[1]) % 2 == 0 else LIGHT)
+        surface = self.squares.get(color)
+        if surface is None:
+            surface = pygame.Surface((self.square_size, self.square_size))
+            surface.fill(color)
+            self.squares[color] = surface
+        return surface
+
+    def piece_surface(self, piece):
+        name = chess_server.display_name(piece)
+        surface = self.pieces.get(name)
+        if surface is None:
+            size = self.square_size
+            surface = pygame.Surface((size, size), pygame.SRCALPHA)
+            pygame.draw.circle(surface, PIECE_FILL[piece.color],
+                               (size // 2, size // 2), size * 2 // 5)
+            letter = self.font.render(name[1].upper(), True,
+                                      PIECE_TEXT[piece.color])
+            surface.blit(letter, letter.get_rect(center=(size // 2,
+                                                         size // 2)))
+            self.pieces[name] = surface
+        return surface
+
+    def square_rect(self, square):
+        row, col = square
+        if self.flipped:
+            row, col = 7 - row, 7 - col
+        size = self.square_size
+        return pygame.Rect(col * size, (7 - row) * size, size, size)
+
+    def screen_to_square(self, pos):
+        x, y = pos
+        row, col = 7 - y // self.square_size, x // self.square_size
+        if not (0 <= row < 8 and 0 <= col < 8):
+            return None
+        return (7 - row, 7 - col) if self.flipped else (row, col)
+
+    def draw_square(self, square):
+        rect = self.square_rect(square)
+        self.screen.blit(self.square_surface(square,
+                                             square == self.selected), rect)
+        piece = self.game.board.get(square)
+        if piece is not None:
+            self.screen.blit(self.piece_surface(piece), rect)
+        self.drawn[square] = piece
+        return rect
+
+    def sync(self):
+        """Mark the squares whose piece changed since they were drawn."""
+        board = self.game.board
+        for square in set(board) | set(self.drawn):
+            if board.get(square) is not self.drawn.get(square):
+                self.dirty.add(square)
+
+    def select(self, square):
+        for changed in (self.selected, square):
+            if changed is not None:
+                self.dirty.add(changed)
+        self.selected = square
+
+    def move_piece(self, from_square, to_square, promotion=None):
+        moved = self.game.move_piece(from_square, to_square, promotion)
+        self.sync()
+        return moved
+
+    def render(self):
+        """Draw whatever is dirty and return the updated rectangles."""
+        if self.full_redraw:
+            self.full_redraw = False
+            self.dirty.clear()
+            for row in range(8):
+                for col in range(8):
+                    self.draw_square((row, col))
+            pygame.display.flip()
+            return [self.screen.get_rect()]
+        rects = [self.draw_square(square) for square in sorted(self.dirty)]
+        self.dirty.clear()
+        if rects:
+            pygame.display.update(rects)
+        return rects
+
+    def click(self, pos, player_color):
+        """Select a piece, or move the selected one; True once a move is
+        played."""
+        square = self.screen_to_square(pos)
+        if square is None or self.game.turn != player_color:
+            return False
+        piece = self.game.board.get(square)
+        if self.selected is None or (piece is not None and
+                                     piece.color == player_color):
+            if piece is not None and piece.color == player_color:
+                self.select(square)
+            return False
+        start = self.selected
+        self.select(None)
+        return self.move_piece(start, square)
+
+    def handle(self, event, player_color):
+        """Returns False when the window is closed."""
+        if event.type == pygame.QUIT:
+            return False
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            if self.click(event.pos, player_color) and \
+                    self.game.game_status() == "ongoing":
+                self.render()
+                self.game.bot.play_turn(self.game)
+                self.sync()
+        elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            self.full_redraw = True
+        return True
+
+    def run(self, player_color="white"):
+        if self.game.turn != player_color:
+            self.game.bot.play_turn(self.game)
+            self.sync()
+        self.render()
+        while True:
+            # wait() sleeps until something happens, then the rest of the
+            # queue is drained so one frame covers the whole burst
+            events = [pygame.event.wait()] + pygame.event.get()
+            for event in events:
+                if not self.handle(event, player_color):
+                    return
+            if self.render():
+                self.clock.tick(self.fps)
+
+    def close(self):
+        self.game.bot.stop_pondering()
+        pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="play the bot in a window")
+    parser.add_argument("--color", choices=["white", "black"],
+                        default="white")
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--time", type=float, default=None)
+    parser.add_argument("--ponder", action="store_true")
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+    chess_server.play_game(args.color, fps=args.fps, depth=args.depth,
+                           time_limit=args.time, ponder=args.ponder)
+
+
+if __name__ == "__main__":
+    main()
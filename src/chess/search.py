@@ -0,0 +1,406 @@
+"""Alpha-beta search for Bot.
+
+Iterative deepening negamax with a quiescence search over captures, a
+transposition table keyed by Zobrist hash and MVV-LVA move ordering.
+A position seen before on the board or in the search line, and the
+fifty-move rule, score as draws.
+
+Selective search, each part switched on by name in ``features``:
+
+  null_move        pass the turn and prune if a shallow search still
+                   beats beta; not in check, not twice in a row, not
+                   without pieces (zugzwang), verified at high depth
+  lmr              late quiet moves are searched shallower first and
+                   only re-searched if they beat alpha
+  futility         at frontier nodes quiet moves can't raise a hopeless
+                   static eval above alpha, so they're skipped
+  razoring         near the leaves, a position far below alpha is
+                   settled by quiescence search
+  check_extension  positions in check are searched a ply deeper
+
+Moves after the first are searched with a null window (principal
+variation search), which is where most of the pruning happens.
+
+Scores are centipawns from the side to move's point of view; mates are
+MATE minus the number of plies to mate.
+"""
+import threading
+import time
+
+import chess_server
+
+MATE = 100000
+INFINITY = MATE + 1
+EXACT, LOWER, UPPER = 0, 1, 2
+DEFAULT_DEPTH = 3
+MAX_DEPTH = 64
+# a timed bot ponders for at most this many times its time_limit
+PONDER_TIME_FACTOR = 4
+FEATURES = frozenset(["null_move", "lmr", "futility", "razoring",
+                      "check_extension"])
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_VERIFY_DEPTH = 5
+FUTILITY_MARGIN = 200
+RAZOR_MARGINS = {1: 300, 2: 500}
+PIECE_VALUES = {chess_server.Pawn: 100, chess_server.Knight: 320,
+                chess_server.Bishop: 330, chess_server.Rook: 500,
+                chess_server.Queen: 900, chess_server.King: 0}
+# small nudges towards the centre so equal material isn't a coin toss
+CENTRE = [0, 1, 2, 3, 3, 2, 1, 0]
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchResult:
+    def __init__(self, move, score, pv, depth, nodes, elapsed):
+        self.move = move
+        self.score = score
+        self.pv = pv
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    def as_dict(self):
+        return {"move": self.move and chess_server.move_name(self.move),
+                "score": self.score,
+                "pv": [chess_server.move_name(move) for move in self.pv],
+                "depth": self.depth, "nodes": self.nodes,
+                "elapsed": self.elapsed}
+
+
+def evaluate(game):
+    score = 0
+    for (row, col), piece in game.board.items():
+        kind = type(piece)
+        value = PIECE_VALUES[kind]
+        if kind is chess_server.Pawn:
+            value += 5 * (row - 1 if piece.color == "white" else 6 - row)
+        elif kind is not chess_server.King:
+            value += 4 * (CENTRE[row] + CENTRE[col])
+        score += value if piece.color == "white" else -value
+    return score if game.turn == "white" else -score
+
+
+def has_pieces(game, color):
+    """Anything besides pawns and the king, where zugzwang is rare."""
+    return any(piece.color == color and
+               not isinstance(piece, (chess_server.Pawn, chess_server.King))
+               for piece in game.board.values())
+
+
+def is_quiet(game, move):
+    start, end = move
+    piece = game.board[start]
+    if end in game.board:
+        return False
+    if isinstance(piece, chess_server.Pawn):
+        return end != game.en_passant and end[0] not in (0, 7)
+    return True
+
+
+def order_key(game, move, best, killers=()):
+    if move == best:
+        return -INFINITY
+    victim = game.board.get(move[1])
+    if victim is None:
+        # quiet moves that caused a cutoff at this ply before come first
+        return -1 if move in killers else 0
+    # most valuable victim first, cheapest attacker breaking ties
+    return -10 * PIECE_VALUES[type(victim)] + \
+        PIECE_VALUES[type(game.board[move[0]])] // 100
+
+
+class Search:
+    def __init__(self, game, evaluator=evaluate, features=FEATURES):
+        self.game = game
+        self.evaluate = evaluator
+        self.features = frozenset(features)
+        unknown = self.features - FEATURES
+        if unknown:
+            raise ValueError(f"unknown search features {sorted(unknown)}")
+        self.table = {}
+        # two quiet moves per ply that caused beta cutoffs
+        self.killers = {}
+        self.root_depth = DEFAULT_DEPTH
+        self.nodes = 0
+        self.deadline = None
+        self.node_limit = None
+        # set from another thread to end the search at the next check
+        self.stopped = threading.Event()
+
+    def ordered_moves(self, best=None, captures_only=False, ply=None):
+        game = self.game
+        moves = game.pseudo_legal_moves()
+        if captures_only:
+            moves = [move for move in moves if move[1] in game.board]
+        killers = self.killers.get(ply, ())
+        moves.sort(key=lambda move: order_key(game, move, best, killers))
+        return moves
+
+    def _tick(self):
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            if self.stopped.is_set() or self.deadline is not None and \
+                    time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchTimeout()
+
+    def quiescence(self, alpha, beta):
+        self._tick()
+        stand_pat = self.evaluate(self.game)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        game = self.game
+        for move in self.ordered_moves(captures_only=True):
+            mover = game.turn
+            game.make_move(*move)
+            if game.in_check(mover):
+                game.unmake_move()
+                continue
+            score = -self.quiescence(-beta, -alpha)
+            game.unmake_move()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def negamax(self, depth, alpha, beta, ply, allow_null=True):
+        game = self.game
+        features = self.features
+        in_check = game.in_check()
+        # capped so long strings of checks can't run away
+        if in_check and "check_extension" in features and \
+                ply < 2 * self.root_depth:
+            depth += 1
+        if depth <= 0:
+            return self.quiescence(alpha, beta)
+        self._tick()
+        key = game.zobrist_hash()
+        if ply > 0 and (game.repetitions[key] > 1 or
+                        game.halfmove_clock >= 100):
+            return 0
+        entry = self.table.get(key)
+        best_move = None
+        if entry is not None:
+            entry_depth, flag, score, best_move = entry
+            if entry_depth >= depth and ply > 0:
+                if flag == EXACT or \
+                        (flag == LOWER and score >= beta) or \
+                        (flag == UPPER and score <= alpha):
+                    return score
+
+        # pruning only applies in null-window nodes off the main line
+        selective = ply > 0 and not in_check and beta - alpha == 1
+        static = self.evaluate(game) if selective else None
+        if selective and "razoring" in features and \
+                depth in RAZOR_MARGINS and \
+                static + RAZOR_MARGINS[depth] <= alpha:
+            score = self.quiescence(alpha, beta)
+            if score <= alpha:
+                return score
+        if selective and "null_move" in features and allow_null and \
+                depth > NULL_MOVE_REDUCTION and static >= beta and \
+                has_pieces(game, game.turn):
+            reduced = depth - 1 - NULL_MOVE_REDUCTION
+            game.make_null_move()
+            score = -self.negamax(reduced, -beta, -beta + 1, ply + 1, False)
+            game.unmake_move()
+            if score >= beta and depth >= NULL_MOVE_VERIFY_DEPTH:
+                # a real search without null moves must agree, in case
+                # passing was only good because of zugzwang
+                score = self.negamax(reduced, beta - 1, beta, ply, False)
+            if score >= beta:
+                return beta
+        futile = selective and "futility" in features and depth == 1 and \
+            static + FUTILITY_MARGIN <= alpha
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        legal = 0
+        for move in self.ordered_moves(best_move, ply=ply):
+            quiet = is_quiet(game, move)
+            mover = game.turn
+            game.make_move(*move)
+            if game.in_check(mover):
+                game.unmake_move()
+                continue
+            legal += 1
+            gives_check = (futile or "lmr" in features) and quiet and \
+                game.in_check()
+            if futile and quiet and not gives_check:
+                game.unmake_move()
+                best_score = max(best_score, static + FUTILITY_MARGIN)
+                continue
+            if legal == 1:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            else:
+                # principal variation search: later moves only have to be
+                # shown worse than alpha, with a null window
+                reduction = 0
+                if "lmr" in features and quiet and legal > 3 and \
+                        depth >= 3 and not in_check and not gives_check:
+                    reduction = 2 if legal > 6 else 1
+                score = -self.negamax(depth - 1 - reduction, -alpha - 1,
+                                      -alpha, ply + 1)
+                if score > alpha and reduction:
+                    score = -self.negamax(depth - 1, -alpha - 1, -alpha,
+                                          ply + 1)
+                if alpha < score < beta:
+                    score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            game.unmake_move()
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                if quiet:
+                    killers = self.killers.setdefault(ply, [])
+                    if move not in killers:
+                        killers.insert(0, move)
+                        del killers[2:]
+                break
+        if not legal:
+            return -(MATE - ply) if in_check else 0
+        flag = UPPER if best_score <= original_alpha else \
+            LOWER if best_score >= beta else EXACT
+        self.table[key] = (depth, flag, best_score, best_move)
+        return best_score
+
+    def principal_variation(self, limit):
+        pv = []
+        game = self.game
+        for _ in range(limit):
+            entry = self.table.get(game.zobrist_hash())
+            if entry is None or entry[3] is None:
+                break
+            move = entry[3]
+            if move[1] not in game.piece_moves(move[0]) or \
+                    not game.is_legal(*move):
+                break
+            pv.append(move)
+            game.make_move(*move)
+        for _ in pv:
+            game.unmake_move()
+        return pv
+
+    def run(self, depth=None, time_limit=None, nodes=None):
+        """Search to depth plies, or until time_limit seconds or nodes
+        run out, keeping the last fully searched iteration. Without a
+        time_limit, a deadline set on the search beforehand or while it
+        runs still applies."""
+        if depth is None and time_limit is None and nodes is None:
+            depth = DEFAULT_DEPTH
+        start = time.perf_counter()
+        if time_limit:
+            self.deadline = start + time_limit
+        self.node_limit = nodes
+        self.nodes = 0
+        result = None
+        current = 0
+        while depth is None or current < depth:
+            current += 1
+            self.root_depth = current
+            saved = len(self.game.move_stack)
+            try:
+                score = self.negamax(current, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                while len(self.game.move_stack) > saved:
+                    self.game.unmake_move()
+                break
+            pv = self.principal_variation(current)
+            result = SearchResult(pv[0] if pv else None, score, pv, current,
+                                  self.nodes, time.perf_counter() - start)
+            if abs(score) >= MATE - current:
+                break  # a forced mate won't get any shorter
+        if result is None:
+            # not even depth 1 finished, fall back to any legal move
+            moves = self.game.legal_moves()
+            result = SearchResult(moves[0] if moves else None, 0,
+                                  moves[:1], 0, self.nodes,
+                                  time.perf_counter() - start)
+        return result
+
+
+def search(game, depth=None, time_limit=None, nodes=None, features=FEATURES,
+           evaluator=evaluate):
+    return Search(game, evaluator, features).run(depth, time_limit, nodes)
+
+
+class Ponderer:
+    """Searches the position after the expected reply on a background
+    thread while the opponent thinks.
+
+    resolve() hands the search over if the opponent played the expected
+    move and cancels it otherwise.
+    """
+
+    def __init__(self):
+        self.thread = None
+        self.search = None
+        self.key = None
+        self.result = None
+        self.hits = 0
+        self.misses = 0
+
+    def __reduce__(self):
+        # threads don't pickle, a copy starts out idle
+        return Ponderer, ()
+
+    @property
+    def active(self):
+        return self.thread is not None
+
+    def start(self, game, reply, depth=None, time_limit=None,
+              evaluator=evaluate, nodes=None, features=FEATURES):
+        """Ponder game after reply with the bot's own search settings.
+        A timed bot ponders for at most PONDER_TIME_FACTOR times its
+        time_limit, or less once resolve() starts the real clock."""
+        self.stop()
+        board = game.copy()
+        if reply not in board.legal_moves():
+            return False
+        board.make_move(*reply)
+        self.key = board.zobrist_hash()
+        # stateful evaluators get their own copy for this thread
+        fork = getattr(evaluator, "fork", None)
+        self.search = Search(board, fork() if fork else evaluator, features)
+        if time_limit:
+            self.search.deadline = time.perf_counter() + \
+                PONDER_TIME_FACTOR * time_limit
+        self.result = None
+        depth = depth or (MAX_DEPTH if time_limit or nodes else DEFAULT_DEPTH)
+        self.thread = threading.Thread(target=self._run, args=(depth, nodes),
+                                       daemon=True)
+        self.thread.start()
+        return True
+
+    def _run(self, depth, nodes):
+        self.result = self.search.run(depth, nodes=nodes)
+
+    def stop(self):
+        if self.thread is not None:
+            self.search.stopped.set()
+            self.thread.join()
+        self.thread = None
+        self.search = None
+
+    def resolve(self, game, time_limit=None):
+        """The search result for game if it is the pondered position,
+        otherwise None. Pondering is over either way."""
+        if self.thread is None:
+            return None
+        if game.zobrist_hash() != self.key:
+            self.misses += 1
+            self.stop()
+            return None
+        self.hits += 1
+        if time_limit:
+            self.search.deadline = time.perf_counter() + time_limit
+        self.thread.join()
+        result = self.result
+        self.thread = None
+        self.search = None
+        return result
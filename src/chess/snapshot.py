@@ -0,0 +1,254 @@
+"""Snapshot and restore game sessions as compact bytes.
+
+A snapshot is:
+
+  16 bytes  header: magic, version, halfmove clock, fullmove number and
+            the number of moves, hashes and settings bytes that follow
+  32 bytes  the current position, a records.encode_position record
+  2 bytes   per move played, packed as in records.encode_move
+  8 bytes   per Zobrist hash since the last capture or pawn move, which
+            is all the threefold repetition rule can still see
+  JSON      the bot's settings (colour, search limits, book, tablebase
+            and NNUE weights by path)
+
+Restoring decodes the position and rebuilds the bot. It doesn't replay
+the moves, so move_stack starts empty; the played moves are kept in
+Game.earlier_moves for later snapshots. Books, tablebases and networks
+are opened once per process and shared between restored games.
+
+FileStore and SqliteStore keep snapshots by game id, so any worker with
+access to the store can pick a game up. A game's version is the number
+of moves played. save() only replaces the snapshot the caller started
+from and raises ConflictError when another worker saved first.
+"""
+import array
+import fcntl
+import json
+import os
+import sqlite3
+import struct
+
+import chess_server
+import records
+
+HEADER = struct.Struct("<4sBxHHHHH")
+MAGIC = b"CHGS"
+VERSION = 1
+
+_books = {}
+_tablebases = {}
+_networks = {}
+
+
+def played_moves(game):
+    """(move, promotion) pairs for every move played in the game."""
+    moves = list(game.earlier_moves)
+    for record in game.move_stack:
+        from_square, to_square, piece, placed = record[:4]
+        if from_square is None:
+            raise ValueError("can't snapshot a game in the middle of a search")
+        promotion = type(placed).__name__.lower() if placed is not piece \
+            else None
+        moves.append(((from_square, to_square), promotion))
+    return moves
+
+
+def bot_settings(bot):
+    settings = {"color": bot.color}
+    for name in ("depth", "time_limit", "nodes", "ponder"):
+        if getattr(bot, name):
+            settings[name] = getattr(bot, name)
+    if bot.features is not None:
+        settings["features"] = sorted(bot.features)
+    if bot.book is not None:
+        settings["book"] = bot.book.path
+    if bot.tablebase is not None:
+        settings["tablebase"] = bot.tablebase.directory
+    if bot.evaluator is not None:
+        path = getattr(getattr(bot.evaluator, "network", None), "path", None)
+        if path is None:
+            raise ValueError("only evaluators with saved weights can be "
+                             "snapshotted")
+        settings["nnue"] = path
+    return settings
+
+
+def make_bot(settings):
+    settings = dict(settings)
+    color = settings.pop("color")
+    path = settings.pop("book", None)
+    if path is not None:
+        import book
+        if path not in _books:
+            _books[path] = book.OpeningBook(path)
+        settings["book"] = _books[path]
+    directory = settings.pop("tablebase", None)
+    if directory is not None:
+        import tablebase
+        if directory not in _tablebases:
+            _tablebases[directory] = tablebase.Tablebase(directory)
+        settings["tablebase"] = _tablebases[directory]
+    path = settings.pop("nnue", None)
+    if path is not None:
+        import nnue
+        if path not in _networks:
+            _networks[path] = nnue.Network.load(path)
+        settings["evaluator"] = nnue.Evaluator(_networks[path])
+    return chess_server.Bot(color, parallel=False, **settings)
+
+
+def snapshot(game):
+    moves = records.encode_moves(played_moves(game))
+    game.zobrist_hash()
+    hashes = array.array("Q", game.hash_history[-(game.halfmove_clock + 1):])
+    settings = json.dumps(bot_settings(game.bot),
+                          separators=(",", ":")).encode()
+    header = HEADER.pack(MAGIC, VERSION, min(game.halfmove_clock, 0xFFFF),
+                         game.fullmove_number, len(moves) // 2, len(hashes),
+                         len(settings))
+    return b"".join([header, records.encode_position(game), moves,
+                     hashes.tobytes(), settings])
+
+
+def restore(data):
+    (magic, version, halfmove_clock, fullmove_number, move_count,
+     hash_count, settings_size) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a game snapshot")
+    if version != VERSION:
+        raise ValueError(f"unsupported snapshot version {version}")
+    offset = HEADER.size
+    position = data[offset:offset + records.RECORD_SIZE]
+    offset += records.RECORD_SIZE
+    moves = data[offset:offset + 2 * move_count]
+    offset += 2 * move_count
+    hashes = array.array("Q")
+    hashes.frombytes(data[offset:offset + 8 * hash_count])
+    offset += 8 * hash_count
+    settings = json.loads(data[offset:offset + settings_size])
+
+    game = records.decode_position(position)
+    game.bot = make_bot(settings)
+    game.halfmove_clock = halfmove_clock
+    game.fullmove_number = fullmove_number
+    game.earlier_moves = records.decode_moves(moves)
+    game.hash_history = hashes.tolist()
+    game.repetitions.clear()
+    game.repetitions.update(game.hash_history)
+    return game
+
+
+class ConflictError(ValueError):
+    """The stored game moved on since the caller loaded it."""
+
+
+def version(game):
+    """Moves played so far, which orders the snapshots of one game."""
+    return len(game.earlier_moves) + len(game.move_stack)
+
+
+def data_version(data):
+    return HEADER.unpack_from(data)[4]
+
+
+class FileStore:
+    """One file per game in a directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, game_id):
+        return os.path.join(self.directory, f"{game_id}.snap")
+
+    def version(self, game_id):
+        try:
+            with open(self.path(game_id), "rb") as f:
+                return data_version(f.read(HEADER.size))
+        except FileNotFoundError:
+            return None
+
+    def save(self, game_id, game, expected=None):
+        """Store game if the stored version is still expected, None
+        meaning a new game; raises ConflictError otherwise."""
+        path = self.path(game_id)
+        with open(path + ".lock", "wb") as lock:
+            # writers of one game take turns, readers never wait
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self.version(game_id) != expected:
+                raise ConflictError(f"game {game_id} was changed elsewhere")
+            with open(path + ".tmp", "wb") as f:
+                f.write(snapshot(game))
+            # a reader never sees half a snapshot
+            os.replace(path + ".tmp", path)
+
+    def load(self, game_id):
+        try:
+            with open(self.path(game_id), "rb") as f:
+                return restore(f.read())
+        except FileNotFoundError:
+            return None
+
+    def delete(self, game_id):
+        for path in (self.path(game_id), self.path(game_id) + ".lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        pass
+
+
+class SqliteStore:
+    """Snapshots in one SQLite table, safe to share between processes."""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS games (id TEXT PRIMARY KEY, "
+            "version INTEGER NOT NULL, data BLOB NOT NULL)")
+        self.connection.commit()
+
+    def version(self, game_id):
+        row = self.connection.execute(
+            "SELECT version FROM games WHERE id = ?", (game_id,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, game_id, game, expected=None):
+        """Store game if the stored version is still expected, None
+        meaning a new game; raises ConflictError otherwise."""
+        data = snapshot(game)
+        with self.connection:
+            if expected is None:
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO games VALUES (?, ?, ?)",
+                    (game_id, version(game), data))
+            else:
+                cursor = self.connection.execute(
+                    "UPDATE games SET data = ?, version = ? "
+                    "WHERE id = ? AND version = ?",
+                    (data, version(game), game_id, expected))
+        if cursor.rowcount != 1:
+            raise ConflictError(f"game {game_id} was changed elsewhere")
+
+    def load(self, game_id):
+        row = self.connection.execute(
+            "SELECT data FROM games WHERE id = ?", (game_id,)).fetchone()
+        return restore(row[0]) if row else None
+
+    def delete(self, game_id):
+        with self.connection:
+            self.connection.execute("DELETE FROM games WHERE id = ?",
+                                    (game_id,))
+
+    def close(self):
+        self.connection.close()
+
+
+def open_store(location):
+    """SqliteStore for a .db / .sqlite path, FileStore otherwise."""
+    if location.endswith((".db", ".sqlite")):
+        return SqliteStore(location)
+    return FileStore(location)
@@ -0,0 +1,467 @@
+"""Endgame tablebases for small piece sets by retrograde analysis.
+
+python tablebase.py generate KQvK KRvK KPvK --workers 8 --dir tablebases
+python tablebase.py probe "8/8/8/3k4/8/8/2Q5/4K3 w - - 0 1"
+
+A table covers one material signature, e.g. KRvK, with white holding the
+stronger side; positions with the colours reversed are probed through
+their mirror image. Every position gets an index
+
+    side * 64 ** n + sum(square_i * 64 ** i)
+
+over the pieces in signature order (white king, black king, white
+pieces, black pieces), so probing is a little arithmetic and two array
+reads. Each table is two files:
+
+  <sig>.wdl  2 bits per position, 4 positions per byte:
+             0 invalid, 1 loss, 2 draw, 3 win for the side to move
+  <sig>.dtm  1 byte per position, plies to mate (capped at 255)
+
+Generation runs in two phases. Workers enumerate chunks of the index
+space in parallel with the move generator from chess_server and save
+each position's successors to <sig>.parts/; an interrupted run picks up
+after the last finished chunk. Captures and promotions lead into smaller
+tables, which are generated first. The solve phase then walks distance
+by distance (mates at 0, wins one ply after a lost successor, losses
+once every successor is won for the opponent), streaming the chunk
+files so memory holds only the result arrays.
+
+En passant rights and castling are ignored, as they can't arise in the
+positions these tables are meant for often enough to matter.
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+
+import numpy as np
+
+import chess_server
+
+INVALID, LOSS, DRAW, WIN = 0, 1, 2, 3
+NORMAL, BAD, MATE, STALEMATE = 0, 1, 2, 3
+NO_DISTANCE = 0xFFFF
+LETTERS = {"K": chess_server.King, "Q": chess_server.Queen,
+           "R": chess_server.Rook, "B": chess_server.Bishop,
+           "N": chess_server.Knight, "P": chess_server.Pawn}
+ORDER = "KQRBNP"
+VALUES = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+CHUNK = 1 << 16
+
+
+def letter_of(piece):
+    return chess_server.display_name(piece)[1].upper()
+
+
+def canonical(white, black):
+    """Signature with the stronger side as white, and whether that swapped
+    the colours of the position it came from."""
+    white = "".join(sorted(white, key=ORDER.index))
+    black = "".join(sorted(black, key=ORDER.index))
+    key = lambda side: (sum(VALUES[letter] for letter in side), len(side),
+                        [-ORDER.index(letter) for letter in side])
+    if key(black) > key(white):
+        return f"{black}v{white}", True
+    return f"{white}v{black}", False
+
+
+def signature_of(board):
+    white = [letter_of(p) for p in board.values() if p.color == "white"]
+    black = [letter_of(p) for p in board.values() if p.color == "black"]
+    return canonical(white, black)
+
+
+def slots(signature):
+    """(letter, color) per piece in index order."""
+    white, black = signature.split("v")
+    return [("K", "white"), ("K", "black")] + \
+        [(letter, "white") for letter in white[1:]] + \
+        [(letter, "black") for letter in black[1:]]
+
+
+def table_size(signature):
+    return 2 * 64 ** len(slots(signature))
+
+
+def dependencies(signature):
+    """Smaller signatures reachable by one capture or promotion."""
+    white, black = signature.split("v")
+    found = set()
+    for side, other, is_white in ((white, black, True), (black, white, False)):
+        for i, letter in enumerate(side):
+            if letter == "K":
+                continue
+            rest = side[:i] + side[i + 1:]
+            pair = (rest, other) if is_white else (other, rest)
+            found.add(canonical(*pair)[0])
+            if letter == "P":
+                for promoted in "QRBN":
+                    changed = side[:i] + promoted + side[i + 1:]
+                    pair = (changed, other) if is_white else (other, changed)
+                    found.add(canonical(*pair)[0])
+    return sorted(found - {"KvK"}, key=lambda name: (len(name), name))
+
+
+def mirrored(square):
+    return 7 - square[0], square[1]
+
+
+def encode(signature_slots, placed, turn):
+    """Index of a position given the square of every slot."""
+    index = 0
+    for i, square in enumerate(placed):
+        index += (square[0] * 8 + square[1]) * 64 ** i
+    if turn == "black":
+        index += 64 ** len(signature_slots)
+    return index
+
+
+def position_index(board, turn):
+    """(signature, index) of a position, mirrored onto the stronger side
+    when black holds it."""
+    signature, swap = signature_of(board)
+    wanted = slots(signature)
+    pieces = {}
+    for square, piece in board.items():
+        color = piece.color
+        if swap:
+            square = mirrored(square)
+            color = chess_server.opponent(color)
+        pieces.setdefault((letter_of(piece), color), []).append(square)
+    for squares in pieces.values():
+        squares.sort()
+    placed = [pieces[slot].pop(0) for slot in wanted]
+    if swap:
+        turn = chess_server.opponent(turn)
+    return signature, encode(wanted, placed, turn)
+
+
+class Tablebase:
+    """O(1) probes into the tables found in a directory."""
+
+    def __init__(self, directory="tablebases"):
+        self.directory = directory
+        self.tables = {}
+
+    # memmaps don't pickle; bots carry the directory to worker processes
+    def __getstate__(self):
+        return {"directory": self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"])
+
+    def table(self, signature):
+        if signature not in self.tables:
+            base = os.path.join(self.directory, signature)
+            if os.path.exists(base + ".wdl") and os.path.exists(base + ".dtm"):
+                self.tables[signature] = (
+                    np.memmap(base + ".wdl", dtype=np.uint8, mode="r"),
+                    np.memmap(base + ".dtm", dtype=np.uint8, mode="r"))
+            else:
+                self.tables[signature] = None
+        return self.tables[signature]
+
+    def covers(self, board):
+        if len(board) == 2:
+            return True
+        return len(board) <= 4 and \
+            self.table(signature_of(board)[0]) is not None
+
+    def probe_board(self, board, turn):
+        """(wdl, plies to mate) for the side to move, None if no table."""
+        if len(board) == 2:
+            return DRAW, 0
+        if len(board) > 4:
+            return None
+        signature, index = position_index(board, turn)
+        table = self.table(signature)
+        if table is None:
+            return None
+        wdl, dtm = table
+        value = int(wdl[index >> 2]) >> ((index & 3) * 2) & 3
+        return value, int(dtm[index])
+
+    def probe(self, game):
+        return self.probe_board(game.board, game.turn)
+
+    def best_move(self, game):
+        """The fastest win, else a draw, else the longest loss."""
+        best, best_key = None, None
+        for start, end in game.legal_moves():
+            piece = game.board[start]
+            promotions = ["queen", "rook", "bishop", "knight"] \
+                if isinstance(piece, chess_server.Pawn) and end[0] in (0, 7) \
+                else [None]
+            for promotion in promotions:
+                game.make_move(start, end, promotion)
+                result = self.probe(game)
+                if result is None and not game.legal_moves():
+                    result = (LOSS, 0) if game.in_check() else (DRAW, 0)
+                game.unmake_move()
+                if result is None:
+                    return None
+                wdl, distance = result
+                # the opponent's loss is our win
+                key = {LOSS: (2, -distance), DRAW: (1, 0),
+                       WIN: (0, distance)}[wdl]
+                if best_key is None or key > best_key:
+                    best, best_key = (start, end), key
+        return best
+
+
+# ---- generation -------------------------------------------------------
+
+_worker = {}
+
+
+def _init_worker(signature, directory):
+    game = chess_server.Game({}, 60, None, None)
+    _worker.update(signature=signature, slots=slots(signature), game=game,
+                   tablebase=Tablebase(directory))
+
+
+def _outcome(game, tablebase):
+    """Result of the position after a capture or promotion, for the side
+    to move in it."""
+    result = tablebase.probe(game)
+    if result is not None:
+        return result
+    if not game.legal_moves():
+        return (LOSS, 0) if game.in_check() else (DRAW, 0)
+    raise RuntimeError(f"no table for {signature_of(game.board)[0]}")
+
+
+def analyse_chunk(start, end):
+    """Successor lists for indexes [start, end)."""
+    signature_slots = _worker["slots"]
+    game = _worker["game"]
+    tablebase = _worker["tablebase"]
+    n = len(signature_slots)
+    count = end - start
+    status = np.zeros(count, dtype=np.int8)
+    counts = np.zeros(count, dtype=np.int32)
+    ext_win = np.full(count, NO_DISTANCE, dtype=np.uint16)
+    ext_loss = np.zeros(count, dtype=np.uint16)
+    ext_hold = np.zeros(count, dtype=bool)
+    targets = []
+    kinds = [LETTERS[letter] for letter, _ in signature_slots]
+    for offset in range(count):
+        index = start + offset
+        turn = "black" if index >= 64 ** n else "white"
+        rest = index % 64 ** n
+        placed = []
+        for _ in range(n):
+            placed.append(divmod(rest % 64, 8))
+            rest //= 64
+        if len(set(placed)) < n:
+            status[offset] = BAD
+            continue
+        if any(kind is chess_server.Pawn and square[0] in (0, 7)
+               for kind, square in zip(kinds, placed)):
+            status[offset] = BAD
+            continue
+        board = {}
+        pieces = []
+        for (letter, color), kind, square in zip(signature_slots, kinds,
+                                                 placed):
+            piece = kind(color)
+            if hasattr(piece, "has_moved"):
+                piece.has_moved = True  # no castling in tablebases
+            board[square] = piece
+            pieces.append(piece)
+        game.board = board
+        game.turn = turn
+        game.en_passant = None
+        if game.in_check(chess_server.opponent(turn)):
+            status[offset] = BAD
+            continue
+        moves = game.legal_moves()
+        if not moves:
+            status[offset] = MATE if game.in_check() else STALEMATE
+            continue
+        for move_start, move_end in moves:
+            mover = board[move_start]
+            promotions = ["queen", "rook", "bishop", "knight"] \
+                if isinstance(mover, chess_server.Pawn) and \
+                move_end[0] in (0, 7) else [None]
+            for promotion in promotions:
+                captured = game.make_move(move_start, move_end, promotion)
+                if captured is None and promotion is None:
+                    moved = [move_end if p is mover else sq
+                             for p, sq in zip(pieces, placed)]
+                    targets.append(encode(signature_slots, moved, game.turn))
+                    counts[offset] += 1
+                else:
+                    wdl, distance = _outcome(game, tablebase)
+                    if wdl == LOSS:
+                        ext_win[offset] = min(ext_win[offset], distance + 1)
+                    elif wdl == WIN:
+                        ext_loss[offset] = max(ext_loss[offset], distance + 1)
+                    else:
+                        ext_hold[offset] = True
+                game.unmake_move()
+    return status, counts, np.array(targets, dtype=np.int64), ext_win, \
+        ext_loss, ext_hold
+
+
+def _chunk_path(parts, start):
+    return os.path.join(parts, f"chunk_{start:012d}.npz")
+
+
+def _run_chunk(args):
+    start, end, parts = args
+    status, counts, targets, ext_win, ext_loss, ext_hold = \
+        analyse_chunk(start, end)
+    path = _chunk_path(parts, start)
+    np.savez(path + ".tmp.npz", start=start, status=status, counts=counts,
+             targets=targets, ext_win=ext_win, ext_loss=ext_loss,
+             ext_hold=ext_hold)
+    # rename is atomic, a chunk file on disk is always complete
+    os.replace(path + ".tmp.npz", path)
+    return end - start
+
+
+def solve(parts, size):
+    """Distance-ordered retrograde pass over the saved successor lists."""
+    wdl = np.zeros(size, dtype=np.int8)
+    dtm = np.zeros(size, dtype=np.uint16)
+    chunk_files = sorted(glob.glob(os.path.join(parts, "chunk_*.npz")))
+    pending = []
+    for path in chunk_files:
+        with np.load(path) as data:
+            start = int(data["start"])
+            status = data["status"]
+            span = slice(start, start + len(status))
+            wdl[span] = np.where(status == MATE, LOSS,
+                                 np.where(status == STALEMATE, DRAW, -1))
+            wdl[span][status == BAD] = INVALID
+            if (status == NORMAL).any():
+                pending.append(path)
+    # -1 marks positions still unknown
+    last_external = 0
+    for path in pending:
+        with np.load(path) as data:
+            ext_win = data["ext_win"]
+            ext_loss = data["ext_loss"]
+            finite = ext_win[ext_win != NO_DISTANCE]
+            last_external = max(last_external,
+                                int(finite.max()) if finite.size else 0,
+                                int(ext_loss.max()))
+    distance = 0
+    while True:
+        distance += 1
+        changed = False
+        updates = []
+        for path in pending:
+            with np.load(path) as data:
+                start = int(data["start"])
+                status = data["status"]
+                counts = data["counts"]
+                targets = data["targets"]
+                owners = np.repeat(np.arange(len(counts)), counts)
+                span = slice(start, start + len(status))
+                unknown = wdl[span] == -1
+                if not unknown.any():
+                    continue
+                target_wdl = wdl[targets]
+                target_dtm = dtm[targets]
+                lost = (target_wdl == LOSS) & (target_dtm == distance - 1)
+                wins = np.bincount(owners, weights=lost,
+                                   minlength=len(counts)) > 0
+                wins |= data["ext_win"] == distance
+                won_for_them = np.bincount(owners,
+                                           weights=target_wdl == WIN,
+                                           minlength=len(counts))
+                losses = (won_for_them == counts) & ~data["ext_hold"] & \
+                    (data["ext_win"] == NO_DISTANCE) & \
+                    (data["ext_loss"] <= distance) & ~wins
+                wins &= unknown
+                losses &= unknown
+                if wins.any() or losses.any():
+                    updates.append((start, wins, losses))
+        # applied after the sweep so every chunk sees the same distance
+        for start, wins, losses in updates:
+            span = slice(start, start + len(wins))
+            wdl[span][wins] = WIN
+            dtm[span][wins] = distance
+            wdl[span][losses] = LOSS
+            dtm[span][losses] = distance
+            changed = True
+        if not changed and distance > last_external:
+            break
+    wdl[wdl == -1] = DRAW
+    return wdl.astype(np.uint8), np.minimum(dtm, 255).astype(np.uint8)
+
+
+def pack_wdl(wdl):
+    padded = np.zeros((len(wdl) + 3) // 4 * 4, dtype=np.uint8)
+    padded[:len(wdl)] = wdl
+    quads = padded.reshape(-1, 4)
+    return quads[:, 0] | quads[:, 1] << 2 | quads[:, 2] << 4 | \
+        quads[:, 3] << 6
+
+
+def generate(signature, directory="tablebases", workers=None,
+             chunk=CHUNK, log=print):
+    """Build one table and, first, any smaller table it depends on."""
+    signature = canonical(*signature.split("v"))[0]
+    base = os.path.join(directory, signature)
+    if os.path.exists(base + ".wdl") and os.path.exists(base + ".dtm"):
+        return
+    for dependency in dependencies(signature):
+        generate(dependency, directory, workers, chunk, log)
+    parts = base + ".parts"
+    os.makedirs(parts, exist_ok=True)
+    size = table_size(signature)
+    todo = [(start, min(start + chunk, size), parts)
+            for start in range(0, size, chunk)
+            if not os.path.exists(_chunk_path(parts, start))]
+    log(f"{signature}: {size} positions, {len(todo)} chunks to analyse")
+    if todo:
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(signature, directory)) as pool:
+            done = 0
+            for finished in pool.imap_unordered(_run_chunk, todo):
+                done += finished
+                log(f"{signature}: analysed {done} positions")
+    wdl, dtm = solve(parts, size)
+    pack_wdl(wdl).tofile(base + ".wdl.tmp")
+    dtm.tofile(base + ".dtm.tmp")
+    os.replace(base + ".dtm.tmp", base + ".dtm")
+    os.replace(base + ".wdl.tmp", base + ".wdl")
+    for path in glob.glob(os.path.join(parts, "chunk_*.npz")):
+        os.remove(path)
+    os.rmdir(parts)
+    log(f"{signature}: done")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate")
+    generate_parser.add_argument("signatures", nargs="+")
+    generate_parser.add_argument("--dir", default="tablebases")
+    generate_parser.add_argument("--workers", type=int, default=None)
+    generate_parser.add_argument("--chunk", type=int, default=CHUNK)
+    probe_parser = commands.add_parser("probe")
+    probe_parser.add_argument("fen")
+    probe_parser.add_argument("--dir", default="tablebases")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        for signature in args.signatures:
+            generate(signature, args.dir, args.workers, args.chunk)
+    else:
+        game = chess_server.Game.from_fen(args.fen)
+        result = Tablebase(args.dir).probe(game)
+        if result is None:
+            print("not in the tablebases")
+        else:
+            wdl, distance = result
+            names = {LOSS: "loss", DRAW: "draw", WIN: "win"}
+            print(f"{names[wdl]} in {distance} plies" if wdl != DRAW
+                  else "draw")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,136 @@
-# pip install chromadb
+# pip install chromadb (only for VECTOR_BACKEND = "chroma")
+import copy
 import pprint
-import re
-import chromadb
-from chromadb.config import Settings
 import json
-from transformers import AutoTokenizer, AutoModel
-import torch
+import os
+
+import corpus
+import inference
+from cache import LRUCache, TTLCache
 
 RELOAD_DB = True
+QUERY_CACHE_SIZE = 1024
+# seconds a run_query result stays valid, None turns the result cache off.
+# Only read when result_cache is built, change result_cache.ttl at runtime.
+RESULT_CACHE_TTL = 300
+# torch (fp32), int8 (dynamically quantized torch) or onnx, see inference.py
+EMBEDDING_BACKEND = os.environ.get("CHESS_EMBEDDING_BACKEND", "torch")
+# intra-op threads for the backend, 0 keeps the library default
+EMBEDDING_THREADS = int(os.environ.get("CHESS_EMBEDDING_THREADS", "0"))
+# chroma, or numpy for the in-process store in vectorstore.py
+VECTOR_BACKEND = os.environ.get("CHESS_VECTOR_BACKEND", "chroma")
+CHROMA_PATH = os.path.join("data", "chroma.db")
+NUMPY_PATH = os.path.join("data", "vectors")
+# float16 halves the numpy store on disk and in memory
+NUMPY_DTYPE = os.environ.get("CHESS_VECTOR_DTYPE", "float32")
+# "" ranks by embeddings alone. rrf, linear and rerank take the BM25 top
+# LEXICAL_CANDIDATES first and re-rank only those, see hybrid_query
+FUSION = os.environ.get("CHESS_FUSION", "")
+LEXICAL_CANDIDATES = 50
+# weight of the BM25 score, scaled to 0..1, in linear fusion
+LINEAR_ALPHA = 0.3
+RRF_K = 60
+
+# the store and the model are loaded on first use, not at import
+collection = None
+backend = None
+lexical_index = None
+
+embedding_cache = LRUCache(maxsize=QUERY_CACHE_SIZE)
+result_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+# bumped on every upsert so cached results never outlive the data they came from
+collection_version = 0
+
+
+def open_collection(name=None):
+    """A collection with chroma's upsert and query methods."""
+    name = name or VECTOR_BACKEND
+    if name == "numpy":
+        import vectorstore
+        return vectorstore.NumpyCollection(NUMPY_PATH, dtype=NUMPY_DTYPE)
+    if name == "chroma":
+        import chromadb
+        from chromadb.config import Settings
+        chroma_client = chromadb.PersistentClient(path=CHROMA_PATH,
+                                                  settings=Settings(
+                                                      anonymized_telemetry=False
+                                                  )
+                                                  )
+        return chroma_client.get_or_create_collection(name="chess")
+    raise ValueError(f"unknown vector backend {name!r}")
+
+
+def get_collection():
+    global collection
+    if collection is None:
+        collection = open_collection()
+    return collection
+
+
+def flush():
+    """Persist upserts for stores that buffer them (numpy); chroma writes
+    as it goes."""
+    if collection is not None and hasattr(collection, "flush"):
+        collection.flush()
 
-chroma_client = chromadb.PersistentClient(path="data/chroma.db",
-                                          settings=Settings(
-                                              anonymized_telemetry=False
-                                          )
-                                          )
-collection = chroma_client.get_or_create_collection(name="chess")
 
-tokenizer = AutoTokenizer.from_pretrained(
-    "sentence-transformers/all-MiniLM-L6-v2")
-model = AutoModel.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
+def get_lexical_index():
+    """BM25 index over the collection, built from it on first use and
+    kept current by upsert()."""
+    global lexical_index
+    if lexical_index is None:
+        import lexical
+        index = lexical.BM25Index()
+        stored = get_collection().get(include=["documents", "metadatas"])
+        index.add(stored["ids"], stored["documents"],
+                  [metadata_labels(metadata or {})
+                   for metadata in stored["metadatas"]])
+        lexical_index = index
+    return lexical_index
+
+
+def get_backend():
+    global backend
+    if backend is None:
+        backend = inference.load_backend(EMBEDDING_BACKEND,
+                                         threads=EMBEDDING_THREADS or None)
+    return backend
 
 
 def generate_embedding(text):
-    inputs = tokenizer(text, return_tensors="pt",
-                       truncation=True, padding=True)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    embedding = outputs.last_hidden_state.mean(dim=1).squeeze().tolist()
-    # print(f"Generated embedding: {embedding}")
-    return embedding
+    return get_backend().embed([text])[0]
+
+
+def generate_embeddings(texts: list, batch_size: int = 32) -> list:
+    embeddings = []
+    for start in range(0, len(texts), batch_size):
+        embeddings.extend(get_backend().embed(texts[start:start + batch_size]))
+    return embeddings
+
+
+def normalize_query(query: str) -> str:
+    # the MiniLM tokenizer is uncased, so case and spacing don't change the embedding
+    return " ".join(query.lower().split())
+
+
+def embed_query(query: str):
+    # cached as a tuple so a caller mutating the returned list can't corrupt it
+    key = normalize_query(query)
+    embedding = embedding_cache.get(key)
+    if embedding is None:
+        embedding = tuple(generate_embedding(key))
+        embedding_cache.put(key, embedding)
+    return list(embedding)
+
 
+def cache_stats() -> dict:
+    return {"embeddings": embedding_cache.stats(),
+            "results": result_cache.stats(),
+            "collection_version": collection_version}
 
-def query_source_data():
-    with open("data/chroma.db/info.txt") as f:
-        content = f.read()
-    chess_moves = content.split("\n")
-    return [re.sub(' +', ' ', chess_move.replace("\n", "")) for chess_move in chess_moves]
+
+def query_source_data(path=corpus.DATA_PATH):
+    yield from corpus.iter_lines(path)
 
 
 def query_source_data_inline():
@@ -47,48 +142,188 @@ def query_source_data_inline():
     ]
 
 
-def load_data(results: list) -> None:
-    documents = [{"text": text, "labels": labels} for labels, text in results]
-    ids = [f"id{num}" for num in range(1, len(documents) + 1)]
-    embeddings = [generate_embedding(doc["text"]) for doc in documents]
-    documents_json = [json.dumps(doc) for doc in documents]
-    # print(f"Upserting documents: {documents_json}")
-    # print(f"With embeddings: {embeddings}")
-    collection.upsert(
-        documents=documents_json,
+def load_data(results: list, start: int = 1) -> None:
+    embeddings = generate_embeddings([text for labels, text in results])
+    upsert(results, embeddings, start)
+
+
+def label_metadata(labels) -> dict:
+    # chroma metadata values must be scalars, so every label gets its own
+    # boolean key that a where clause can match; "labels" keeps the list
+    metadata = {"labels": ",".join(labels)}
+    metadata.update({f"label:{label}": True for label in labels})
+    return metadata
+
+
+def metadata_labels(metadata: dict) -> list:
+    return metadata["labels"].split(",") if metadata.get("labels") else []
+
+
+def translate_where(where):
+    """Turn {"label": "castle"} style filters into chroma metadata filters.
+
+    {"label": {"$in": [...]}} matches any of the labels, everything else
+    is passed to chroma unchanged.
+    """
+    if where is None:
+        return None
+    if isinstance(where, dict) and "label" in where:
+        where = dict(where)
+        label = where.pop("label")
+        if isinstance(label, dict) and "$in" in label:
+            if not label["$in"]:
+                raise ValueError("label $in needs at least one label")
+            clauses = [{f"label:{name}": True} for name in label["$in"]]
+            clause = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+        else:
+            clause = {f"label:{label}": True}
+        if not where:
+            return clause
+        return {"$and": [clause, translate_where(where)]}
+    if isinstance(where, dict):
+        return {key: [translate_where(part) for part in value]
+                if key in ("$and", "$or") else value
+                for key, value in where.items()}
+    return where
+
+
+def upsert(results: list, embeddings: list, start: int = 1) -> None:
+    global collection_version
+    ids = [f"id{num}" for num in range(start, start + len(results))]
+    get_collection().upsert(
+        documents=[text for labels, text in results],
+        metadatas=[label_metadata(labels) for labels, text in results],
         ids=ids,
         embeddings=embeddings
     )
+    if lexical_index is not None:
+        lexical_index.add(ids, [text for labels, text in results],
+                          [labels for labels, text in results])
+    collection_version += 1
+    result_cache.clear()
+
+
+def run_query(query: str, k: int = 3, where: dict = None, fusion: str = None):
+    # collection.query leaves embeddings out of its result for performance,
+    # documents and distances are all callers need from a hit.
+    # where filters on metadata before the nearest neighbour search, e.g.
+    # run_query("how do I castle", where={"label": "castle"})
+    # fusion overrides FUSION for this query
+    # every caller gets its own copy, the cached result is never handed out
+    fusion = FUSION if fusion is None else fusion
+    use_result_cache = result_cache.ttl is not None
+    key = (normalize_query(query), k, json.dumps(where, sort_keys=True),
+           fusion, collection_version)
+    if use_result_cache:
+        results = result_cache.get(key)
+        if results is not None:
+            return copy.deepcopy(results)
+    if fusion:
+        results = hybrid_query(query, k, where, fusion)
+    else:
+        results = dense_query(query, k, where)
+    if use_result_cache:
+        result_cache.put(key, copy.deepcopy(results))
+    return results
 
 
-def run_query(query: str):
-    # note collection query return shows embeddings as None
-    # but per chromadb this is for performance
-    # now shifted to creating and returning more_results
-    # need to investigate if metadata can be useful
-    query_embedding = generate_embedding(query)
-    collection.query(
-        query_embeddings=[query_embedding],
-        n_results=3
+def dense_query(query: str, k: int = 3, where: dict = None):
+    return get_collection().query(
+        query_embeddings=[embed_query(query)],
+        n_results=k,
+        where=translate_where(where),
+        include=['documents', 'metadatas', 'distances']
     )
-    more_results = collection.get(
-        include=['embeddings', 'documents', 'metadatas'])
-    return more_results
+
+
+def fuse(lexical_scores, similarities, fusion):
+    """Combined scores, higher is better, for candidates in BM25 order."""
+    import numpy as np
+    lexical_scores = np.asarray(lexical_scores, dtype=np.float32)
+    similarities = np.asarray(similarities, dtype=np.float32)
+    if fusion == "rerank":
+        return similarities
+    if fusion == "linear":
+        top = lexical_scores.max()
+        return LINEAR_ALPHA * lexical_scores / (top if top > 0 else 1) + \
+            (1 - LINEAR_ALPHA) * similarities
+    if fusion == "rrf":
+        lexical_ranks = np.argsort(np.argsort(-lexical_scores, kind="stable"))
+        dense_ranks = np.argsort(np.argsort(-similarities, kind="stable"))
+        return 1 / (RRF_K + 1 + lexical_ranks) + 1 / (RRF_K + 1 + dense_ranks)
+    raise ValueError(f"unknown fusion {fusion!r}")
+
+
+def hybrid_query(query: str, k: int = 3, where: dict = None,
+                 fusion: str = "rrf"):
+    """BM25 candidates re-ranked with embeddings, in run_query's result
+    shape plus fused "scores". With a where filter BM25 only scores the
+    documents that pass it. When fewer than k candidates turn up, the
+    dense search fills the rest, with None for their scores."""
+    import numpy as np
+    import vectorstore
+    allowed = None
+    if where is not None:
+        allowed = get_collection().get(where=translate_where(where),
+                                       include=[])["ids"]
+    hits = get_lexical_index().search(query, LEXICAL_CANDIDATES, allowed)
+    if not hits:
+        return dense_query(query, k, where)
+    stored = get_collection().get(
+        ids=[id_ for id_, score in hits],
+        include=["documents", "metadatas", "embeddings"])
+    bm25 = dict(hits)
+    similarities = vectorstore.normalize(stored["embeddings"]) @ \
+        vectorstore.normalize(embed_query(query))
+    scores = fuse([bm25[id_] for id_ in stored["ids"]], similarities, fusion)
+    order = np.argsort(-scores, kind="stable")[:k]
+    results = {
+        "ids": [[stored["ids"][i] for i in order]],
+        "documents": [[stored["documents"][i] for i in order]],
+        "metadatas": [[stored["metadatas"][i] for i in order]],
+        "distances": [[float(2 - 2 * similarities[i]) for i in order]],
+        "scores": [[float(scores[i]) for i in order]],
+    }
+    if len(order) < k:
+        dense = dense_query(query, k + len(order), where)
+        for i, id_ in enumerate(dense["ids"][0]):
+            if len(results["ids"][0]) == k:
+                break
+            if id_ in bm25:
+                continue
+            for field in ("ids", "documents", "metadatas", "distances"):
+                results[field][0].append(dense[field][0][i])
+            results["scores"][0].append(None)
+    return results
+
+
+def ingest(path=corpus.DATA_PATH, chunk_size: int = 256) -> int:
+    # stream -> label -> embed -> upsert, one chunk in memory at a time
+    import keywords
+    labelled = keywords.iter_labelled(keywords.get_labels(),
+                                      query_source_data(path))
+    count = 0
+    for chunk in corpus.chunked(labelled, chunk_size):
+        load_data(chunk, start=count + 1)
+        count += len(chunk)
+    flush()
+    return count
 
 
 def main():
     if RELOAD_DB:
         #results = query_source_data_inline()
-        results = query_source_data()
-        load_data(results)
+        ingest()
     questions = [
-        "what is a good",
+        ("what is a good", None),
+        ("how do I castle", {"label": "castle"}),
     ]
-    for question in questions:
-        findings = run_query(question)
+    for question, where in questions:
+        findings = run_query(question, where=where)
         print(question)
         pprint.pprint(findings)
         print("-" * len(question), "\n")
+    pprint.pprint(cache_stats())
 
 
 if __name__ == "__main__":
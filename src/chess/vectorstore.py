@@ -0,0 +1,196 @@
+"""Brute force vector store in NumPy, a drop-in for a chroma collection.
+
+The corpus is a few hundred lines, so an exact search is one matrix
+product. Embeddings are normalized when they are stored, which makes the
+product the cosine similarity. argpartition picks the top k without
+sorting every row. With a path the matrix is saved as a .npy file and
+memory mapped on open, next to a JSON file with the ids, documents and
+metadata. Upserts only change memory, flush() or close() writes the
+files. upsert() and query() take and return the same arguments and
+shapes as chroma, including where filters, so vectordb can use either.
+"""
+import json
+import os
+
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.json"
+
+
+def matches(metadata, where):
+    """Evaluate a chroma style where filter against one metadata dict."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == "$eq":
+                    ok = value == operand
+                elif operator == "$ne":
+                    ok = value != operand
+                elif operator == "$in":
+                    ok = value in operand
+                elif operator == "$nin":
+                    ok = value not in operand
+                else:
+                    raise ValueError(f"unsupported where operator {operator}")
+                if not ok:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class NumpyCollection:
+    def __init__(self, path=None, dtype=np.float32):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        # rows beyond count() are spare capacity, so upserts append in place
+        self.buffer = None
+        self.positions = {}
+        self.dirty = False
+        if path is not None and os.path.exists(os.path.join(path,
+                                                            RECORDS_FILE)):
+            self._load()
+
+    @property
+    def vectors(self):
+        return None if self.buffer is None else self.buffer[:len(self.ids)]
+
+    def _load(self):
+        with open(os.path.join(self.path, RECORDS_FILE)) as f:
+            records = json.load(f)
+        self.ids = records["ids"]
+        self.documents = records["documents"]
+        self.metadatas = records["metadatas"]
+        self.buffer = np.load(os.path.join(self.path, VECTORS_FILE),
+                              mmap_mode="r")
+        self.dtype = self.buffer.dtype
+        self.positions = {id_: i for i, id_ in enumerate(self.ids)}
+
+    def _reserve(self, rows, width):
+        buffer = self.buffer
+        if buffer is not None and buffer.flags.writeable and \
+                len(buffer) >= rows:
+            return
+        capacity = max(rows, 64, 2 * len(buffer) if buffer is not None else 0)
+        grown = np.empty((capacity, width), dtype=self.dtype)
+        if buffer is not None:
+            grown[:len(buffer)] = buffer
+        self.buffer = grown
+
+    def flush(self):
+        """Write the store to its path if upserts changed it."""
+        if self.path is None or not self.dirty:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        vectors = self.vectors
+        # write then rename so an open memory map never sees half a file
+        for name, write in (
+                (VECTORS_FILE, lambda f: np.save(f, vectors)),
+                (RECORDS_FILE, lambda f: f.write(json.dumps({
+                    "ids": self.ids, "documents": self.documents,
+                    "metadatas": self.metadatas}).encode()))):
+            target = os.path.join(self.path, name)
+            with open(target + ".tmp", "wb") as f:
+                write(f)
+            os.replace(target + ".tmp", target)
+        self.dirty = False
+
+    def close(self):
+        self.flush()
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas")):
+        positions = range(len(self.ids)) if ids is None else \
+            [self.positions[id_] for id_ in ids if id_ in self.positions]
+        positions = [i for i in positions if matches(self.metadatas[i], where)]
+        result = {"ids": [self.ids[i] for i in positions]}
+        if "documents" in include:
+            result["documents"] = [self.documents[i] for i in positions]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[i] for i in positions]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self.vectors[positions],
+                                              dtype=np.float32) \
+                if positions else np.empty((0, 0), dtype=np.float32)
+        return result
+
+    def upsert(self, documents, ids, embeddings, metadatas=None):
+        """Add or replace documents in memory; flush() persists them."""
+        metadatas = metadatas or [{} for _ in ids]
+        vectors = normalize(embeddings).astype(self.dtype)
+        positions = []
+        for id_, document, metadata in zip(ids, documents, metadatas):
+            position = self.positions.get(id_)
+            if position is None:
+                position = self.positions[id_] = len(self.ids)
+                self.ids.append(id_)
+                self.documents.append(document)
+                self.metadatas.append(metadata)
+            else:
+                self.documents[position] = document
+                self.metadatas[position] = metadata
+            positions.append(position)
+        self._reserve(len(self.ids), vectors.shape[1])
+        self.buffer[positions] = vectors
+        self.dirty = True
+
+    def query(self, query_embeddings, n_results=10, where=None,
+              include=("documents", "metadatas", "distances")):
+        result = {"ids": []}
+        for field in include:
+            result[field] = []
+        if self.vectors is None or not len(self.ids):
+            for values in result.values():
+                values.extend([] for _ in query_embeddings)
+            return result
+        rows = None
+        if where:
+            rows = np.array([i for i, metadata in enumerate(self.metadatas)
+                             if matches(metadata, where)], dtype=np.intp)
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        # float16 is only a storage format, numpy has no fast float16 matmul
+        similarity = normalize(query_embeddings) @ \
+            np.asarray(vectors, dtype=np.float32).T
+        k = min(n_results, similarity.shape[1])
+        for scores in similarity:
+            if k == 0:
+                top = np.empty(0, dtype=np.intp)
+            else:
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top], kind="stable")]
+            found = top if rows is None else rows[top]
+            result["ids"].append([self.ids[i] for i in found])
+            if "documents" in result:
+                result["documents"].append([self.documents[i] for i in found])
+            if "metadatas" in result:
+                result["metadatas"].append([self.metadatas[i] for i in found])
+            if "distances" in result:
+                # squared L2 between unit vectors, chroma's default metric
+                result["distances"].append(
+                    [float(2 - 2 * scores[i]) for i in top])
+            if "embeddings" in result:
+                result["embeddings"].append(
+                    [np.asarray(self.vectors[i], dtype=np.float32).tolist()
+                     for i in found])
+        return result
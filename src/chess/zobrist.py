@@ -0,0 +1,55 @@
+"""64-bit Zobrist hashes of Game positions.
+
+The keys come from a fixed seed so a hash means the same position in
+every process and in every file written with it (opening books,
+tablebases, search tables). Game keeps its hash up to date move by
+move through piece_key() and state_key(); position_hash() computes it
+from scratch.
+"""
+import random
+
+_rng = random.Random(0x5EED_C4E55)
+# keyed by class name so the keys also match pieces created by a
+# chess_server that runs as __main__
+KINDS = ["Pawn", "Knight", "Bishop", "Rook", "Queen", "King"]
+PIECE_KEYS = {(kind, color): [_rng.getrandbits(64) for _ in range(64)]
+              for kind in KINDS for color in ("white", "black")}
+CASTLING_KEYS = {letter: _rng.getrandbits(64) for letter in "KQkq"}
+EN_PASSANT_KEYS = [_rng.getrandbits(64) for _ in range(8)]
+BLACK_TO_MOVE = _rng.getrandbits(64)
+
+
+def piece_key(piece, square):
+    return PIECE_KEYS[(type(piece).__name__, piece.color)][
+        square[0] * 8 + square[1]]
+
+
+def en_passant_key(game):
+    # only counted when a pawn can actually take, so transpositions that
+    # differ by a dead double step hash the same
+    if game.en_passant is None:
+        return 0
+    row, col = game.en_passant
+    pawn_row = row - 1 if game.turn == "white" else row + 1
+    for dc in (-1, 1):
+        piece = game.board.get((pawn_row, col + dc))
+        if type(piece).__name__ == "Pawn" and piece.color == game.turn:
+            return EN_PASSANT_KEYS[col]
+    return 0
+
+
+def state_key(game):
+    """The castling and en passant part of the hash."""
+    value = en_passant_key(game)
+    for letter in game.castling_rights():
+        value ^= CASTLING_KEYS[letter]
+    return value
+
+
+def position_hash(game):
+    value = state_key(game)
+    for square, piece in game.board.items():
+        value ^= piece_key(piece, square)
+    if game.turn == "black":
+        value ^= BLACK_TO_MOVE
+    return value
@@ -0,0 +1,60 @@
+import pickle
+import random
+
+import book
+import chess_server
+import pgn
+import zobrist
+
+GAMES = """[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Result "0-1"]
+
+1. d4 d5 2. c4 e6 0-1
+
+[Result "1-0"]
+
+1. e4 c5 1-0
+"""
+
+
+def make_book(tmp_path):
+    source = tmp_path / "games.pgn"
+    source.write_text(GAMES)
+    path = tmp_path / "book.bin"
+    book.build([source], path, max_plies=4)
+    return book.OpeningBook(path, rng=random.Random(1))
+
+
+def test_hash_ignores_move_order():
+    a = chess_server.Game.build_headless()
+    b = chess_server.Game.build_headless()
+    for move in [((0, 6), (2, 5)), ((7, 6), (5, 5)), ((0, 1), (2, 2))]:
+        a.make_move(*move)
+    for move in [((0, 1), (2, 2)), ((7, 6), (5, 5)), ((0, 6), (2, 5))]:
+        b.make_move(*move)
+    assert zobrist.position_hash(a) == zobrist.position_hash(b)
+    a.make_move((6, 0), (5, 0))
+    assert zobrist.position_hash(a) != zobrist.position_hash(b)
+
+
+def test_lookup_returns_weighted_book_moves(tmp_path):
+    opening_book = make_book(tmp_path)
+    game = chess_server.Game.build_headless()
+    moves = {pgn.move_to_san(game, move): weight
+             for move, _, weight in opening_book.lookup(game)}
+    # white won both e4 games and lost the d4 one
+    assert moves == {"e4": 4}
+    game.make_move((1, 4), (3, 4))
+    moves = {pgn.move_to_san(game, move): weight
+             for move, _, weight in opening_book.lookup(game)}
+    assert moves == {}  # black lost both games after 1. e4
+
+
+def test_bot_plays_from_book_and_survives_pickling(tmp_path):
+    opening_book = make_book(tmp_path)
+    game = chess_server.Game.build_headless(bot_color="white")
+    game.bot.book = pickle.loads(pickle.dumps(opening_book))
+    assert game.bot.choose_move(game) == ((1, 4), (3, 4))
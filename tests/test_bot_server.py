@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+import bot_server
+import chess_client
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_move_gets_a_bot_reply():
+    async def play():
+        server = bot_server.BotServer()
+        game = await server.new_game("white")
+        session = server.get_session(game["game_id"])
+        return await server.move(session, "e2", "e4")
+
+    reply = run(play())
+    assert reply["board"]["e4"] == "wp"
+    assert len(reply["bot_move"]) == 2
+    assert reply["turn"] == "white"
+
+
+def test_illegal_and_unknown_requests_are_errors():
+    async def play():
+        server = bot_server.BotServer()
+        game = await server.new_game("white")
+        with pytest.raises(ValueError, match="illegal"):
+            await server.dispatch({"op": "move", "game_id": game["game_id"],
+                                   "from": "e2", "to": "e5"})
+        with pytest.raises(ValueError, match="bad square"):
+            await server.dispatch({"op": "move", "game_id": game["game_id"],
+                                   "from": "e9", "to": "e5"})
+        with pytest.raises(ValueError, match="bad square"):
+            await server.dispatch({"op": "move", "game_id": game["game_id"],
+                                   "from": 12, "to": "e4"})
+        with pytest.raises(KeyError):
+            await server.dispatch({"op": "board", "game_id": "nope"})
+
+    run(play())
+
+
+def test_idle_games_are_evicted():
+    async def play():
+        server = bot_server.BotServer(idle_timeout=10)
+        game = await server.new_game("black")
+        session = server.get_session(game["game_id"])
+        return server, game, server.evict_idle(now=session.last_seen + 11)
+
+    server, game, evicted = run(play())
+    assert game["bot_move"] is not None
+    assert evicted == [game["game_id"]]
+    assert not server.sessions
+
+
+def test_client_round_trip_over_tcp():
+    async def play():
+        server = bot_server.BotServer()
+        tcp = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = tcp.sockets[0].getsockname()[1]
+        client = await chess_client.BotClient.connect(port=port)
+        game = await client.new_game()
+        reply = await client.move(game["game_id"], "g1", "f3")
+        await client.close()
+        tcp.close()
+        await tcp.wait_closed()
+        return reply
+
+    reply = run(play())
+    assert reply["board"]["f3"] == "wN"
@@ -0,0 +1,31 @@
+import cache
+
+
+def test_lru_evicts_least_recently_used():
+    c = cache.LRUCache(maxsize=2)
+    c.put("a", 1)
+    c.put("b", 2)
+    assert c.get("a") == 1
+    c.put("c", 3)
+    assert "b" not in c
+    assert c.get("a") == 1 and c.get("c") == 3
+
+
+def test_lru_counts_hits_and_misses():
+    c = cache.LRUCache(maxsize=2)
+    c.put("a", 1)
+    c.get("a")
+    c.get("missing")
+    assert c.stats()["hits"] == 1
+    assert c.stats()["misses"] == 1
+
+
+def test_ttl_entries_expire():
+    now = [0.0]
+    c = cache.TTLCache(maxsize=4, ttl=10, clock=lambda: now[0])
+    c.put("q", "result")
+    now[0] = 9.0
+    assert c.get("q") == "result"
+    now[0] = 10.0
+    assert c.get("q") is None
+    assert len(c) == 0
@@ -0,0 +1,13 @@
+import corpus
+
+
+def test_iter_lines_normalizes_and_skips_blank(tmp_path):
+    path = tmp_path / "info.txt"
+    path.write_text("the  king\tmoves \n\n   \r\nthe rook moves\n")
+    assert list(corpus.iter_lines(path)) == ["the king moves",
+                                             "the rook moves"]
+
+
+def test_chunked_yields_bounded_lists():
+    assert list(corpus.chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(corpus.chunked([], 2)) == []
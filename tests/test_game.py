@@ -0,0 +1,133 @@
+import pytest
+
+import chess_server
+import search
+import zobrist
+
+START = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+
+def perft(game, depth):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in game.legal_moves():
+        game.make_move(*move)
+        nodes += perft(game, depth - 1)
+        game.unmake_move()
+    return nodes
+
+
+@pytest.mark.parametrize("fen, depth, nodes", [
+    (START, 3, 8902),
+    (KIWIPETE, 2, 2039),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 3, 2812),
+])
+def test_perft(fen, depth, nodes):
+    game = chess_server.Game.from_fen(fen)
+    assert perft(game, depth) == nodes
+    assert game.fen() == fen
+
+
+def test_fen_round_trip_after_moves():
+    game = chess_server.Game.build_headless()
+    assert game.fen() == START
+    game.make_move((1, 4), (3, 4))
+    assert game.fen() == \
+        "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
+    game.unmake_move()
+    assert game.fen() == START
+
+
+def test_en_passant_capture_and_undo():
+    game = chess_server.Game.from_fen("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1")
+    assert ((4, 4), (5, 3)) in game.legal_moves()
+    assert game.move_piece((4, 4), (5, 3))
+    assert (4, 3) not in game.board
+    game.unmake_move()
+    assert isinstance(game.board[(4, 3)], chess_server.Pawn)
+
+
+def test_cannot_castle_through_check():
+    game = chess_server.Game.from_fen("4k3/8/8/8/8/8/5r2/R3K2R w KQ - 0 1")
+    moves = game.legal_moves()
+    assert ((0, 4), (0, 6)) not in moves
+    assert ((0, 4), (0, 2)) in moves
+    game = chess_server.Game.from_fen("4k3/8/8/8/8/8/8/Rr2K2R w KQ - 0 1")
+    assert ((0, 4), (0, 2)) not in game.legal_moves()
+    game = chess_server.Game.from_fen("1r2k3/8/8/8/8/8/8/R3K2R w KQ - 0 1")
+    assert ((0, 4), (0, 2)) in game.legal_moves()
+
+
+def test_promotion_choice():
+    game = chess_server.Game.from_fen("8/P6k/8/8/8/8/7K/8 w - - 0 1")
+    game.make_move((6, 0), (7, 0), "knight")
+    assert isinstance(game.board[(7, 0)], chess_server.Knight)
+    game.unmake_move()
+    assert isinstance(game.board[(6, 0)], chess_server.Pawn)
+
+
+def test_incremental_hash_matches_full_hash():
+    game = chess_server.Game.from_fen(
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    start = game.zobrist_hash()
+    for move in game.legal_moves():
+        game.make_move(*move)
+        assert game.zobrist_hash() == zobrist.position_hash(game)
+        for reply in game.legal_moves():
+            game.make_move(*reply)
+            assert game.zobrist_hash() == zobrist.position_hash(game)
+            game.unmake_move()
+        game.unmake_move()
+    assert game.hash_history == [start]
+    assert dict(game.repetitions) == {start: 1}
+
+
+KNIGHT_SHUFFLE = [((0, 6), (2, 5)), ((7, 6), (5, 5)),
+                  ((2, 5), (0, 6)), ((5, 5), (7, 6))]
+
+
+def test_threefold_repetition():
+    game = chess_server.Game.build_headless()
+    for move in KNIGHT_SHUFFLE * 2:
+        assert game.game_status() == "ongoing"
+        game.make_move(*move)
+    assert game.repetition_count() == 3
+    assert game.game_status() == "threefold_repetition"
+    game.unmake_move()
+    assert not game.is_threefold_repetition()
+
+
+def test_status_of_finished_games():
+    mate = chess_server.Game.from_fen("R5k1/5ppp/8/8/8/8/8/6K1 b - - 1 1")
+    assert mate.is_checkmate() and mate.game_status() == "checkmate"
+    stalemate = chess_server.Game.from_fen("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+    assert stalemate.game_status() == "stalemate"
+    fifty = chess_server.Game.from_fen("4k3/8/8/8/8/8/8/R3K3 w - - 100 80")
+    assert fifty.game_status() == "fifty_moves"
+    bare = chess_server.Game.from_fen("4k3/8/8/8/8/8/8/2B1K3 w - - 0 1")
+    assert bare.game_status() == "insufficient_material"
+
+
+def test_search_scores_repetition_as_draw():
+    game = chess_server.Game.build_headless()
+    for move in KNIGHT_SHUFFLE:
+        game.make_move(*move)
+    assert game.repetition_count() == 2
+    searcher = search.Search(game)
+    assert searcher.negamax(3, -search.INFINITY, search.INFINITY, 1) == 0
+    # the root itself is still searched
+    assert searcher.run(depth=1).move is not None
+
+
+def test_greedy_bot_only_plays_legal_moves():
+    game = chess_server.Game.from_fen("4k3/8/8/8/8/8/3P1P2/r3K2R w K - 0 1",
+                                      bot_color="white")
+    legal = game.legal_moves()
+    for _ in range(50):
+        assert game.bot.choose_move(game) in legal
+    move = game.bot.play_turn(game)
+    assert move in legal and game.turn == "black"
+    mate = chess_server.Game.from_fen("R5k1/5ppp/8/8/8/8/8/6K1 b - - 1 1")
+    assert mate.bot.play_turn(mate) is None
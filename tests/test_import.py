@@ -0,0 +1,10 @@
+import pytest
+
+import bench_import
+
+
+@pytest.mark.parametrize("module", ["chess_server", "search"])
+def test_engine_import_stays_light(module):
+    times = bench_import.import_times(module)
+    assert module in times
+    assert bench_import.heavy_imports(times) == []
@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+
+import inference
+
+
+def test_mean_pool_ignores_padding():
+    hidden = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]])
+    mask = np.array([[1, 1, 0]])
+    assert inference.mean_pool(hidden, mask).tolist() == [[2.0, 3.0]]
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        inference.load_backend("fp64")
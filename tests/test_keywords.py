@@ -0,0 +1,20 @@
+import keywords
+
+
+def test_matcher_requires_whole_words():
+    matcher = keywords.LabelMatcher(["check", "checkmate", "king"])
+    assert matcher.match("checkmate ends the game") == ["checkmate"]
+    assert matcher.match("the king is in check") == ["check", "king"]
+    assert matcher.match("a kingside attack") == []
+
+
+def test_matcher_accepts_plurals_and_phrases():
+    matcher = keywords.LabelMatcher(keywords.get_labels())
+    labels = matcher.match("pawns capture en passant and the rook moves")
+    assert labels == ["pawn", "rook", "move", "en passant"]
+
+
+def test_match_many_streams_documents():
+    matcher = keywords.LabelMatcher(["pawn", "queen"])
+    documents = iter(["a pawn", "the queen", "nothing"])
+    assert list(matcher.match_many(documents)) == [["pawn"], ["queen"], []]
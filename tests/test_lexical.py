@@ -0,0 +1,106 @@
+import pytest
+
+import keywords
+import lexical
+import vectordb
+import vectorstore
+
+DOCUMENTS = {
+    "id1": "the pawn moves forward one square",
+    "id2": "en passant captures a pawn that moved two squares",
+    "id3": "the king castles with the rook",
+    "id4": "the bishop moves diagonally",
+}
+
+
+def make_index():
+    index = lexical.BM25Index()
+    index.add(list(DOCUMENTS), list(DOCUMENTS.values()))
+    return index
+
+
+def test_tokenize_strips_plurals():
+    assert lexical.tokenize("Pawns move; the King castles.") == \
+        ["pawn", "move", "the", "king", "castle"]
+
+
+def test_search_ranks_rarer_terms_higher():
+    index = make_index()
+    hits = index.search("how does en passant work")
+    assert hits[0][0] == "id2"
+    assert [id_ for id_, score in index.search("bishop moves")][:2] == \
+        ["id4", "id1"]
+    assert index.search("queen") == []
+
+
+def test_labels_are_terms():
+    index = make_index()
+    assert "label:en passant" in index.terms[index.positions["id2"]]
+    index.add(["id5"], ["a special capture"], [["en passant"]])
+    assert {id_ for id_, score in index.search("en passant")} == \
+        {"id2", "id5"}
+
+
+def test_add_replaces_documents():
+    index = make_index()
+    index.add(["id4"], ["the queen moves anywhere"])
+    assert len(index) == 4
+    assert index.search("bishop") == []
+    assert index.search("queen")[0][0] == "id4"
+    assert index.total_length == sum(index.lengths)
+
+
+@pytest.fixture
+def numpy_db(monkeypatch):
+    def embed(text):
+        text = text.lower()
+        return [text.count("pawn"), text.count("king"),
+                text.count("move"), 0.1]
+
+    monkeypatch.setattr(vectordb, "collection",
+                        vectorstore.NumpyCollection())
+    monkeypatch.setattr(vectordb, "lexical_index", None)
+    monkeypatch.setattr(vectordb, "collection_version", 0)
+    monkeypatch.setattr(vectordb, "result_cache", vectordb.TTLCache(8, ttl=300))
+    monkeypatch.setattr(vectordb, "generate_embeddings",
+                        lambda texts: [embed(t) for t in texts])
+    monkeypatch.setattr(vectordb, "embed_query", embed)
+    vectordb.load_data(list(keywords.iter_labelled(keywords.get_labels(),
+                                                   DOCUMENTS.values())))
+
+
+@pytest.mark.parametrize("fusion", ["rrf", "linear", "rerank"])
+def test_hybrid_query(numpy_db, fusion):
+    result = vectordb.run_query("how does the pawn move", k=2, fusion=fusion)
+    assert result["documents"][0][0] == DOCUMENTS["id1"]
+    assert len(result["scores"][0]) == 2
+    assert result["scores"][0] == sorted(result["scores"][0], reverse=True)
+
+
+def test_hybrid_query_filters_and_falls_back(numpy_db):
+    result = vectordb.run_query("pawn", k=3, fusion="rrf",
+                                where={"label": "castle"})
+    assert result["documents"] == [[DOCUMENTS["id3"]]]
+    # no term in common with the corpus: plain dense search
+    result = vectordb.run_query("zugzwang", k=1, fusion="rrf")
+    assert "scores" not in result and len(result["documents"][0]) == 1
+
+
+def test_index_follows_upserts(numpy_db):
+    index = vectordb.get_lexical_index()
+    assert len(index) == 4
+    vectordb.load_data([(["queen"], "the queen moves anywhere")], start=5)
+    assert index.search("queen")[0][0] == "id5"
+
+
+def test_hybrid_query_fills_filtered_results_from_dense(numpy_db):
+    result = vectordb.run_query("pawn", k=3, fusion="rrf",
+                                where={"label": "move"})
+    assert result["documents"] == [[DOCUMENTS["id1"], DOCUMENTS["id4"]]]
+    assert result["scores"][0][1] is None
+
+
+def test_search_within_ids():
+    index = make_index()
+    assert [id_ for id_, score in index.search("pawn", ids=["id2", "id3"])] \
+        == ["id2"]
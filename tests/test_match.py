@@ -0,0 +1,43 @@
+import math
+
+import pytest
+
+import match
+
+
+def test_parse_engine():
+    spec = match.parse_engine(["depth=2", "time=0.5", "features=lmr+null_move"])
+    assert spec == {"depth": 2, "time_limit": 0.5,
+                    "features": ["lmr", "null_move"]}
+    assert match.parse_engine(["nodes=500", "features=none"])["features"] == []
+    with pytest.raises(ValueError):
+        match.parse_engine(["features=all"])
+    with pytest.raises(ValueError):
+        match.parse_engine(["depth=2", "features=magic"])
+
+
+def test_elo_and_sprt():
+    assert match.elo(0.5) == 0
+    assert math.isclose(match.elo(match.expected_score(100)), 100)
+    sprt = match.Sprt(0, 10)
+    assert sprt.status(600, 200, 200) == "H1"
+    assert sprt.status(200, 200, 600) == "H0"
+    assert sprt.status(5, 2, 4) is None
+
+
+def test_stats_percentiles():
+    stats = match.MatchStats()
+    stats.add({"a_score": 1.0, "status": "checkmate",
+               "moves": [("a", i / 100, 100) for i in range(1, 101)]})
+    assert stats.wins == 1 and stats.games == 1
+    assert stats.latency("a", 50) == 0.51
+    assert stats.latency("a", 99) == 1.0
+    assert stats.nps("a") > 0
+
+
+def test_short_match():
+    lines = []
+    stats = match.run_match({"depth": 1}, {"nodes": 50}, games=2, workers=2,
+                            max_plies=12, log=lines.append)
+    assert stats.games == 2 and len(lines) == 2
+    assert stats.latencies["a"] and stats.latencies["b"]
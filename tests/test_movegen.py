@@ -0,0 +1,45 @@
+import chess_server
+import movegen
+
+FENS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    # en passant, and a castling path crossed by a bishop
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+    "r3k2r/8/8/8/8/8/6b1/R3K2R w KQkq - 0 1",
+    "r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1",
+]
+
+
+def check(games):
+    moves, offsets = movegen.legal_moves(movegen.Batch.from_games(games))
+    assert len(offsets) == len(games) + 1
+    for i, game in enumerate(games):
+        assert sorted(movegen.unpack(moves, offsets, i)) == \
+            sorted(game.legal_moves()), game.fen()
+
+
+def test_matches_game_on_tricky_positions():
+    check([chess_server.Game.from_fen(fen) for fen in FENS])
+
+
+def test_matches_game_on_random_playouts():
+    check(movegen.random_positions(40, max_plies=80, seed=3))
+
+
+def test_replies_to_every_move_of_a_position():
+    game = chess_server.Game.from_fen(FENS[1])
+    games = []
+    for move in game.legal_moves():
+        game.make_move(*move)
+        games.append(chess_server.Game.from_fen(game.fen()))
+        game.unmake_move()
+    check(games)
+
+
+def test_empty_batch():
+    moves, offsets = movegen.legal_moves(movegen.Batch.from_games([]))
+    assert len(moves) == 0 and list(offsets) == [0]
@@ -0,0 +1,72 @@
+import pickle
+import random
+
+import chess_server
+import movegen
+import nnue
+import search
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+
+def test_incremental_matches_full_evaluation():
+    network = nnue.Network.random(hidden=32)
+    evaluator = nnue.Evaluator(network)
+    game = chess_server.Game.from_fen(KIWIPETE)
+    rng = random.Random(2)
+    for _ in range(200):
+        moves = game.legal_moves()
+        if not moves or (game.move_stack and rng.random() < 0.3):
+            game.unmake_move()
+        elif rng.random() < 0.05:
+            game.make_null_move()
+        else:
+            game.make_move(*rng.choice(moves))
+        assert evaluator(game) == network.evaluate(game)
+
+
+def test_rebuilds_after_unwinding_past_its_start():
+    network = nnue.Network.random(hidden=16)
+    evaluator = nnue.Evaluator(network)
+    game = chess_server.Game.build_headless()
+    game.make_move((1, 4), (3, 4))
+    evaluator(game)
+    game.unmake_move()
+    game.make_move((1, 3), (3, 3))
+    assert evaluator(game) == network.evaluate(game)
+
+
+def test_batch_matches_single_positions():
+    network = nnue.Network.random(hidden=32)
+    games = movegen.random_positions(20, seed=4)
+    scores = nnue.evaluate_many(network, games + [KIWIPETE])
+    assert list(scores) == [network.evaluate(game) for game in games] + \
+        [network.evaluate(chess_server.Game.from_fen(KIWIPETE))]
+
+
+def test_weights_round_trip_and_pickle_as_path(tmp_path):
+    network = nnue.Network.random(hidden=16)
+    path = tmp_path / "weights.npz"
+    network.save(path)
+    loaded = pickle.loads(pickle.dumps(nnue.Network.load(path)))
+    assert loaded.path == str(path)
+    game = chess_server.Game.from_fen(KIWIPETE)
+    assert loaded.evaluate(game) == network.evaluate(game)
+
+
+def test_training_reduces_loss():
+    games = movegen.random_positions(60, max_plies=30, seed=6)
+    scores = [search.evaluate(game) for game in games]
+    losses = []
+    nnue.train(nnue.Network.random(hidden=16), games, scores, epochs=3,
+               learning_rate=3e-3,
+               log=lambda line: losses.append(float(line.split()[-1])))
+    assert losses[-1] < losses[0]
+
+
+def test_bot_searches_with_the_network():
+    network = nnue.Network.random(hidden=16)
+    game = chess_server.Game.build_headless()
+    game.bot = chess_server.Bot("white", parallel=False, depth=2,
+                                evaluator=nnue.Evaluator(network))
+    assert game.bot.choose_move(game) in game.legal_moves()
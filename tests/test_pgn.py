@@ -0,0 +1,47 @@
+import io
+
+import chess_server
+import pgn
+
+SAMPLE = """[Event "Sample"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 {a comment
+[Not "a tag"]} Nc6 3. Bb5 (3. Bc4 Bc5) a6 $1 4. Ba4 Nf6 5. O-O Be7 1-0
+
+[Event "Promotion"]
+[FEN "8/P6k/8/8/8/8/6pK/8 w - - 0 1"]
+[SetUp "1"]
+
+1. a8=N g1=Q+ 2. Kxg1 0-1
+"""
+
+
+def test_reader_streams_games_and_skips_comments():
+    games = list(pgn.read_games(io.StringIO(SAMPLE)))
+    assert len(games) == 2
+    assert games[0].headers["Event"] == "Sample"
+    assert games[0].moves == ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6", "Ba4",
+                              "Nf6", "O-O", "Be7"]
+    assert games[0].result == "1-0"
+    game, played = games[1].replay()
+    assert played[0] == (((6, 0), (7, 0)), "knight")
+    assert game.turn == "black"
+
+
+def test_san_disambiguation():
+    game = chess_server.Game.from_fen("4k3/8/8/8/8/8/4K3/R6R w - - 0 1")
+    assert pgn.move_to_san(game, ((0, 0), (0, 3))) == "Rad1"
+    assert pgn.parse_san(game, "Rhd1") == (((0, 7), (0, 3)), None)
+    assert pgn.move_to_san(game, ((0, 0), (7, 0))) == "Ra8+"
+
+
+def test_write_then_read_round_trip():
+    games = list(pgn.read_games(io.StringIO(SAMPLE)))
+    out = io.StringIO()
+    for record in games:
+        _, played = record.replay()
+        pgn.write_game(out, record.headers, played, record.result)
+    again = list(pgn.read_games(io.StringIO(out.getvalue())))
+    assert [g.moves for g in again] == [g.moves for g in games]
+    assert [g.result for g in again] == ["1-0", "0-1"]
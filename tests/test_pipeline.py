@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+
+import pipeline
+
+
+def test_pipeline_labels_and_writes_in_order(tmp_path):
+    path = tmp_path / "info.txt"
+    path.write_text("".join(f"the pawn moves {n}\n" for n in range(10)))
+    batches = []
+
+    def write(results, embeddings, start):
+        batches.append((start, [text for _, text in results]))
+
+    stats = pipeline.run(path, workers=2, shard_size=3, batch_size=4,
+                         queue_size=1, write=write)
+    assert [start for start, _ in batches] == [1, 5, 9]
+    texts = [text for _, chunk in batches for text in chunk]
+    assert texts == [f"the pawn moves {n}" for n in range(10)]
+    assert [stage.items for stage in stats] == [10, 10, 10]
+
+
+def test_stage_errors_stop_the_pipeline(tmp_path):
+    path = tmp_path / "info.txt"
+    path.write_text("".join(f"the rook moves {n}\n" for n in range(40)))
+
+    def write(results, embeddings, start):
+        raise RuntimeError("upsert failed")
+
+    with pytest.raises(RuntimeError, match="upsert failed"):
+        pipeline.run(path, workers=2, shard_size=2, batch_size=2,
+                     queue_size=1, write=write)
+
+
+def test_label_errors_stop_the_pipeline(tmp_path):
+    before = set(threading.enumerate())
+    with pytest.raises(FileNotFoundError):
+        pipeline.run(tmp_path / "missing.txt", workers=1,
+                     write=lambda *args: None)
+    assert set(threading.enumerate()) <= before
@@ -0,0 +1,48 @@
+import chess_server
+import records
+
+
+def test_start_position_round_trips():
+    game = chess_server.Game.build_headless()
+    data = records.encode_position(game)
+    assert len(data) == 32
+    restored = records.decode_position(data)
+    assert {sq: chess_server.display_name(p) for sq, p in restored.board.items()} \
+        == {sq: chess_server.display_name(p) for sq, p in game.board.items()}
+    assert restored.turn == "white"
+    assert restored.castling_rights() == "KQkq"
+    assert records.encode_position(restored) == data
+
+
+def test_side_to_move_en_passant_and_castling_survive():
+    game = chess_server.Game.build_headless()
+    game.move_piece((1, 4), (3, 4))
+    game.board[(7, 7)].has_moved = True
+    restored = records.decode_position(records.encode_position(game))
+    assert restored.turn == "black"
+    assert restored.en_passant == (2, 4)
+    assert restored.castling_rights() == "KQq"
+
+
+def test_moves_pack_into_two_bytes():
+    moves = [((1, 4), (3, 4)), (((6, 0), (7, 0)), "knight")]
+    data = records.encode_moves(moves)
+    assert len(data) == 4
+    assert records.decode_moves(data) == [(((1, 4), (3, 4)), None),
+                                          (((6, 0), (7, 0)), "knight")]
+
+
+def test_reader_random_access(tmp_path):
+    path = tmp_path / "positions.bin"
+    game = chess_server.Game.build_headless()
+    expected = []
+    with records.PositionWriter(path) as writer:
+        for move in [((1, 4), (3, 4)), ((6, 4), (4, 4)), ((0, 6), (2, 5))]:
+            game.move_piece(*move)
+            writer.write(game)
+            expected.append(records.encode_position(game))
+    with records.PositionReader(path) as reader:
+        assert len(reader) == 3
+        assert reader.raw(1) == expected[1]
+        assert reader[-1].board[(2, 5)].__class__ is chess_server.Knight
+        assert [records.encode_position(g) for g in reader] == expected
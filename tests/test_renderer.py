@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pygame = pytest.importorskip("pygame")
+
+import chess_server  # noqa: E402
+import renderer  # noqa: E402
+
+
+@pytest.fixture
+def view():
+    game = chess_server.Game.build_headless(depth=1)
+    view = renderer.BoardRenderer(game, square_size=40)
+    assert view.render() == [view.screen.get_rect()]
+    yield view
+    pygame.quit()
+
+
+def test_nothing_to_draw_when_idle(view):
+    assert view.render() == []
+    view.sync()
+    assert view.render() == []
+
+
+def test_move_redraws_only_changed_squares(view):
+    assert view.move_piece((1, 4), (3, 4))
+    rects = view.render()
+    assert rects == [view.square_rect((1, 4)), view.square_rect((3, 4))]
+    # the pawn is now drawn on e4 and e2 shows the bare square
+    centre = view.square_rect((3, 4)).center
+    assert view.screen.get_at(centre)[:3] != renderer.LIGHT
+    empty = view.square_rect((1, 4)).topleft
+    assert view.screen.get_at(empty)[:3] == renderer.LIGHT
+
+
+def test_castling_marks_king_and_rook(view):
+    game = view.game
+    for move in [((1, 4), (3, 4)), ((6, 4), (4, 4)), ((0, 6), (2, 5)),
+                 ((7, 1), (5, 2)), ((0, 5), (3, 2)), ((7, 6), (5, 5))]:
+        game.make_move(*move)
+    view.sync()
+    view.render()
+    assert view.move_piece((0, 4), (0, 6))
+    assert view.dirty == {(0, 4), (0, 5), (0, 6), (0, 7)}
+
+
+def test_clicks_move_a_piece_and_the_bot_replies(view):
+    def click(square):
+        event = pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1,
+                                   pos=view.square_rect(square).center)
+        assert view.handle(event, "white")
+
+    click((1, 3))
+    assert view.selected == (1, 3)
+    click((3, 3))
+    assert view.game.board[(3, 3)].color == "white"
+    assert view.game.turn == "white" and len(view.game.move_stack) == 2
+    assert view.render()
+
+
+def test_flipped_board_maps_clicks_back():
+    game = chess_server.Game.build_headless()
+    view = renderer.BoardRenderer(game, square_size=40, flipped=True)
+    for square in [(0, 0), (7, 7), (3, 5)]:
+        assert view.screen_to_square(view.square_rect(square).center) == \
+            square
+    pygame.quit()
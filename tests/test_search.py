@@ -0,0 +1,139 @@
+import pickle
+
+import pytest
+
+import analysis
+import bench_search
+import bot_server
+import chess_server
+import search
+import zobrist
+
+MATE_IN_ONE = "6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1"
+HANGING_QUEEN = "4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1"
+
+
+def test_finds_mate_in_one():
+    result = search.search(chess_server.Game.from_fen(MATE_IN_ONE), depth=3)
+    assert chess_server.move_name(result.move) == "a1a8"
+    assert result.score == search.MATE - 1
+
+
+def test_takes_hanging_queen_and_restores_game():
+    game = chess_server.Game.from_fen(HANGING_QUEEN)
+    result = search.search(game, depth=2)
+    assert result.move == ((1, 3), (4, 3))
+    assert result.pv[0] == result.move
+    assert game.fen() == HANGING_QUEEN
+
+
+def test_node_limit_still_returns_a_move():
+    game = chess_server.Game.build_headless()
+    result = search.search(game, nodes=10)
+    assert result.move in game.legal_moves()
+    assert len(game.move_stack) == 0
+
+
+def test_bot_uses_search_when_given_a_depth():
+    game = chess_server.Game.from_fen(MATE_IN_ONE)
+    game.bot = chess_server.Bot("white", parallel=False, depth=2)
+    assert game.bot.choose_move(game) == ((0, 0), (7, 0))
+
+
+def test_analyse_many_streams_every_position():
+    positions = [MATE_IN_ONE, HANGING_QUEEN,
+                 chess_server.Game.from_fen(MATE_IN_ONE)]
+    with analysis.Analyser(workers=2) as analyser:
+        results = list(analyser.analyse_many(positions, depth=2,
+                                             chunksize=1))
+    by_index = {result["index"]: result for result in results}
+    assert sorted(by_index) == [0, 1, 2]
+    assert by_index[0]["move"] == by_index[2]["move"] == "a1a8"
+    assert by_index[1]["pv"][0] == "d2d5"
+
+
+def pondering_game(**options):
+    game = chess_server.Game.from_fen(HANGING_QUEEN)
+    game.bot = chess_server.Bot("white", parallel=False, ponder=True,
+                                **options)
+    assert game.bot.play_turn(game) == ((1, 3), (4, 3))
+    assert game.bot.ponderer.active
+    return game
+
+
+def test_ponder_hit_reuses_the_background_search():
+    game = pondering_game(depth=2)
+    game.make_move(*game.bot.last_search.pv[1])
+    move = game.bot.choose_move(game)
+    assert game.bot.ponderer.hits == 1
+    assert move in game.legal_moves()
+    assert game.bot.ponderer.active is False
+
+
+def test_ponder_miss_cancels_and_searches_again():
+    game = pondering_game(time_limit=0.2)
+    expected = game.bot.last_search.pv[1]
+    other = next(move for move in game.legal_moves() if move != expected)
+    game.make_move(*other)
+    move = game.bot.choose_move(game)
+    assert game.bot.ponderer.misses == 1
+    assert move in game.legal_moves()
+
+
+def test_pondering_is_capped_and_keeps_settings():
+    game = pondering_game(time_limit=0.05, nodes=400, features=["lmr"])
+    ponderer = game.bot.ponderer
+    assert ponderer.search.features == {"lmr"}
+    # the pondered copy remembers the game's positions for repetitions
+    history = game.hash_history
+    assert ponderer.search.game.hash_history[:len(history)] == history
+    ponderer.thread.join(timeout=5 * search.PONDER_TIME_FACTOR * 0.05)
+    assert not ponderer.thread.is_alive()
+    assert ponderer.result.nodes <= 400
+
+
+def test_idle_sessions_stop_pondering():
+    server = bot_server.BotServer(ponder_timeout=5)
+    game = pondering_game(time_limit=10)
+    server.sessions["1"] = bot_server.Session(game, "black", "1")
+    server.evict_idle(now=server.sessions["1"].last_seen + 6)
+    assert "1" in server.sessions and not game.bot.ponderer.active
+
+
+def test_pondering_bot_pickles_idle():
+    game = pondering_game(time_limit=0.2)
+    copy = pickle.loads(pickle.dumps(game.bot))
+    game.bot.stop_pondering()
+    assert copy.ponder and not copy.ponderer.active
+
+
+@pytest.mark.parametrize("feature", sorted(search.FEATURES))
+def test_each_feature_alone_keeps_tactics(feature):
+    for fen, move in [(MATE_IN_ONE, "a1a8"), (HANGING_QUEEN, "d2d5")]:
+        result = search.search(chess_server.Game.from_fen(fen), depth=3,
+                               features=[feature])
+        assert chess_server.move_name(result.move) == move
+
+
+def test_pruning_searches_fewer_nodes():
+    fen = bench_search.POSITIONS[1]
+    full = search.search(chess_server.Game.from_fen(fen), depth=3,
+                         features=[])
+    pruned = search.search(chess_server.Game.from_fen(fen), depth=3)
+    assert pruned.nodes < full.nodes
+
+
+def test_unknown_feature():
+    with pytest.raises(ValueError):
+        search.Search(chess_server.Game.build_headless(), features=["lmr2"])
+
+
+def test_null_move_round_trip():
+    game = chess_server.Game.from_fen(
+        "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3")
+    fen, key = game.fen(), game.zobrist_hash()
+    game.make_null_move()
+    assert game.turn == "black" and game.en_passant is None
+    assert game.zobrist_hash() == zobrist.position_hash(game)
+    game.unmake_move()
+    assert game.fen() == fen and game.zobrist_hash() == key
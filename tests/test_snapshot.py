@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import pytest
+
+import bot_server
+import chess_server
+import snapshot
+
+KNIGHT_SHUFFLE = [((0, 6), (2, 5)), ((7, 6), (5, 5)),
+                  ((2, 5), (0, 6)), ((5, 5), (7, 6))]
+
+
+def board_names(game):
+    return {square: chess_server.display_name(piece)
+            for square, piece in game.board.items()}
+
+
+def test_round_trip_keeps_position_and_settings():
+    game = chess_server.Game.build_headless(depth=3, time_limit=0.5,
+                                            features=["lmr"])
+    for move in [((1, 4), (3, 4)), ((6, 0), (4, 0)), ((3, 4), (4, 4)),
+                 ((6, 3), (4, 3))]:
+        assert game.move_piece(*move)
+    data = snapshot.snapshot(game)
+    restored = snapshot.restore(data)
+    assert restored.fen() == game.fen()
+    assert restored.en_passant == (5, 3)
+    assert board_names(restored) == board_names(game)
+    assert restored.earlier_moves == [(move, None) for move in
+                                      [((1, 4), (3, 4)), ((6, 0), (4, 0)),
+                                       ((3, 4), (4, 4)), ((6, 3), (4, 3))]]
+    bot = restored.bot
+    assert (bot.color, bot.depth, bot.time_limit, bot.features) == \
+        ("black", 3, 0.5, ["lmr"])
+    assert restored.move_piece((4, 4), (5, 3))  # en passant still works
+    # a snapshot of the restored game carries the whole move list
+    assert len(snapshot.restore(snapshot.snapshot(restored)).earlier_moves) \
+        == 5
+
+
+def test_repetitions_survive_restore():
+    game = chess_server.Game.build_headless()
+    for move in KNIGHT_SHUFFLE:
+        game.move_piece(*move)
+    restored = snapshot.restore(snapshot.snapshot(game))
+    assert restored.repetition_count() == 2
+    for move in KNIGHT_SHUFFLE:
+        restored.move_piece(*move)
+    assert restored.game_status() == "threefold_repetition"
+
+
+def test_promotion_is_recorded():
+    game = chess_server.Game.from_fen("8/P6k/8/8/8/8/8/K7 w - - 0 1")
+    game.move_piece((6, 0), (7, 0), "knight")
+    restored = snapshot.restore(snapshot.snapshot(game))
+    assert restored.earlier_moves == [(((6, 0), (7, 0)), "knight")]
+    assert isinstance(restored.board[(7, 0)], chess_server.Knight)
+
+
+def test_bad_data_is_rejected():
+    data = snapshot.snapshot(chess_server.Game.build_headless())
+    with pytest.raises(ValueError, match="not a game snapshot"):
+        snapshot.restore(b"XXXX" + data[4:])
+    with pytest.raises(ValueError, match="version"):
+        snapshot.restore(data[:4] + bytes([99]) + data[5:])
+
+
+@pytest.mark.parametrize("name", ["games", "games.db"])
+def test_stores(tmp_path, name):
+    store = snapshot.open_store(str(tmp_path / name))
+    game = chess_server.Game.build_headless(depth=2)
+    store.save("g1", game)
+    assert store.version("g1") == 0
+    game.move_piece((1, 4), (3, 4))
+    store.save("g1", game, expected=0)
+    assert store.version("g1") == 1
+    assert store.load("g1").fen() == game.fen()
+    # a writer that started from an older snapshot loses
+    with pytest.raises(snapshot.ConflictError):
+        store.save("g1", game, expected=0)
+    with pytest.raises(snapshot.ConflictError):
+        store.save("g1", game)
+    assert store.load("missing") is None and store.version("missing") is None
+    store.delete("g1")
+    assert store.load("g1") is None
+    store.close()
+
+
+def test_restore_is_fast():
+    game = chess_server.Game.build_headless(depth=3)
+    for move in KNIGHT_SHUFFLE * 10:
+        game.move_piece(*move)
+    data = snapshot.snapshot(game)
+    start = time.perf_counter()
+    for _ in range(200):
+        snapshot.restore(data)
+    assert (time.perf_counter() - start) / 200 < 0.002
+
+
+def test_servers_share_games_through_a_store(tmp_path):
+    async def play():
+        store = snapshot.SqliteStore(str(tmp_path / "games.db"))
+        first = bot_server.BotServer(store=store)
+        second = bot_server.BotServer(store=store)
+        game = await first.new_game("white")
+        game_id = game["game_id"]
+        await first.dispatch({"op": "move", "game_id": game_id,
+                              "from": "e2", "to": "e4"})
+        session = first.sessions[game_id]
+        # nothing changed elsewhere, the session is reused as it is
+        assert first.get_session(game_id) is session
+        state = await second.dispatch({"op": "board", "game_id": game_id})
+        assert state == first.state(session)
+        await second.dispatch({"op": "move", "game_id": game_id,
+                               "from": "d2", "to": "d4"})
+        assert store.load(game_id).earlier_moves[2] == (((1, 3), (3, 3)),
+                                                        None)
+        # the first server notices the newer snapshot and reloads
+        assert first.get_session(game_id) is not session
+        assert first.sessions[game_id].version == store.version(game_id) == 4
+        await second.dispatch({"op": "close", "game_id": game_id})
+        assert store.load(game_id) is None
+
+    asyncio.run(play())
+
+
+def test_stale_server_move_is_rejected(tmp_path):
+    async def play():
+        store = snapshot.FileStore(str(tmp_path / "games"))
+        first = bot_server.BotServer(store=store)
+        second = bot_server.BotServer(store=store)
+        game_id = (await first.new_game("white"))["game_id"]
+        stale = second.get_session(game_id)
+        await first.dispatch({"op": "move", "game_id": game_id,
+                              "from": "e2", "to": "e4"})
+        with pytest.raises(snapshot.ConflictError):
+            await second.move(stale, "d2", "d4")
+        assert game_id not in second.sessions
+        assert store.load(game_id).earlier_moves[0] == (((1, 4), (3, 4)),
+                                                        None)
+
+    asyncio.run(play())
+
+
+def test_pondering_survives_requests_with_a_store(tmp_path):
+    async def play():
+        store = snapshot.SqliteStore(str(tmp_path / "games.db"))
+        server = bot_server.BotServer(store=store, depth=2, ponder=True)
+        game_id = (await server.new_game("white"))["game_id"]
+        await server.dispatch({"op": "move", "game_id": game_id,
+                               "from": "e2", "to": "e4"})
+        bot = server.get_session(game_id).game.bot
+        assert bot.ponderer.active
+        expected = [chess_server.square_name(square)
+                    for square in bot.last_search.pv[1]]
+        await server.dispatch({"op": "move", "game_id": game_id,
+                               "from": expected[0], "to": expected[1]})
+        assert server.get_session(game_id).game.bot is bot
+        bot.stop_pondering()
+        return bot.ponderer.hits
+
+    assert asyncio.run(play()) == 1
@@ -0,0 +1,51 @@
+import numpy as np
+
+import chess_server
+import tablebase as tb
+
+
+def test_signatures_are_canonical():
+    assert tb.canonical("K", "KQ") == ("KQvK", True)
+    assert tb.canonical("KR", "KN") == ("KRvKN", False)
+    assert tb.dependencies("KPvK") == ["KBvK", "KNvK", "KQvK", "KRvK"]
+    assert tb.dependencies("KQvKR") == ["KQvK", "KRvK"]
+
+
+def test_mirrored_positions_share_an_index():
+    white = chess_server.Game.from_fen("8/8/8/3k4/8/8/2Q5/4K3 w - - 0 1")
+    black = chess_server.Game.from_fen("4k3/2q5/8/8/3K4/8/8/8 b - - 0 1")
+    assert tb.position_index(white.board, white.turn) == \
+        tb.position_index(black.board, black.turn)
+
+
+def test_wdl_packs_four_per_byte():
+    wdl = np.array([1, 2, 3, 0, 3], dtype=np.uint8)
+    packed = tb.pack_wdl(wdl)
+    assert len(packed) == 2
+    assert [int(packed[i >> 2]) >> (i & 3) * 2 & 3 for i in range(5)] == \
+        wdl.tolist()
+
+
+def test_solve_orders_by_distance(tmp_path):
+    # 0 is mated, 1 mates in one, 2 can only go to 1, 3 can escape to
+    # the stalemate at 4, 5 captures into a won ending three plies long
+    status = np.array([tb.MATE, 0, 0, 0, tb.STALEMATE, 0], dtype=np.int8)
+    counts = np.array([0, 1, 1, 2, 0, 0], dtype=np.int32)
+    targets = np.array([0, 1, 1, 4], dtype=np.int64)
+    ext_win = np.full(6, tb.NO_DISTANCE, dtype=np.uint16)
+    ext_win[5] = 3
+    np.savez(tmp_path / "chunk_000000000000.npz", start=0, status=status,
+             counts=counts, targets=targets, ext_win=ext_win,
+             ext_loss=np.zeros(6, dtype=np.uint16),
+             ext_hold=np.zeros(6, dtype=bool))
+    wdl, dtm = tb.solve(str(tmp_path), 6)
+    assert wdl.tolist() == [tb.LOSS, tb.WIN, tb.LOSS, tb.DRAW, tb.DRAW, tb.WIN]
+    assert dtm.tolist() == [0, 1, 2, 0, 0, 3]
+
+
+def test_bare_kings_are_drawn_without_tables(tmp_path):
+    game = chess_server.Game.from_fen("8/8/8/3k4/8/8/8/4K3 w - - 0 1")
+    assert tb.Tablebase(str(tmp_path)).probe(game) == (tb.DRAW, 0)
+    game.bot = chess_server.Bot("white", parallel=False,
+                                tablebase=tb.Tablebase(str(tmp_path)))
+    assert game.bot.choose_move(game) in game.legal_moves()
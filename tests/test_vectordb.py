@@ -0,0 +1,111 @@
+import pytest
+
+import vectordb
+
+
+class FakeCollection:
+    def __init__(self):
+        self.queries = 0
+        self.upserts = []
+        self.wheres = []
+
+    def query(self, query_embeddings, n_results, include, where=None):
+        self.queries += 1
+        self.wheres.append(where)
+        return {"documents": [[f"hit {self.queries}"] * n_results]}
+
+    def upsert(self, documents, ids, embeddings, metadatas=None):
+        self.upserts.append((documents, metadatas))
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    calls = []
+
+    def fake_embedding(text):
+        calls.append(text)
+        return [float(len(text)), 1.0]
+
+    monkeypatch.setattr(vectordb, "generate_embedding", fake_embedding)
+    monkeypatch.setattr(vectordb, "generate_embeddings",
+                        lambda texts: [fake_embedding(t) for t in texts])
+    monkeypatch.setattr(vectordb, "collection", FakeCollection())
+    monkeypatch.setattr(vectordb, "collection_version", 0)
+    monkeypatch.setattr(vectordb, "embedding_cache", vectordb.LRUCache(8))
+    monkeypatch.setattr(vectordb, "result_cache",
+                        vectordb.TTLCache(8, ttl=300))
+    return calls
+
+
+def test_embed_query_uses_cached_embedding(fake_db):
+    first = vectordb.embed_query("What is a  Pawn")
+    first.append(99.0)
+    second = vectordb.embed_query("what is a pawn")
+    assert fake_db == ["what is a pawn"]
+    assert second == [14.0, 1.0]
+
+
+def test_run_query_serves_repeats_from_cache(fake_db):
+    first = vectordb.run_query("how does the rook move")
+    first["documents"].clear()
+    second = vectordb.run_query("how does the rook move")
+    assert vectordb.collection.queries == 1
+    assert second["documents"] == [["hit 1"] * 3]
+
+
+def test_load_data_invalidates_results(fake_db):
+    vectordb.run_query("castle")
+    vectordb.load_data([(["castle"], "castling moves the king two squares")])
+    assert vectordb.collection_version == 1
+    assert len(vectordb.result_cache) == 0
+    assert vectordb.run_query("castle")["documents"] == [["hit 2"] * 3]
+
+
+def test_result_cache_can_be_switched_off(fake_db, monkeypatch):
+    monkeypatch.setattr(vectordb.result_cache, "ttl", None)
+    vectordb.run_query("check")
+    vectordb.run_query("check")
+    assert vectordb.collection.queries == 2
+    assert len(vectordb.result_cache) == 0
+
+
+def test_ingest_upserts_in_chunks(fake_db, tmp_path, monkeypatch):
+    path = tmp_path / "info.txt"
+    path.write_text("The pawn moves\nthe rook moves\nthe queen moves\n")
+    upserted = []
+    monkeypatch.setattr(vectordb, "load_data",
+                        lambda chunk, start: upserted.append((start, chunk)))
+    assert vectordb.ingest(path, chunk_size=2) == 3
+    assert upserted == [
+        (1, [[["pawn", "move"], "the pawn moves"],
+             [["rook", "move"], "the rook moves"]]),
+        (3, [[["queen", "move"], "the queen moves"]]),
+    ]
+
+
+def test_labels_are_stored_as_metadata(fake_db):
+    vectordb.load_data([(["king", "castle"], "castling moves the king")])
+    documents, metadatas = vectordb.collection.upserts[0]
+    assert documents == ["castling moves the king"]
+    assert metadatas == [{"labels": "king,castle", "label:king": True,
+                          "label:castle": True}]
+    assert vectordb.metadata_labels(metadatas[0]) == ["king", "castle"]
+
+
+def test_label_filter_is_pushed_into_query(fake_db):
+    vectordb.run_query("how do I castle", where={"label": "castle"})
+    vectordb.run_query("how do I castle")
+    assert vectordb.collection.wheres == [{"label:castle": True}, None]
+
+
+def test_translate_where_combines_labels():
+    where = {"label": {"$in": ["pawn", "rook"]}, "source": "rules"}
+    assert vectordb.translate_where(where) == {"$and": [
+        {"$or": [{"label:pawn": True}, {"label:rook": True}]},
+        {"source": "rules"},
+    ]}
+
+
+def test_translate_where_rejects_empty_label_list():
+    with pytest.raises(ValueError):
+        vectordb.translate_where({"label": {"$in": []}})
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import vectordb
+import vectorstore
+
+
+def make_store(path=None, dtype=np.float32):
+    store = vectorstore.NumpyCollection(path, dtype=dtype)
+    store.upsert(documents=["pawn", "rook", "castle"], ids=["id1", "id2", "id3"],
+                 embeddings=[[1, 0, 0], [0, 2, 0], [0, 1, 1]],
+                 metadatas=[vectordb.label_metadata(["pawn"]),
+                            vectordb.label_metadata(["rook"]),
+                            vectordb.label_metadata(["king", "castle"])])
+    return store
+
+
+def test_query_returns_nearest_first():
+    result = make_store().query([[0, 1, 0.1]], n_results=2)
+    assert result["ids"] == [["id2", "id3"]]
+    assert result["documents"] == [["rook", "castle"]]
+    assert result["distances"][0][0] == pytest.approx(
+        2 - 2 / np.sqrt(1.01), abs=1e-6)
+    assert result["distances"][0][0] < result["distances"][0][1]
+
+
+def test_where_filters_before_top_k():
+    store = make_store()
+    where = vectordb.translate_where({"label": {"$in": ["pawn", "castle"]}})
+    result = store.query([[0, 1, 0]], n_results=3, where=where)
+    assert result["ids"] == [["id3", "id1"]]
+    assert store.query([[0, 1, 0]], 3, where={"label:queen": True})["ids"] \
+        == [[]]
+
+
+def test_upsert_replaces_existing_ids():
+    store = make_store()
+    store.upsert(documents=["bishop"], ids=["id1"], embeddings=[[0, 0, 1]])
+    assert store.count() == 3
+    assert store.query([[0, 0, 1]], n_results=1)["documents"] == [["bishop"]]
+
+
+def test_persisted_store_is_memory_mapped(tmp_path):
+    make_store(str(tmp_path), dtype=np.float16).flush()
+    store = vectorstore.NumpyCollection(str(tmp_path))
+    assert isinstance(store.vectors, np.memmap)
+    assert store.vectors.dtype == np.float16
+    assert store.query([[1, 0, 0]], n_results=1)["ids"] == [["id1"]]
+
+
+def test_vectordb_api_with_numpy_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(vectordb, "VECTOR_BACKEND", "numpy")
+    monkeypatch.setattr(vectordb, "NUMPY_PATH", str(tmp_path))
+    monkeypatch.setattr(vectordb, "collection", None)
+    monkeypatch.setattr(vectordb, "collection_version", 0)
+    monkeypatch.setattr(vectordb, "result_cache", vectordb.TTLCache(8, ttl=300))
+    monkeypatch.setattr(vectordb, "generate_embeddings",
+                        lambda texts: [[t.count("king"), t.count("pawn"), 1]
+                                       for t in texts])
+    monkeypatch.setattr(vectordb, "embed_query",
+                        lambda query: [query.count("king"),
+                                       query.count("pawn"), 1])
+    vectordb.load_data([(["pawn"], "the pawn pawn moves"),
+                        (["king", "castle"], "the king castles")])
+    result = vectordb.run_query("king king", k=1)
+    assert result["documents"] == [["the king castles"]]
+    result = vectordb.run_query("king", k=2, where={"label": "pawn"})
+    assert result["documents"] == [["the pawn pawn moves"]]
+    assert isinstance(vectordb.collection, vectorstore.NumpyCollection)
+
+
+def test_upserts_are_buffered_until_flush(tmp_path):
+    store = make_store(str(tmp_path))
+    assert not (tmp_path / vectorstore.RECORDS_FILE).exists()
+    for start in range(4, 200, 4):
+        store.upsert(documents=["x"] * 4,
+                     ids=[f"id{n}" for n in range(start, start + 4)],
+                     embeddings=np.ones((4, 3)))
+    store.close()
+    reopened = vectorstore.NumpyCollection(str(tmp_path))
+    assert reopened.count() == 199
+    reopened.upsert(documents=["queen"], ids=["id200"],
+                    embeddings=[[0, 0, -1]])
+    assert reopened.query([[0, 0, -1]], n_results=1)["ids"] == [["id200"]]
+    assert reopened.query([[1, 0, 0]], n_results=1)["ids"] == [["id1"]]